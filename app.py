@@ -1,23 +1,39 @@
-import io
-import zipfile
 import os
-import re
-import pandas as pd
 from datetime import date, datetime
 from decimal import Decimal
 import streamlit as st
 
-# Load environment variables
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+# Streamlit re-runs this script on every interaction: anything that only
+# needs to happen once per process goes through st.cache_resource, and heavy
+# libraries (openpyxl, Azure SDK, factur-x, pypdf) are imported where used.
 
-from pdf_autofill import extract_fields_text, azure_extract_invoice_fields
-from facturx_engine import embed_facturx
+
+# Load environment variables (once per process)
+@st.cache_resource
+def load_env():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+
+load_env()
+
+from pdf_autofill import extract_fields_text, azure_extract_invoice_fields, AzureThrottledError, AZURE_MODEL_ID
+from ocr_cache import get_ocr_cache, pdf_digest
+from output_cache import get_output_cache, generate_bundle
+from document import PdfDocument
 from facturx_xml import build_facturx_minimum_xml
-from validator import validate_facturx_minimum
+from pipeline import safe_filename
+from report import parquet_available
+from totals import compute_totals, infer_vat_rate
+from metrics import start_metrics_server
+from rate_limiter import AZURE_MAX_CONCURRENCY
+from jobs import (
+    ACTIVE, JOB_WORKERS, submit_job, get_job, cancel_job, delete_job, bundle_path, start_workers, failed_files,
+    get_job_documents, document_path,
+)
 
 # ============================================================
 # 1. PAGE CONFIG & STYLING
@@ -32,21 +48,46 @@ st.markdown("""
 # ============================================================
 # 2. CONFIGURATION
 # ============================================================
-AZURE_ENDPOINT = None
-AZURE_KEY = None
-
-try:
-    if "DOCUMENTINTELLIGENCE_ENDPOINT" in st.secrets:
-        AZURE_ENDPOINT = st.secrets["DOCUMENTINTELLIGENCE_ENDPOINT"]
-    if "DOCUMENTINTELLIGENCE_API_KEY" in st.secrets:
-        AZURE_KEY = st.secrets["DOCUMENTINTELLIGENCE_API_KEY"]
-except Exception:
-    pass
-
-if not AZURE_ENDPOINT:
-    AZURE_ENDPOINT = os.getenv("DOCUMENTINTELLIGENCE_ENDPOINT")
-if not AZURE_KEY:
-    AZURE_KEY = os.getenv("DOCUMENTINTELLIGENCE_API_KEY")
+@st.cache_resource
+def load_azure_settings():
+    endpoint = None
+    key = None
+
+    try:
+        if "DOCUMENTINTELLIGENCE_ENDPOINT" in st.secrets:
+            endpoint = st.secrets["DOCUMENTINTELLIGENCE_ENDPOINT"]
+        if "DOCUMENTINTELLIGENCE_API_KEY" in st.secrets:
+            key = st.secrets["DOCUMENTINTELLIGENCE_API_KEY"]
+    except Exception:
+        pass
+
+    if not endpoint:
+        endpoint = os.getenv("DOCUMENTINTELLIGENCE_ENDPOINT")
+    if not key:
+        key = os.getenv("DOCUMENTINTELLIGENCE_API_KEY")
+    return endpoint, key
+
+
+AZURE_ENDPOINT, AZURE_KEY = load_azure_settings()
+
+# Threads per bulk job for Azure requests; the shared limiter (rate_limiter.py)
+# decides how many are actually in flight
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(AZURE_MAX_CONCURRENCY)))
+
+# Shared extraction cache (same PDF => no new Azure call, no credit used)
+OCR_CACHE = get_ocr_cache()
+
+# Generated single-mode bundles (same PDF + same fields => nothing redone)
+OUTPUT_CACHE = get_output_cache()
+
+# Bulk batches run in background worker processes (see jobs.py);
+# JOB_WORKERS=0 when they run as a separate service (`python -m jobs worker`)
+start_workers(JOB_WORKERS, AZURE_ENDPOINT, AZURE_KEY)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+# Stage metrics on /metrics when PIPELINE_METRICS_PORT is set (once per process),
+# this process and the job workers together
+start_metrics_server()
 
 # ============================================================
 # 3. SESSION STATE
@@ -59,8 +100,16 @@ if "ocr_data" not in st.session_state:
 if "last_pdf" not in st.session_state:
     st.session_state.last_pdf = None
 
-if "bulk_zip" not in st.session_state:
-    st.session_state.bulk_zip = None
+# Bulk jobs submitted from this session (ids in jobs.py's queue)
+if "bulk_jobs" not in st.session_state:
+    st.session_state.bulk_jobs = []
+if "settled_jobs" not in st.session_state:
+    st.session_state.settled_jobs = set()
+if "bulk_uploader_key" not in st.session_state:
+    st.session_state.bulk_uploader_key = 0
+# Cache preview of the current bulk upload: (file ids, digests, misses)
+if "bulk_preview" not in st.session_state:
+    st.session_state.bulk_preview = None
 
 # ============================================================
 # 4. LOGIN SCREEN
@@ -104,23 +153,35 @@ def render_single_mode(user):
 
     col_act1, col_act2 = st.columns(2)
     
+    # A view of the upload, shared by every step below (never copied)
+    doc = PdfDocument.from_upload(uploaded_pdf) if uploaded_pdf else None
+
     if col_act1.button("⚡ Quick Scan (Text)", key="btn_text"):
         if uploaded_pdf:
-            st.session_state.ocr_data = extract_fields_text(uploaded_pdf.getvalue())
+            st.session_state.ocr_data = extract_fields_text(doc, cache=OCR_CACHE)
             st.success("Scan complete.")
         else: st.warning("Upload first.")
 
     if col_act2.button("🧠 AI Deep Scan", key="btn_ai"):
+        cached = OCR_CACHE.get(pdf_digest(doc), AZURE_MODEL_ID) if uploaded_pdf else None
         if not uploaded_pdf: st.warning("Upload first.")
+        elif cached is not None:
+            st.session_state.ocr_data = cached
+            st.success("Analysis loaded from cache (no credit used).")
+            st.rerun()
         elif user['quota_used'] >= user['quota_limit']: st.error("Quota exceeded.")
         elif not AZURE_ENDPOINT or not AZURE_KEY: st.error("System Error: AI Keys missing.")
         else:
             with st.spinner("AI analyzing..."):
-                st.session_state.user_data['quota_used'] += 1
-                data = azure_extract_invoice_fields(uploaded_pdf.getvalue(), AZURE_ENDPOINT, AZURE_KEY)
-                st.session_state.ocr_data = data
-                st.success("Analysis complete.")
-                st.rerun()
+                try:
+                    data = azure_extract_invoice_fields(doc, AZURE_ENDPOINT, AZURE_KEY, cache=OCR_CACHE)
+                except AzureThrottledError:
+                    st.error("The AI service is busy right now (rate limited). Please try again in a minute.")
+                else:
+                    st.session_state.user_data['quota_used'] += 1
+                    st.session_state.ocr_data = data
+                    st.success("Analysis complete.")
+                    st.rerun()
 
     if st.session_state.ocr_data or uploaded_pdf:
         st.divider()
@@ -135,10 +196,7 @@ def render_single_mode(user):
         raw_ht = Decimal(str(data.get("total_ht_str", "0")).replace(",", ".") or "0")
         raw_ttc = Decimal(str(data.get("total_ttc_str", "0")).replace(",", ".") or "0")
         
-        default_rate = "20.00"
-        if raw_ht > 0 and raw_ttc > raw_ht:
-            rate_val = ((raw_ttc - raw_ht) / raw_ht * 100).quantize(Decimal("0.01"))
-            default_rate = str(rate_val)
+        default_rate = str(infer_vat_rate(raw_ht, raw_ttc))
         
         total_ht_str = f1.text_input("Net Amount (HT)", value=str(data.get("total_ht_str", "0.00")))
         vat_rate_str = f2.text_input("VAT Rate (%)", value=default_rate)
@@ -146,8 +204,7 @@ def render_single_mode(user):
         try:
             ht_val = Decimal(total_ht_str.replace(",", ".") or "0")
             rate_val = Decimal(vat_rate_str.replace(",", ".") or "0")
-            tax_val = (ht_val * rate_val / 100).quantize(Decimal("0.01"))
-            ttc_val = ht_val + tax_val
+            _, tax_val, ttc_val = compute_totals(ht_val, rate_val)
         except:
             tax_val = Decimal("0")
             ttc_val = Decimal("0")
@@ -171,29 +228,20 @@ def render_single_mode(user):
                     total_ht=ht_val,
                     vat_rate_percent=rate_val,
                 )
-                
-                validate_facturx_minimum(xml)
-                out_pdf = embed_facturx(uploaded_pdf.getvalue(), xml)
-                
-                audit_data = {
-                    "Field": ["Compliance Profile", "Invoice Number", "Date", "Seller", "Buyer", "Net Amount", "Tax Rate", "Total TTC"],
-                    "Value": ["Factur-X Minimum", invoice_number, invoice_date, seller_name, buyer_name, str(ht_val), str(rate_val)+"%", str(ttc_val)],
-                }
-                df_audit = pd.DataFrame(audit_data)
-                
-                zip_buf = io.BytesIO()
-                excel_buf = io.BytesIO()
-                with pd.ExcelWriter(excel_buf, engine='openpyxl') as writer:
-                    df_audit.to_excel(writer, index=False, sheet_name="Summary")
-                
-                safe_name = re.sub(r'[\\/*?:"<>|]', "_", invoice_number)
-                
-                with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as z:
-                    z.writestr(f"{safe_name}_facturx.pdf", out_pdf)
-                    z.writestr("audit_report.xlsx", excel_buf.getvalue())
-                    
-                st.success("✅ Certified Bundle Generated")
-                st.download_button("Download ZIP", zip_buf.getvalue(), f"{safe_name}_bundle.zip")
+
+                audit_rows = zip(
+                    ["Compliance Profile", "Invoice Number", "Date", "Seller", "Buyer", "Net Amount", "Tax Rate", "Total TTC"],
+                    ["Factur-X Minimum", invoice_number, invoice_date, seller_name, buyer_name, str(ht_val), str(rate_val)+"%", str(ttc_val)],
+                )
+                safe_name = safe_filename(invoice_number)
+
+                # Validate + embed + ZIP, unless this PDF and these fields were already generated
+                _, bundle, cached = generate_bundle(
+                    doc, xml, audit_rows, f"{safe_name}_facturx.pdf", cache=OUTPUT_CACHE,
+                )
+
+                st.success("✅ Certified Bundle Generated" + (" (unchanged, reused)" if cached else ""))
+                st.download_button("Download ZIP", bundle, f"{safe_name}_bundle.zip")
                 
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -201,101 +249,209 @@ def render_single_mode(user):
 # ============================================================
 # 6. MODE B: BULK PROCESSOR
 # ============================================================
+def job_bundle_reader(job_id):
+    # Deferred download: the bundle is only read when the button is clicked
+    return lambda: bundle_path(job_id).read_bytes()
+
+
+def job_document_reader(job_id, index):
+    return lambda: document_path(job_id, index).read_bytes()
+
+
+# Columns of the live per-document table (the full rows are in the report)
+DOCUMENT_COLUMNS = ("File", "Status", "Invoice #", "Total HT", "Reason", "Duplicate Of")
+
+
+def render_job_documents(job_id):
+    # Rows appear as the worker archives each file; converted PDFs can be taken at once
+    docs = get_job_documents(job_id)
+    if not docs:
+        return
+    st.dataframe(
+        [{col: doc["row"].get(col, "") for col in DOCUMENT_COLUMNS} for doc in docs],
+        hide_index=True,
+    )
+    ready = {doc["index"]: doc for doc in docs if doc["arcname"]}
+    if ready:
+        col1, col2 = st.columns([3, 1], vertical_alignment="bottom")
+        index = col1.selectbox(
+            "Converted file", list(ready), key=f"pick_{job_id}",
+            format_func=lambda i: f"{ready[i]['row']['File']} → {ready[i]['arcname']}",
+        )
+        col2.download_button(
+            "Download PDF",
+            job_document_reader(job_id, index),
+            ready[index]["arcname"],
+            mime="application/pdf",
+            key=f"download_doc_{job_id}",
+        )
+
+
+def submit_bulk_job(
+    user, files, tiered, candidates, report_formats=("xlsx",), duplicates="skip", fingerprint=False, resume=True,
+):
+    # Reserve the most the batch can spend; settled when the job ends
+    remaining = user['quota_limit'] - user['quota_used']
+    reserved = min(candidates, max(remaining, 0)) if AZURE_ENDPOINT and AZURE_KEY else 0
+    st.session_state.user_data['quota_used'] += reserved
+    job_id = submit_job(
+        user['email'],
+        files,
+        {
+            "seller_siret": user['siret'],
+            "seller_vat": user['vat'],
+            "tiered": tiered,
+            "credits": reserved,
+            "max_workers": OCR_MAX_WORKERS,
+            "report_formats": list(report_formats),
+            "duplicates": duplicates,
+            "fingerprint": fingerprint,
+            "resume": resume,
+        },
+        credits_reserved=reserved,
+    )
+    st.session_state.bulk_jobs.append(job_id)
+    return job_id
+
+
+def settle_job_credits(job):
+    # Credits are reserved at submit time; give back what the job did not use
+    if job["status"] in ACTIVE or job["id"] in st.session_state.settled_jobs:
+        return
+    unused = job["credits_reserved"] - (job["credits_used"] or 0)
+    st.session_state.user_data['quota_used'] -= max(unused, 0)
+    st.session_state.settled_jobs.add(job["id"])
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_bulk_jobs(user):
+    for job_id in list(st.session_state.bulk_jobs):
+        job = get_job(job_id)
+        if job is None:
+            st.session_state.bulk_jobs.remove(job_id)
+            continue
+        settle_job_credits(job)
+
+        with st.container(border=True):
+            st.write(f"**Batch of {job['total']} files** · {job['status']}")
+
+            if job["status"] in ACTIVE:
+                stage_total = job["stage_total"] or 1
+                st.progress(min(job["done"] / stage_total, 1.0), text=job["message"] or "Waiting for a worker...")
+                if st.button("Cancel", key=f"cancel_{job_id}"):
+                    cancel_job(job_id)
+                render_job_documents(job_id)
+                continue
+
+            if job["status"] == "done":
+                rows = job["result"]["rows"]
+                ok = sum(1 for r in rows if r["Status"] == "SUCCESS")
+                dupes = sum(1 for r in rows if r["Status"] == "DUPLICATE")
+                failed = len(rows) - ok - dupes
+                st.success(
+                    f"✅ Batch Processing Complete! {ok}/{len(rows)} converted."
+                    + (f" {dupes} duplicates skipped." if dupes else "")
+                )
+                st.download_button(
+                    "Download Processed Batch (ZIP)",
+                    job_bundle_reader(job_id),
+                    "batch_output.zip",
+                    mime="application/zip",
+                    type="primary",
+                    key=f"download_{job_id}",
+                )
+                render_job_documents(job_id)
+                if job["result"]["metrics"]:
+                    with st.expander("⏱️ Stage timings"):
+                        st.dataframe(job["result"]["metrics"], hide_index=True)
+                if failed and st.button("🔁 Retry only FAILED/ERROR rows", key=f"retry_{job_id}"):
+                    # Converted documents and saved AI results are reused from checkpoints
+                    retry = failed_files(job)
+                    params = job["params"]
+                    submit_bulk_job(
+                        user, retry, params["tiered"], len(retry),
+                        params.get("report_formats", ["xlsx"]), params.get("duplicates", "skip"),
+                        params.get("fingerprint", False), params.get("resume", True),
+                    )
+                    st.rerun()
+            elif job["status"] == "failed":
+                st.error(f"Batch failed: {job['error']}")
+            else:
+                st.warning("Batch cancelled.")
+                render_job_documents(job_id)
+
+            if st.button("Remove", key=f"remove_{job_id}"):
+                delete_job(job_id)
+                st.session_state.bulk_jobs.remove(job_id)
+                st.rerun()
+
+
 def render_bulk_mode(user):
     st.subheader("Batch Processor (Bulk)")
     st.info("⚠️ Files with missing data will be skipped and flagged in the report.")
-    
-    files = st.file_uploader("Upload multiple PDFs", type=["pdf"], accept_multiple_files=True)
-    
-    if st.session_state.bulk_zip:
-        st.success("✅ Batch Processing Complete!")
-        st.download_button(
-            "Download Processed Batch (ZIP)", 
-            st.session_state.bulk_zip, 
-            "batch_output.zip",
-            type="primary"
-        )
-        if st.button("Start New Batch"):
-            st.session_state.bulk_zip = None
-            st.rerun()
-    
-    if files and not st.session_state.bulk_zip:
+
+    render_bulk_jobs(user)
+
+    files = st.file_uploader(
+        "Upload multiple PDFs", type=["pdf"], accept_multiple_files=True,
+        key=f"bulk_uploader_{st.session_state.bulk_uploader_key}",
+    )
+
+    if files:
         remaining = user['quota_limit'] - user['quota_used']
         count = len(files)
-        st.write(f"Selected **{count}** files.")
-        
-        if count > remaining:
-            st.error(f"❌ You selected {count} files, but only have {remaining} credits left.")
+
+        extraction = st.radio(
+            "Extraction",
+            ["Tiered (text layer first, AI only if needed)", "AI only"],
+            horizontal=True,
+        )
+        tiered = extraction.startswith("Tiered")
+
+        # Excel for people; CSV / Parquet for other tools
+        formats = {"Excel (.xlsx)": "xlsx", "CSV": "csv"}
+        if parquet_available():
+            formats["Parquet"] = "parquet"
+        report_formats = [
+            formats[label] for label in st.multiselect("Report formats", list(formats), default=["Excel (.xlsx)"])
+        ] or ["xlsx"]
+        skip_duplicates = st.checkbox("Skip duplicates (same file or same invoice number)", value=True)
+        # Costs a PDF parse per file; matches are converted, only linked in the report
+        fingerprint = st.checkbox("Also flag files with the same first-page text", value=False)
+        # Off: every file is converted again (and sent to AI again when it needs it)
+        resume = st.checkbox("Reuse documents converted in earlier runs", value=True)
+
+        # Cache lookup first: hits cost neither an Azure call nor a credit; copies of a file are analyzed once.
+        # Once per upload, not on every rerun (each widget click).
+        file_ids = tuple(f.file_id for f in files)
+        preview = st.session_state.bulk_preview
+        if preview is None or preview[0] != file_ids:
+            digests = {pdf_digest(f.getbuffer()) for f in files}
+            misses = [d for d in digests if OCR_CACHE.get(d, AZURE_MODEL_ID) is None]
+            preview = st.session_state.bulk_preview = (file_ids, digests, misses)
+        _, digests, misses = preview
+        copies = count - len(digests)
+        st.write(
+            f"Selected **{count}** files ({len(digests) - len(misses)} already analyzed"
+            + (f", {copies} identical copies" if copies else "") + ")."
+        )
+
+        if tiered:
+            st.caption("AI credits are only used for files whose text layer is incomplete.")
+        elif len(misses) > remaining:
+            st.error(f"❌ You selected {len(misses)} new files, but only have {remaining} credits left.")
             return
 
         if st.button("🚀 Process All Files", type="primary"):
-            if not AZURE_ENDPOINT or not AZURE_KEY:
+            if not tiered and (not AZURE_ENDPOINT or not AZURE_KEY):
                 st.error("AI Keys missing.")
                 return
 
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            master_zip = io.BytesIO()
-            report_rows = []
-            
-            with zipfile.ZipFile(master_zip, "w", zipfile.ZIP_DEFLATED) as z:
-                
-                for i, pdf_file in enumerate(files):
-                    status_text.write(f"Processing {pdf_file.name}...")
-                    st.session_state.user_data['quota_used'] += 1
-                    
-                    try:
-                        data = azure_extract_invoice_fields(pdf_file.getvalue(), AZURE_ENDPOINT, AZURE_KEY)
-                        
-                        if not data.get("invoice_number") or not data.get("total_ht_str"):
-                            report_rows.append({
-                                "File": pdf_file.name, 
-                                "Status": "FAILED", 
-                                "Compliance Profile": "N/A",
-                                "Reason": "Missing Invoice# or Total"
-                            })
-                            continue 
-                        
-                        ht_val = Decimal(data["total_ht_str"].replace(",", "."))
-                        rate_val = Decimal("20.00") 
-                        
-                        xml = build_facturx_minimum_xml(
-                            invoice_number=data["invoice_number"],
-                            invoice_date=data.get("invoice_date") or date.today(),
-                            seller_name=data.get("seller_name", "Unknown"),
-                            seller_siret=user['siret'],
-                            seller_vat=user['vat'],
-                            buyer_name=data.get("buyer_name", "Unknown"),
-                            total_ht=ht_val,
-                            vat_rate_percent=rate_val,
-                        )
-                        
-                        out_pdf = embed_facturx(pdf_file.getvalue(), xml)
-                        
-                        safe_inv_num = re.sub(r'[\\/*?:"<>|]', "_", data["invoice_number"])
-                        z.writestr(f"{safe_inv_num}_facturx.pdf", out_pdf)
-                        
-                        report_rows.append({
-                            "File": pdf_file.name, 
-                            "Status": "SUCCESS",
-                            "Compliance Profile": "Factur-X Minimum",
-                            "Invoice #": data["invoice_number"], 
-                            "Total HT": str(ht_val)
-                        })
-                        
-                    except Exception as e:
-                        report_rows.append({"File": pdf_file.name, "Status": "ERROR", "Reason": str(e)})
-                    
-                    progress_bar.progress((i + 1) / count)
-                
-                df_report = pd.DataFrame(report_rows)
-                excel_buf = io.BytesIO()
-                with pd.ExcelWriter(excel_buf, engine='openpyxl') as writer:
-                    df_report.to_excel(writer, index=False)
-                z.writestr("Master_Processing_Report.xlsx", excel_buf.getvalue())
-
-            st.session_state.bulk_zip = master_zip.getvalue()
+            submit_bulk_job(
+                user, [(f.name, f.getbuffer()) for f in files], tiered, len(misses), report_formats,
+                "skip" if skip_duplicates else "keep", fingerprint, resume,
+            )
+            st.session_state.bulk_uploader_key += 1
             st.rerun()
 
 # ============================================================
@@ -319,7 +475,6 @@ def main_dashboard():
     mode = st.radio("Select Mode:", ["Single Invoice Studio", "Batch Processor (Bulk)"], horizontal=True)
     
     if mode == "Single Invoice Studio":
-        st.session_state.bulk_zip = None
         render_single_mode(user)
     else:
         render_bulk_mode(user)
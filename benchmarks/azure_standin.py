@@ -0,0 +1,359 @@
+"""
+Local stand-in for the Azure Document Intelligence `prebuilt-invoice` analyze
+API, for offline load, latency and retry testing.
+
+    python benchmarks/azure_standin.py --port 8765 --latency-ms 800 --latency-dist lognormal \
+        --throttle-tps 15 --fail-rate 0.02 [--page-ms 150] [--upload-kbps 4000]
+
+    export DOCUMENTINTELLIGENCE_ENDPOINT=http://127.0.0.1:8765
+    export DOCUMENTINTELLIGENCE_API_KEY=standin
+
+It implements the long-running-operation protocol the SDK expects
+(POST ...:analyze -> 202 + Operation-Location, then GET polling) and answers
+with InvoiceId / VendorName / CustomerName / InvoiceDate / SubTotal /
+InvoiceTotal read from the PDF text layer (or derived from the content hash
+for image-only PDFs). The `pages` query parameter ("1-2,14") limits the
+analysis to those pages, as the service does; --page-ms adds analysis time
+per analyzed page and --upload-kbps simulates the client's upload link.
+GET /stats returns request counters as JSON.
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from pypdf import PdfReader
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_ANALYZE = re.compile(r"/documentModels/(?P<model>[^/:]+):analyze$")
+_RESULT = re.compile(r"/documentModels/(?P<model>[^/]+)/analyzeResults/(?P<op>[^/]+)$")
+
+_PATTERNS = {
+    "InvoiceId": re.compile(r"Invoice\s*(?:No|Number|ID)\s*[:\-]?\s*([A-Z0-9\-\/]+)", re.I),
+    "InvoiceDate": re.compile(r"Invoice\s*Date\s*[:\-]?\s*(\d{4}-\d{2}-\d{2})", re.I),
+    "CustomerName": re.compile(r"(?:Customer|Buyer)\s*[:\-]?\s*(.+)", re.I),
+    "SubTotal": re.compile(r"(?:Subtotal|Total\s*HT)\s*[:\-]?\s*([0-9]+[.,][0-9]{2})", re.I),
+    "InvoiceTotal": re.compile(r"Total\s*TTC\s*[:\-]?\s*([0-9]+[.,][0-9]{2})", re.I),
+}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _page_numbers(spec, count):
+    if not spec:
+        return list(range(count))
+    wanted = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-")
+            wanted.update(range(int(lo), int(hi) + 1))
+        elif part:
+            wanted.add(int(part))
+    return [p - 1 for p in sorted(wanted) if 1 <= p <= count]
+
+
+def _analyzed_pages(pdf_bytes, pages_spec=None) -> int:
+    try:
+        return len(_page_numbers(pages_spec, len(PdfReader(io.BytesIO(pdf_bytes)).pages)))
+    except Exception:
+        return 1
+
+
+def _fake_invoice(pdf_bytes, pages_spec=None):
+    """Builds an analyzeResult dict from the PDF text layer."""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        selected = _page_numbers(pages_spec, len(reader.pages))
+        text = "\n".join(reader.pages[i].extract_text() or "" for i in selected)
+        first_line = (reader.pages[0].extract_text() or "").strip().split("\n")[0]
+    except Exception:
+        selected, text, first_line = [0], "", ""
+
+    found = {name: m.group(1).strip() for name, p in _PATTERNS.items() if (m := p.search(text))}
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    if not text.strip():
+        # Image-only PDF: stable, plausible values derived from the content
+        found = {
+            "InvoiceId": f"SCAN-{digest[:8].upper()}",
+            "InvoiceDate": "2025-01-15",
+            "CustomerName": "Client Scanné SARL",
+            "SubTotal": f"{int(digest[8:14], 16) % 100000 / 100:.2f}",
+        }
+        found["InvoiceTotal"] = f"{float(found['SubTotal']) * 1.2:.2f}"
+
+    def string(value):
+        return {"type": "string", "valueString": value, "content": value, "confidence": 0.95}
+
+    def currency(value):
+        amount = float(value.replace(",", "."))
+        return {
+            "type": "currency",
+            "valueCurrency": {"amount": amount, "currencySymbol": "€", "currencyCode": "EUR"},
+            "content": value,
+            "confidence": 0.93,
+        }
+
+    fields = {"VendorName": string(first_line or "Stand-in Vendor SAS")}
+    for name, value in found.items():
+        if name in ("SubTotal", "InvoiceTotal"):
+            fields[name] = currency(value)
+        elif name == "InvoiceDate":
+            fields[name] = {"type": "date", "valueDate": value, "content": value, "confidence": 0.95}
+        else:
+            fields[name] = string(value)
+
+    return {
+        "apiVersion": "2023-07-31",
+        "modelId": "prebuilt-invoice",
+        "stringIndexType": "textElements",
+        "content": text,
+        "pages": [
+            {"pageNumber": i + 1, "angle": 0, "width": 8.27, "height": 11.69, "unit": "inch",
+             "words": [], "lines": [], "spans": []}
+            for i in selected
+        ],
+        "documents": [
+            {"docType": "invoice", "boundingRegions": [], "fields": fields, "confidence": 1.0, "spans": []}
+        ],
+    }
+
+
+class StandinState:
+    def __init__(self, latency_ms=500.0, latency_dist="fixed", processing_ms=None,
+                 throttle_tps=0.0, throttle_rate=0.0, fail_rate=0.0, error_rate=0.0,
+                 retry_after=1, seed=None, page_ms=0.0, upload_kbps=0.0):
+        self.latency_ms = latency_ms
+        self.page_ms = page_ms
+        self.upload_kbps = upload_kbps
+        self.latency_dist = latency_dist
+        self.processing_ms = processing_ms
+        self.throttle_tps = throttle_tps
+        self.throttle_rate = throttle_rate
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.stats = {"analyze": 0, "accepted": 0, "throttled": 0, "errors": 0,
+                      "failed_ops": 0, "polls": 0, "bytes_in": 0, "pages_in": 0,
+                      "in_flight": 0, "max_in_flight": 0}
+        self._tokens = throttle_tps
+        self._last_refill = time.monotonic()
+
+    def sample_latency(self):
+        with self.lock:
+            mean = self.latency_ms / 1000
+            if self.latency_dist == "uniform":
+                return self.rnd.uniform(0, 2 * mean)
+            if self.latency_dist == "exponential":
+                return self.rnd.expovariate(1 / mean) if mean else 0
+            if self.latency_dist == "lognormal":
+                # sigma 0.5: long right tail, median ~ mean * 0.88
+                return self.rnd.lognormvariate(0, 0.5) * mean * 0.88
+            return mean
+
+    def take_token(self):
+        """Token bucket: False means this request should get a 429."""
+        with self.lock:
+            if self.throttle_rate and self.rnd.random() < self.throttle_rate:
+                return False
+            if not self.throttle_tps:
+                return True
+            now = time.monotonic()
+            self._tokens = min(self.throttle_tps, self._tokens + (now - self._last_refill) * self.throttle_tps)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rnd.random() < rate
+
+    def bump(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "AzureStandin/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("apim-request-id", str(uuid.uuid4()))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, code, message, headers=None):
+        self._send(status, {"error": {"code": code, "message": message}}, headers)
+
+    def do_POST(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        m = _ANALYZE.search(url.path)
+        if not m:
+            return self._error(404, "NotFound", f"No route for {url.path}")
+
+        state.bump("analyze")
+        state.bump("bytes_in", len(body))
+        if state.upload_kbps:
+            time.sleep(len(body) / 1024 / state.upload_kbps)
+        if not state.take_token():
+            state.bump("throttled")
+            return self._error(
+                429, "429", "Requests to the Analyze Document API have exceeded the rate limit.",
+                {"Retry-After": str(state.retry_after)},
+            )
+        if state.roll(state.error_rate):
+            state.bump("errors")
+            return self._error(500, "InternalServerError", "Injected failure.")
+
+        query = parse_qs(url.query)
+        pages = (query.get("pages") or [None])[0]
+        op_id = str(uuid.uuid4())
+        latency = state.sample_latency()
+        if state.processing_ms is not None:
+            latency = state.processing_ms / 1000
+        if state.page_ms:
+            analyzed = _analyzed_pages(body, pages)
+            state.bump("pages_in", analyzed)
+            latency += analyzed * state.page_ms / 1000
+        with state.lock:
+            state.operations[op_id] = {
+                "ready_at": time.monotonic() + latency,
+                "created": _now(),
+                "pdf": body,
+                "pages": pages,
+                "fail": state.rnd.random() < state.fail_rate,
+                "result": None,
+            }
+        state.bump("accepted")
+        state.bump("in_flight")
+        host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_port}"
+        api_version = (query.get("api-version") or ["2023-07-31"])[0]
+        location = (
+            f"http://{host}{url.path.replace(':analyze', '')}/analyzeResults/{op_id}"
+            f"?api-version={api_version}"
+        )
+        self._send(202, None, {"Operation-Location": location, "Retry-After": "1"})
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with state.lock:
+                return self._send(200, dict(state.stats))
+
+        m = _RESULT.search(url.path)
+        if not m:
+            return self._error(404, "NotFound", f"No route for {url.path}")
+        state.bump("polls")
+        with state.lock:
+            op = state.operations.get(m.group("op"))
+        if op is None:
+            return self._error(404, "NotFound", "Unknown operation.")
+
+        remaining = op["ready_at"] - time.monotonic()
+        if remaining > 0:
+            # Ask the SDK to come back when the result will be ready
+            retry = max(1, int(remaining + 0.999)) if remaining > 1 else 1
+            return self._send(
+                200, {"status": "running", "createdDateTime": op["created"], "lastUpdatedDateTime": _now()},
+                {"Retry-After": str(retry)},
+            )
+
+        with state.lock:
+            state.operations.pop(m.group("op"), None)
+        state.bump("in_flight", -1)
+        if op["fail"]:
+            state.bump("failed_ops")
+            return self._send(200, {
+                "status": "failed", "createdDateTime": op["created"], "lastUpdatedDateTime": _now(),
+                "error": {"code": "InvalidContent", "message": "Injected analysis failure."},
+            })
+        return self._send(200, {
+            "status": "succeeded",
+            "createdDateTime": op["created"],
+            "lastUpdatedDateTime": _now(),
+            "analyzeResult": _fake_invoice(op["pdf"], op["pages"]),
+        })
+
+
+def start_standin(host="127.0.0.1", port=0, verbose=False, **options):
+    """
+    Starts the stand-in on a background thread.
+    Returns (server, endpoint); call server.shutdown() to stop it.
+    `options` are StandinState arguments (latency_ms, throttle_tps, ...).
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.state = StandinState(**options)
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, name="azure-standin", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Mean analysis time per document")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed")
+    parser.add_argument("--throttle-tps", type=float, default=0.0, help="Token bucket rate; excess POSTs get 429")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Extra random 429 probability")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability an operation ends as 'failed'")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability a POST returns 500")
+    parser.add_argument("--page-ms", type=float, default=0.0, help="Extra analysis time per analyzed page")
+    parser.add_argument("--upload-kbps", type=float, default=0.0, help="Simulated upload bandwidth (KB/s)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server, endpoint = start_standin(
+        args.host, args.port, verbose=args.verbose,
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist,
+        throttle_tps=args.throttle_tps, throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after, fail_rate=args.fail_rate,
+        error_rate=args.error_rate, seed=args.seed, page_ms=args.page_ms, upload_kbps=args.upload_kbps,
+    )
+    print(f"Azure stand-in listening on {endpoint}  (stats: {endpoint}/stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Bulk batch latency against the local Azure stand-in: time until the first
+document is usable, and wall time for the whole batch.
+
+    python benchmarks/bench_bulk.py --docs 60 --pages 1 6 --image-kb 0 400 \
+        --latency-ms 800 [--workers 4] [--tiered] [--depth 8 16] [--json bulk.json]
+
+Runs bulk.run_bulk as the job workers do (file-backed inputs, ZIP to disk).
+"AI only" by default, so every file costs an Azure round trip (network)
+plus XML/validate/embed (CPU). first_s is the time of the first
+on_document call; a run_bulk without that hook only has results at the end.
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bulk
+from azure_standin import start_standin
+from document import PdfDocument
+from synthetic import generate_corpus
+
+SELLER = {"seller_siret": "80258593400018", "seller_vat": "FR34802585934"}
+
+
+def run(files, out_path, endpoint, args):
+    t0 = time.perf_counter()
+    first = []
+    kwargs = {}
+    if "on_document" in inspect.signature(bulk.run_bulk).parameters:
+        kwargs["on_document"] = lambda *a: first or first.append(time.perf_counter() - t0)
+    with open(out_path, "wb") as out:
+        result = bulk.run_bulk(
+            files, out=out, tiered=args.tiered, endpoint=endpoint, key="standin", credits=len(files),
+            max_workers=args.workers, **SELLER, **kwargs,
+        )
+    total = time.perf_counter() - t0
+    ok = sum(1 for r in result["rows"] if r["Status"] == "SUCCESS")
+    return {"first_s": first[0] if first else total, "total_s": total, "success": ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=60)
+    parser.add_argument("--pages", type=int, nargs=2, default=[1, 6], metavar=("MIN", "MAX"))
+    parser.add_argument("--image-kb", type=int, nargs=2, default=[0, 400], metavar=("MIN", "MAX"))
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--workers", type=int, default=4, help="Azure requests in flight")
+    parser.add_argument("--tiered", action="store_true", help="Text layer first (Azure only for what is missing)")
+    parser.add_argument("--depth", type=int, nargs="+", help="PIPELINE_DEPTH values to compare")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    server, endpoint = start_standin(latency_ms=args.latency_ms)
+    corpus = generate_corpus(args.docs, seed=args.seed, pages=tuple(args.pages), image_kb=tuple(args.image_kb))
+    results = {"docs": args.docs, "latency_ms": args.latency_ms, "workers": args.workers, "runs": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for d in corpus:
+            path = os.path.join(tmp, d["name"])
+            Path(path).write_bytes(d["pdf"])
+            files.append((d["name"], PdfDocument.from_path(path)))
+        del corpus
+
+        print(f"{args.docs} docs, Azure latency {args.latency_ms:.0f} ms, {args.workers} in flight")
+        print(f"{'run':12s} {'first s':>8s} {'total s':>8s} {'docs/s':>7s}")
+        for depth in args.depth or [getattr(bulk, "PIPELINE_DEPTH", None)]:
+            if depth is not None:
+                bulk.PIPELINE_DEPTH = depth
+            name = f"depth_{depth}" if depth is not None else "sequential"
+            r = run(files, os.path.join(tmp, "out.zip"), endpoint, args)
+            results["runs"][name] = r
+            print(f"{name:12s} {r['first_s']:8.2f} {r['total_s']:8.2f} {args.docs / r['total_s']:7.1f}")
+
+    server.shutdown()
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
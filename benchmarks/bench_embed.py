@@ -0,0 +1,75 @@
+"""
+Compare the in-memory embed_facturx against the legacy temp-file path.
+
+    python benchmarks/bench_embed.py [--runs 50] [--pages 1]
+"""
+import argparse
+import io
+import statistics
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from pypdf import PdfWriter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facturx_engine import embed_facturx, embed_facturx_tempfile
+from facturx_xml import build_facturx_minimum_xml
+
+
+def _blank_pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def _time(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1)
+    args = parser.parse_args()
+
+    pdf = _blank_pdf(args.pages)
+    xml = build_facturx_minimum_xml(
+        invoice_number="BENCH-1",
+        invoice_date=date(2025, 1, 1),
+        seller_name="Seller",
+        seller_siret="80258593400018",
+        seller_vat="FR34802585934",
+        buyer_name="Buyer",
+        total_ht=Decimal("100.00"),
+        vat_rate_percent=Decimal("20.00"),
+    )
+
+    # Warm-up (schema compilation, imports)
+    embed_facturx(pdf, xml)
+    embed_facturx_tempfile(pdf, xml)
+
+    for name, fn in (
+        ("tempfile", lambda: embed_facturx_tempfile(pdf, xml)),
+        ("in-memory", lambda: embed_facturx(pdf, xml)),
+    ):
+        s = _time(fn, args.runs)
+        print(
+            f"{name:10s} median {statistics.median(s) * 1000:8.2f} ms   "
+            f"min {min(s) * 1000:8.2f} ms   ({args.runs} runs, {args.pages} page(s))"
+        )
+
+
+if __name__ == "__main__":
+    main()
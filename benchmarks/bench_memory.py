@@ -0,0 +1,126 @@
+"""
+Peak memory per document for large (scanned) invoices, app and worker paths.
+
+    python benchmarks/bench_memory.py --mb 50 [--pages 4] [--azure] [--json mem.json]
+
+Each mode runs in a fresh interpreter: digest -> text layer -> (Azure
+stand-in) -> XML -> embed, on one PDF of about --mb MB.
+  app-bytes        upload held as BytesIO, every stage gets upload.getvalue()
+  app-document     PdfDocument.from_upload(upload), shared by every stage
+  worker-bytes     input file read with read_bytes()
+  worker-document  PdfDocument.from_path (read from disk by each stage)
+Reported: peak RSS growth over the pre-upload baseline (Linux VmHWM), as a
+multiple of input + output size.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic import make_invoice_pdf
+
+MODES = ["app-bytes", "app-document", "worker-bytes", "worker-document"]
+
+_PROBE = r"""
+import io, json, os, resource, sys
+sys.path.insert(0, {root!r}); sys.path.insert(0, {bench!r})
+from document import PdfDocument
+from ocr_cache import pdf_digest
+from pdf_autofill import extract_fields_text, azure_extract_invoice_fields
+from pipeline import convert_document
+from synthetic import make_invoice_pdf
+from datetime import date
+from decimal import Decimal
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+def peak_mb():
+    # VmHWM, not ru_maxrss: the latter carries over the parent's peak from fork
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith("VmHWM")) / 1024
+
+def reset_peak():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+# Warm-up: imports, schema, pypdf code paths
+small = make_invoice_pdf("W-1", date(2025, 1, 1), "Warm", Decimal("1.00"))
+convert_document("w.pdf", small, extract_fields_text(small), "80258593400018", "FR34802585934")
+
+mode, path, endpoint = {mode!r}, {path!r}, {endpoint!r}
+reset_peak()
+baseline = rss_mb()
+if mode.startswith("app"):
+    upload = io.BytesIO(open(path, "rb").read())  # what Streamlit holds
+    get = (lambda: upload.getvalue()) if mode == "app-bytes" else (lambda d=PdfDocument.from_upload(upload): d)
+else:
+    get = (lambda b=open(path, "rb").read(): b) if mode == "worker-bytes" else (lambda d=PdfDocument.from_path(path): d)
+
+pdf_digest(get())
+data = extract_fields_text(get())
+if endpoint:
+    data = azure_extract_invoice_fields(get(), endpoint, "key") or data
+row, arcname, out_pdf = convert_document("big.pdf", get(), data, "80258593400018", "FR34802585934")
+print("@@" + json.dumps({{"status": row["Status"], "out_mb": len(out_pdf) / 2**20,
+                          "growth_mb": max(peak_mb(), rss_mb()) - baseline}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=50, help="Approximate input size")
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--azure", action="store_true", help="Include an upload to the local Azure stand-in")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    pdf = make_invoice_pdf(
+        "INV-BIG-1", date(2025, 1, 1), "Dupont SARL", Decimal("1234.50"),
+        pages=args.pages, image_kb=int(args.mb * 1024 / args.pages),
+    )
+    in_mb = len(pdf) / 2**20
+
+    server, endpoint = None, ""
+    if args.azure:
+        from azure_standin import start_standin
+        server, endpoint = start_standin(latency_ms=10)
+
+    results = {"input_mb": in_mb, "modes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.pdf")
+        Path(path).write_bytes(pdf)
+        del pdf
+        print(f"input {in_mb:.1f} MB, {args.pages} pages")
+        print(f"{'mode':16s} {'out MB':>7s} {'peak +MB':>9s} {'x (in+out)':>11s}")
+        for mode in args.modes:
+            code = _PROBE.format(
+                root=str(ROOT), bench=str(Path(__file__).resolve().parent), mode=mode, path=path, endpoint=endpoint,
+            )
+            proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=tmp)
+            line = next((l for l in proc.stdout.splitlines() if l.startswith("@@")), None)
+            if line is None:
+                raise RuntimeError(proc.stderr[-2000:])
+            r = json.loads(line[2:])
+            r["ratio"] = r["growth_mb"] / (in_mb + r["out_mb"])
+            results["modes"][mode] = r
+            print(f"{mode:16s} {r['out_mb']:7.1f} {r['growth_mb']:9.1f} {r['ratio']:11.2f}")
+
+    if server is not None:
+        server.shutdown()
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Per-stage and end-to-end benchmark of the conversion pipeline, fully offline.
+
+    python benchmarks/bench_pipeline.py --docs 100 --pages 1 8 --image-kb 0 300 \
+        --json bench.json [--compare baseline.json]
+
+Stages: text_extract, xml_build, validate, embed, zip_report (ZIP + Excel
+report as in render_bulk_mode) and end_to_end (all of the above per doc).
+Results are written as JSON so two versions can be compared.
+"""
+import argparse
+import io
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from facturx_engine import embed_facturx
+from facturx_xml import build_facturx_minimum_xml
+from pdf_autofill import extract_fields_text
+from pipeline import convert_document
+from report import SpooledReports
+from synthetic import generate_corpus
+from validator import validate_facturx_minimum
+
+SELLER = {"seller_siret": "80258593400018", "seller_vat": "FR34802585934"}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _summary(samples, docs_per_sample=1, rss_before=0.0):
+    ordered = sorted(samples)
+    total = sum(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": ordered[-1] * 1000,
+        "docs_per_sec": (len(samples) * docs_per_sample) / total if total else float("inf"),
+        "rss_growth_mb": _rss_mb() - rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _measure(fn, items):
+    samples, results = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - t0)
+    return samples, results
+
+
+def _xml_kwargs(doc):
+    return dict(
+        invoice_number=doc["invoice_number"],
+        invoice_date=doc["invoice_date"],
+        seller_name="ACME Fournitures SAS",
+        buyer_name=doc["buyer_name"],
+        total_ht=doc["total_ht"],
+        vat_rate_percent="20.00",
+        **SELLER,
+    )
+
+
+def _zip_report(outputs):
+    buf = io.BytesIO()
+    with SpooledReports(["xlsx"]) as reports, zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, pdf in outputs:
+            z.writestr(name, pdf)
+            reports.append({"File": name, "Status": "SUCCESS", "Compliance Profile": "Factur-X Minimum"})
+        reports.write_zip(z, "Master_Processing_Report")
+    return buf.getbuffer().nbytes
+
+
+def run(args):
+    corpus = generate_corpus(
+        args.docs, seed=args.seed, pages=tuple(args.pages), image_kb=tuple(args.image_kb)
+    )
+    input_mb = sum(len(d["pdf"]) for d in corpus) / 2**20
+
+    # Warm-up: imports, schema compilation, XML skeleton
+    warm = corpus[0]
+    warm_xml = build_facturx_minimum_xml(**_xml_kwargs(warm))
+    validate_facturx_minimum(warm_xml)
+    embed_facturx(warm["pdf"], warm_xml, check_xsd=False)
+    extract_fields_text(warm["pdf"])
+
+    stages = {}
+
+    rss = _rss_mb()
+    samples, _ = _measure(lambda d: extract_fields_text(d["pdf"]), corpus)
+    stages["text_extract"] = _summary(samples, rss_before=rss)
+
+    rss = _rss_mb()
+    samples, xmls = _measure(lambda d: build_facturx_minimum_xml(**_xml_kwargs(d)), corpus)
+    stages["xml_build"] = _summary(samples, rss_before=rss)
+
+    rss = _rss_mb()
+    samples, _ = _measure(validate_facturx_minimum, xmls)
+    stages["validate"] = _summary(samples, rss_before=rss)
+
+    rss = _rss_mb()
+    samples, outputs = _measure(
+        lambda pair: embed_facturx(pair[0]["pdf"], pair[1], check_xsd=False), list(zip(corpus, xmls))
+    )
+    stages["embed"] = _summary(samples, rss_before=rss)
+
+    rss = _rss_mb()
+    named = [(d["name"], pdf) for d, pdf in zip(corpus, outputs)]
+    samples = []
+    for _ in range(args.report_runs):
+        t0 = time.perf_counter()
+        _zip_report(named)
+        samples.append(time.perf_counter() - t0)
+    stages["zip_report"] = _summary(samples, docs_per_sample=len(named), rss_before=rss)
+    del outputs, named
+
+    rss = _rss_mb()
+
+    def end_to_end(doc):
+        data = extract_fields_text(doc["pdf"])
+        row, arcname, out_pdf = convert_document(doc["name"], doc["pdf"], data, **SELLER)
+        if out_pdf is None:
+            raise RuntimeError(f"{doc['name']}: {row}")
+        return len(out_pdf)
+
+    samples, _ = _measure(end_to_end, corpus)
+    stages["end_to_end"] = _summary(samples, rss_before=rss)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "docs": args.docs,
+            "pages": args.pages,
+            "image_kb": args.image_kb,
+            "input_mb": round(input_mb, 2),
+        },
+        "stages": stages,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _print(results, baseline=None):
+    meta = results["meta"]
+    print(f"{meta['docs']} docs, {meta['input_mb']} MB input, pages {meta['pages']}, image_kb {meta['image_kb']}")
+    header = f"{'stage':12s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'docs/s':>9s} {'peakRSS':>8s}"
+    if baseline:
+        header += f" {'p50 vs base':>12s}"
+    print(header)
+    for name, s in results["stages"].items():
+        line = (
+            f"{name:12s} {s['p50_ms']:9.2f} {s['p90_ms']:9.2f} {s['p99_ms']:9.2f} "
+            f"{s['docs_per_sec']:9.1f} {s['peak_rss_mb']:7.0f}M"
+        )
+        base = (baseline or {}).get("stages", {}).get(name)
+        if base and base["p50_ms"]:
+            line += f" {s['p50_ms'] / base['p50_ms']:11.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--pages", type=int, nargs=2, default=[1, 4], metavar=("MIN", "MAX"))
+    parser.add_argument("--image-kb", type=int, nargs=2, default=[0, 0], metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report-runs", type=int, default=5, help="Repeats of the ZIP+Excel stage")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline JSON from a previous run")
+    parser.add_argument(
+        "--max-regression", type=float, default=None,
+        help="Exit 1 if any stage p50 exceeds baseline by this factor (e.g. 1.2)",
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    _print(results, baseline)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if baseline and args.max_regression:
+        slow = [
+            name for name, s in results["stages"].items()
+            if name in baseline["stages"]
+            and s["p50_ms"] > baseline["stages"][name]["p50_ms"] * args.max_regression
+        ]
+        if slow:
+            print(f"Regression over {args.max_regression}x: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
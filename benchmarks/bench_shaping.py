@@ -0,0 +1,102 @@
+"""
+Azure request shaping: latency and payload per document with the whole file
+sent (off), only the first-pass pages analyzed (pages), and a stripped PDF
+uploaded (strip, optionally with images downsized).
+
+    python benchmarks/bench_shaping.py --docs 30 --pages 1 20 --image-kb 0 300 \
+        --page-ms 150 --upload-kbps 4000 [--max-px 300] [--json shaping.json]
+
+Runs pdf_autofill.azure_extract_many against the local stand-in, whose
+latency grows with the pages analyzed (--page-ms) and the upload size
+(--upload-kbps). "pages" is what the stand-in analyzed; "same" counts
+documents whose fields match the off run.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pdf_autofill
+import rate_limiter
+from azure_standin import start_standin
+from metrics import StageTimer
+from synthetic import generate_corpus
+
+
+def run(pdfs, server, endpoint, workers):
+    # A fresh adaptive limiter: it times uploads, so one mode would slow down the next
+    rate_limiter._limiter = None
+    pages_before = server.state.stats["pages_in"]
+    timers = [StageTimer(enabled=True) for _ in pdfs]
+    shaping = [{} for _ in pdfs]
+    results = [None] * len(pdfs)
+    t0 = time.perf_counter()
+    stream = pdf_autofill.azure_extract_many(
+        pdfs, endpoint, "standin", max_workers=workers, timers=timers, shaping=shaping,
+    )
+    for i, result in stream:
+        results[i] = result
+    wall = time.perf_counter() - t0
+    latencies = [t.columns()["ocr_ms"] for t in timers]
+    return results, {
+        "wall_s": wall,
+        "mean_ms": statistics.mean(latencies),
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "upload_mb": sum(s["bytes_sent"] for s in shaping) / 2**20,
+        "pages": server.state.stats["pages_in"] - pages_before,
+        "widened": sum(1 for s in shaping if s["widened"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--pages", type=int, nargs=2, default=[1, 20], metavar=("MIN", "MAX"))
+    parser.add_argument("--image-kb", type=int, nargs=2, default=[0, 300], metavar=("MIN", "MAX"))
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--page-ms", type=float, default=150)
+    parser.add_argument("--upload-kbps", type=float, default=4000)
+    parser.add_argument("--max-px", type=int, default=0, help="Also run strip with images downsized to this size")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    server, endpoint = start_standin(
+        latency_ms=args.latency_ms, page_ms=args.page_ms, upload_kbps=args.upload_kbps,
+    )
+    corpus = generate_corpus(args.docs, seed=args.seed, pages=tuple(args.pages), image_kb=tuple(args.image_kb))
+    pdfs = [d["pdf"] for d in corpus]
+    del corpus
+
+    runs = [("off", "off", 0), ("pages", "pages", 0), ("strip", "strip", 0)]
+    if args.max_px:
+        runs.append((f"strip_{args.max_px}px", "strip", args.max_px))
+    results = {"docs": args.docs, "page_ms": args.page_ms, "upload_kbps": args.upload_kbps, "modes": {}}
+    baseline = None
+    print(f"{args.docs} docs, {args.pages[0]}-{args.pages[1]} pages, {args.page_ms:.0f} ms/page, "
+          f"{args.upload_kbps:.0f} KB/s upload, {args.workers} in flight")
+    print(f"{'mode':14s} {'wall s':>7s} {'mean ms':>8s} {'p95 ms':>8s} {'upload MB':>10s} {'pages':>6s} "
+          f"{'widened':>8s} {'same':>5s}")
+    for name, mode, max_px in runs:
+        pdf_autofill.AZURE_PAGE_MODE, pdf_autofill.AZURE_IMAGE_MAX_PX = mode, max_px
+        fields, r = run(pdfs, server, endpoint, args.workers)
+        baseline = baseline or fields
+        r["same"] = sum(1 for a, b in zip(fields, baseline) if a == b)
+        results["modes"][name] = r
+        print(f"{name:14s} {r['wall_s']:7.2f} {r['mean_ms']:8.0f} {r['p95_ms']:8.0f} {r['upload_mb']:10.1f} "
+              f"{r['pages']:6d} {r['widened']:8d} {r['same']:5d}")
+
+    server.shutdown()
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
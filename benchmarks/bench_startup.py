@@ -0,0 +1,155 @@
+"""
+Cold-start benchmark: import time of the app and library modules, each in a
+fresh interpreter, plus the first-use cost that lazy imports move later.
+
+    python benchmarks/bench_startup.py --runs 5 --json startup.json [--compare before.json]
+
+Exits 1 when a module is over its import budget (--budget app=300 ...;
+defaults in IMPORT_BUDGET_MS). `app` is imported in Streamlit bare mode
+with JOB_WORKERS=0, after `streamlit` itself (reported separately).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = [
+    "totals", "facturx_xml", "validator", "facturx_engine", "pdf_autofill",
+    "pipeline", "bulk", "jobs", "facturx_converter", "app",
+]
+
+HEAVY = ["pandas", "numpy", "openpyxl", "pyarrow", "azure.ai.formrecognizer", "requests", "facturx", "pypdf", "lxml.etree"]
+
+# Milliseconds, on a warm page cache; generous enough for CI noise
+IMPORT_BUDGET_MS = {
+    "totals": 50,
+    "facturx_xml": 100,
+    "validator": 100,
+    "facturx_engine": 100,
+    "pdf_autofill": 100,
+    "pipeline": 150,
+    "bulk": 150,
+    "jobs": 50,
+    "facturx_converter": 150,
+    "app": 250,
+}
+
+_PROBE = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+name = {name!r}
+if name == "app":
+    import streamlit
+t0 = time.perf_counter()
+__import__(name)
+elapsed = time.perf_counter() - t0
+print("@@" + json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_FIRST_USE = r"""
+import json, sys, time
+sys.path.insert(0, {root!r}); sys.path.insert(0, {bench!r})
+from synthetic import make_invoice_pdf
+from datetime import date
+from decimal import Decimal
+pdf = make_invoice_pdf("INV-1", date(2025, 1, 1), "Dupont SARL", Decimal("100.00"))
+t0 = time.perf_counter()
+from pdf_autofill import extract_fields_text
+from pipeline import convert_document
+t1 = time.perf_counter()
+data = extract_fields_text(pdf)
+t2 = time.perf_counter()
+convert_document("a.pdf", pdf, data, "80258593400018", "FR34802585934")
+t3 = time.perf_counter()
+convert_document("a.pdf", pdf, data, "80258593400018", "FR34802585934")
+t4 = time.perf_counter()
+print("@@" + json.dumps({{"import_ms": (t1 - t0) * 1000, "first_extract_ms": (t2 - t1) * 1000,
+                          "first_convert_ms": (t3 - t2) * 1000, "second_convert_ms": (t4 - t3) * 1000}}))
+"""
+
+
+def _run(code: str, cwd: str) -> dict:
+    env = dict(os.environ, JOB_WORKERS="0", PIPELINE_METRICS_PORT="0", OCR_CACHE_PATH="")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("@@"):
+            return json.loads(line[2:])
+    raise RuntimeError(proc.stderr[-2000:])
+
+
+def run(args) -> dict:
+    # Neutral cwd: no .env, no .streamlit/ config picked up by accident
+    cwd = os.path.join(ROOT, "benchmarks")
+    modules = {}
+    for name in args.modules:
+        samples, loaded = [], []
+        for _ in range(args.runs):
+            result = _run(_PROBE.format(root=str(ROOT), name=name, heavy=HEAVY), cwd)
+            samples.append(result["ms"])
+            loaded = result["loaded"]
+        modules[name] = {
+            "median_ms": statistics.median(samples),
+            "min_ms": min(samples),
+            "loaded": loaded,
+        }
+
+    first = [_run(_FIRST_USE.format(root=str(ROOT), bench=cwd), cwd) for _ in range(args.runs)]
+    first_use = {k: statistics.median(r[k] for r in first) for k in first[0]}
+    return {"python": sys.version.split()[0], "runs": args.runs, "modules": modules, "first_use": first_use}
+
+
+def _print(results, baseline=None, budgets=None):
+    header = f"{'module':18s} {'median ms':>10s} {'budget':>7s}"
+    if baseline:
+        header += f" {'before':>9s}"
+    print(header + "  heavy modules loaded")
+    for name, m in results["modules"].items():
+        budget = (budgets or {}).get(name)
+        line = f"{name:18s} {m['median_ms']:10.1f} {budget if budget else '-':>7}"
+        if baseline:
+            base = baseline["modules"].get(name)
+            line += f" {base['median_ms']:9.1f}" if base else f" {'-':>9s}"
+        print(f"{line}  {', '.join(m['loaded']) or '-'}")
+    print("\nfirst use (fresh process):")
+    for k, v in results["first_use"].items():
+        before = (baseline or {}).get("first_use", {}).get(k)
+        print(f"  {k:18s} {v:8.1f} ms" + (f"   (before {before:.1f})" if before is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline JSON from a previous run")
+    parser.add_argument("--budget", nargs="*", default=[], metavar="MODULE=MS", help="Override import budgets")
+    parser.add_argument("--no-budget", action="store_true", help="Report only, never fail")
+    args = parser.parse_args()
+
+    budgets = dict(IMPORT_BUDGET_MS)
+    for item in args.budget:
+        name, ms = item.split("=")
+        budgets[name] = float(ms)
+
+    results = run(args)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    _print(results, baseline, budgets)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    over = [
+        name for name, m in results["modules"].items()
+        if name in budgets and m["median_ms"] > budgets[name]
+    ]
+    if over and not args.no_budget:
+        print(f"Over import budget: {', '.join(over)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
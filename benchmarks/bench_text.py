@@ -0,0 +1,89 @@
+"""
+Text-layer extraction throughput: page-limited search vs reading every page,
+and a text-only batch spread over 1..N worker processes.
+
+    python benchmarks/bench_text.py --docs 200 --pages 1 12 [--processes 1 2 4] [--json text.json]
+
+  full_scan   extract_text() on every page, then the patterns (the old engine)
+  page_limit  text_layer.scan_fields: first + last page, middle pages only if needed
+  pool_<n>    pdf_autofill.extract_text_many(processes=n) over the whole batch,
+              wall time including worker start-up
+Documents are written to a temp dir and read back as file-backed PdfDocuments,
+as in the job workers.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from document import PdfDocument, pdf_reader
+from pdf_autofill import extract_text_many
+from synthetic import generate_corpus
+from text_layer import DEFAULTS, scan_fields, close_text_pool
+
+
+def full_scan(pdf) -> dict:
+    with pdf_reader(pdf) as reader:
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    return {field: DEFAULTS.search(field, text) for field in DEFAULTS.fields}
+
+
+def _timed(fn, docs):
+    t0 = time.perf_counter()
+    for doc in docs:
+        fn(doc)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--pages", type=int, nargs=2, default=[1, 12], metavar=("MIN", "MAX"))
+    parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.docs, seed=args.seed, pages=tuple(args.pages))
+    results = {"docs": args.docs, "pages": args.pages, "cpus": os.cpu_count(), "modes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        docs = []
+        for d in corpus:
+            path = os.path.join(tmp, d["name"])
+            Path(path).write_bytes(d["pdf"])
+            docs.append(PdfDocument.from_path(path))
+        full_scan(docs[0])  # warm-up: pypdf imports
+        pages_read = sum(scan_fields(doc)[1] for doc in docs)
+        total_pages = 0
+        for doc in docs:
+            with pdf_reader(doc) as reader:
+                total_pages += len(reader.pages)
+        results["modes"]["full_scan"] = _timed(full_scan, docs)
+        results["modes"]["page_limit"] = _timed(scan_fields, docs)
+        for n in args.processes:
+            t0 = time.perf_counter()
+            for _ in extract_text_many(docs, processes=n):
+                pass
+            results["modes"][f"pool_{n}"] = time.perf_counter() - t0
+            close_text_pool()
+        results["pages_read"], results["total_pages"] = pages_read, total_pages
+
+    print(f"{args.docs} docs, {args.pages[0]}-{args.pages[1]} pages, {results['cpus']} CPUs, "
+          f"page_limit reads {pages_read} of {total_pages} pages")
+    print(f"{'mode':12s} {'seconds':>9s} {'docs/sec':>9s} {'speedup':>8s}")
+    base = results["modes"]["full_scan"]
+    for mode, seconds in results["modes"].items():
+        print(f"{mode:12s} {seconds:9.2f} {args.docs / seconds:9.1f} {base / seconds:7.2f}x")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
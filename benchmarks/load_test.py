@@ -0,0 +1,342 @@
+"""
+Headless load test of app.py: N concurrent sessions doing single-invoice
+generation and bulk batches against the Azure stand-in.
+
+    python benchmarks/load_test.py --sessions 8 --rounds 3 --single 2 --bulk 1 --batch-size 10 \
+        [--latency-ms 800] [--job-workers 2] [--json load.json]
+
+Each session is a Streamlit AppTest of app.py (the real script, session
+state and caches), run on its own thread in this process, as the server
+runs sessions. Job workers are the usual `python -m jobs worker`
+subprocesses; the stand-in runs in a subprocess of its own so its CPU is
+not counted.
+  single  upload -> AI Deep Scan -> Generate Compliant Bundle
+  bulk    upload --batch-size files -> Process All Files -> poll until done
+          (first_row: the first finished document shows in the table)
+Sessions are kept after each round, as the server keeps them until they
+disconnect, then released: "held" and "released" RSS per round show what
+sessions retain and what is never given back (after gc and malloc_trim);
+"still alive" counts released sessions whose state is still referenced.
+CPU is sampled every --sample-seconds: app process and job workers, as a
+percentage of all cores.
+"""
+import argparse
+import ctypes
+import gc
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(BENCH))
+
+from synthetic import generate_corpus
+
+SELLER = {"siret": "80258593400018", "vat": "FR34802585934"}
+_PAGE = os.sysconf("SC_PAGE_SIZE")
+_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _settled_rss() -> float:
+    """RSS after a full collection, with freed heap handed back to the OS (glibc keeps it otherwise)."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    return _proc_stats()[0]
+
+
+def _proc_stats(pid="self"):
+    """(RSS MB, CPU seconds) of a process from /proc."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * _PAGE / 2**20
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return rss, (int(fields[11]) + int(fields[12])) / _TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0, 0.0
+
+
+class Sampler:
+    """RSS and CPU of this process and the job workers, on a background thread."""
+
+    def __init__(self, worker_pids, interval: float):
+        self.worker_pids = list(worker_pids)
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def _read(self):
+        app_rss, app_cpu = _proc_stats()
+        workers = [_proc_stats(pid) for pid in self.worker_pids]
+        return time.perf_counter(), app_rss, app_cpu, sum(w[0] for w in workers), sum(w[1] for w in workers)
+
+    def _run(self):
+        cores = os.cpu_count() or 1
+        last = self._read()
+        while not self._stop.wait(self.interval):
+            now = self._read()
+            wall = now[0] - last[0]
+            self.samples.append({
+                "t": now[0],
+                "app_rss_mb": now[1],
+                "worker_rss_mb": now[3],
+                "app_cpu_pct": 100 * (now[2] - last[2]) / wall / cores,
+                "worker_cpu_pct": 100 * (now[4] - last[4]) / wall / cores,
+            })
+            last = now
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict:
+        out = {}
+        for key in ("app_rss_mb", "worker_rss_mb", "app_cpu_pct", "worker_cpu_pct"):
+            values = [s[key] for s in self.samples] or [0.0]
+            out[key] = {"mean": statistics.mean(values), "max": max(values)}
+        busy = [s["app_cpu_pct"] + s["worker_cpu_pct"] for s in self.samples] or [0.0]
+        out["saturated_pct_of_time"] = 100 * sum(1 for b in busy if b >= 90) / len(busy)
+        return out
+
+
+def _share_apptest_runtime():
+    """
+    AppTest installs a mock Runtime for the length of each run and removes
+    it at the end, which breaks the runs of other threads. The last mock
+    installed is kept for them: they are interchangeable.
+    """
+    from streamlit.runtime.runtime import Runtime
+
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+
+    # Each AppTest compiles app.py itself, and ast.parse is not thread-safe in 3.11
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    get_bytecode, compile_lock = ScriptCache.get_bytecode, threading.Lock()
+
+    def locked(self, script_path):
+        with compile_lock:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = locked
+
+
+# --- SESSION FLOWS (the clicks a user makes) ---
+def _timed(timings, action, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    timings.setdefault(action, []).append(time.perf_counter() - t0)
+    return result
+
+
+def _new_session(index: int):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120)
+    at.session_state.user_data = {
+        "email": f"load-{index}@example.com", **SELLER, "quota_limit": 10**6, "quota_used": 0,
+    }
+    at.run()
+    return at
+
+
+def _button(at, prefix):
+    return next(b for b in at.button if b.label.startswith(prefix))
+
+
+def single_flow(at, pdf: bytes, name: str, timings: dict):
+    at.radio[0].set_value("Single Invoice Studio").run()
+    _timed(timings, "single_upload", lambda: at.file_uploader[0].upload(name, pdf, "application/pdf").run())
+    _timed(timings, "single_ai_scan", lambda: at.button(key="btn_ai").click().run())
+    _timed(timings, "single_generate", lambda: _button(at, "✨").click().run())
+    if not any("Bundle Generated" in s.value for s in at.success):
+        raise RuntimeError(f"single flow failed: {[e.value for e in at.error]}")
+
+
+def bulk_flow(at, files, timings: dict, poll: float):
+    at.radio[0].set_value("Batch Processor (Bulk)").run()
+    _timed(timings, "bulk_upload", lambda: at.file_uploader[0].set_value(
+        [(name, pdf, "application/pdf") for name, pdf in files]
+    ).run())
+    t0 = time.perf_counter()
+    _timed(timings, "bulk_submit", lambda: _button(at, "🚀").click().run())
+    first_row = None
+    while True:
+        time.sleep(poll)
+        _timed(timings, "bulk_poll", at.run)
+        if first_row is None and len(at.dataframe):
+            first_row = time.perf_counter() - t0
+        if any("Batch Processing Complete" in s.value for s in at.success):
+            break
+        if at.error or any("cancelled" in w.value for w in at.warning):
+            raise RuntimeError(f"bulk flow failed: {[e.value for e in at.error]}")
+    done = time.perf_counter() - t0
+    timings.setdefault("bulk_first_row", []).append(first_row if first_row is not None else done)
+    timings.setdefault("bulk_done", []).append(done)
+
+
+def session(index, rnd_round, args, sessions, timings, errors):
+    try:
+        at = _timed(timings, "session_start", lambda: _new_session(index))
+        sessions[index] = at
+        seed = 1000 * rnd_round + index
+        corpus = generate_corpus(args.single + args.bulk * args.batch_size, seed=seed, pages=(1, 4))
+        for doc in corpus[:args.single]:
+            single_flow(at, doc["pdf"], doc["name"], timings)
+        for b in range(args.bulk):
+            batch = corpus[args.single + b * args.batch_size:args.single + (b + 1) * args.batch_size]
+            bulk_flow(at, [(d["name"], d["pdf"]) for d in batch], timings, args.poll)
+    except Exception as e:
+        errors.append(f"session {index}: {e!r}")
+
+
+def _pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions per round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--single", type=int, default=2, help="Single invoices per session")
+    parser.add_argument("--bulk", type=int, default=1, help="Bulk batches per session")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Stand-in analysis time")
+    parser.add_argument("--job-workers", type=int, default=2)
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between reruns while a batch runs")
+    parser.add_argument("--sample-seconds", type=float, default=0.5)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    port = _free_port()
+    endpoint = f"http://127.0.0.1:{port}"
+    standin = subprocess.Popen(
+        [sys.executable, str(BENCH / "azure_standin.py"), "--port", str(port), "--latency-ms", str(args.latency_ms)],
+        stdout=subprocess.DEVNULL,
+    )
+    os.environ.update({
+        "DOCUMENTINTELLIGENCE_ENDPOINT": endpoint,
+        "DOCUMENTINTELLIGENCE_API_KEY": "standin",
+        "JOBS_DIR": os.path.join(tmp.name, "jobs"),
+        "OCR_CACHE_PATH": "",
+        "CHECKPOINT_DIR": os.path.join(tmp.name, "checkpoints"),
+        "JOB_POLL_SECONDS": str(args.poll),
+    })
+    import jobs
+
+    # Started here (app.py's start_workers is then a no-op) so their pids are known
+    workers = jobs.start_workers(args.job_workers, endpoint, "standin")
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    # Warm-up: imports, schema, caches; not measured
+    _share_apptest_runtime()
+    _new_session(-1)
+    baseline_mb = _settled_rss()
+
+    sampler = Sampler([p.pid for p in workers], args.sample_seconds).start()
+    timings, errors, rounds = {}, [], []
+    print(f"{args.sessions} sessions x {args.rounds} rounds: {args.single} single + {args.bulk} bulk "
+          f"of {args.batch_size}; stand-in {args.latency_ms:.0f} ms; {args.job_workers} job workers; "
+          f"{os.cpu_count()} CPUs")
+    try:
+        for r in range(args.rounds):
+            sessions = [None] * args.sessions
+            t0 = time.perf_counter()
+            threads = [
+                threading.Thread(target=session, args=(i, r, args, sessions, timings, errors), name=f"session-{i}")
+                for i in range(args.sessions)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - t0
+            held = _settled_rss()
+            refs = [weakref.ref(at._session_state) for at in sessions if at is not None]
+            del sessions, threads
+            released = _settled_rss()
+            alive = sum(1 for ref in refs if ref() is not None)
+            rounds.append({
+                "wall_s": wall, "held_mb": held - baseline_mb, "released_mb": released - baseline_mb,
+                "sessions_alive": alive,
+            })
+            print(f"round {r + 1}: {wall:6.1f} s  RSS held +{held - baseline_mb:6.1f} MB  "
+                  f"released +{released - baseline_mb:6.1f} MB  sessions still alive {alive}/{len(refs)}")
+    finally:
+        sampler.stop()
+        jobs.stop_workers()
+        standin.terminate()
+
+    actions = {
+        name: {"n": len(v), "p50_ms": _pct(v, 50) * 1000, "p95_ms": _pct(v, 95) * 1000, "max_ms": max(v) * 1000}
+        for name, v in timings.items()
+    }
+    print(f"\n{'action':16s} {'n':>5s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s}")
+    for name, a in actions.items():
+        print(f"{name:16s} {a['n']:5d} {a['p50_ms']:9.0f} {a['p95_ms']:9.0f} {a['max_ms']:9.0f}")
+    usage = sampler.summary()
+    print(f"\napp RSS     mean {usage['app_rss_mb']['mean']:7.1f} MB  max {usage['app_rss_mb']['max']:7.1f} MB "
+          f"(baseline {baseline_mb:.1f} MB)")
+    print(f"workers RSS mean {usage['worker_rss_mb']['mean']:7.1f} MB  max {usage['worker_rss_mb']['max']:7.1f} MB")
+    print(f"CPU app     mean {usage['app_cpu_pct']['mean']:5.1f} %  max {usage['app_cpu_pct']['max']:5.1f} %; "
+          f"workers mean {usage['worker_cpu_pct']['mean']:5.1f} %  max {usage['worker_cpu_pct']['max']:5.1f} %; "
+          f"saturated {usage['saturated_pct_of_time']:.0f} % of the time")
+    if len(rounds) > 1:
+        growth = (rounds[-1]["released_mb"] - rounds[0]["released_mb"]) / (len(rounds) - 1)
+        print(f"released RSS growth per round: {growth:+.1f} MB")
+    for e in errors:
+        print("ERROR", e)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "args": vars(args), "cpus": os.cpu_count(), "baseline_mb": baseline_mb, "rounds": rounds,
+            "actions": actions, "usage": usage, "errors": errors,
+        }, indent=2))
+    tmp.cleanup()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Synthetic invoice PDFs for offline benchmarks and load tests.
+
+The PDFs are written by hand (no extra dependency): a real text layer in the
+layout extract_fields_text expects, optional filler pages (annexes, terms)
+and an optional grey-scale image per page to mimic scanned documents.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text_stream(lines) -> bytes:
+    ops = ["BT /F1 11 Tf 50 800 Td 14 TL"]
+    ops += [f"({_escape(line)}) '" for line in lines]
+    ops.append("ET")
+    return " ".join(ops).encode("latin-1")
+
+
+def make_invoice_pdf(
+    invoice_number: str,
+    invoice_date: date,
+    buyer_name: str,
+    total_ht: Decimal,
+    total_ttc: Decimal = None,
+    pages: int = 1,
+    image_kb: int = 0,
+    seed: int = 0,
+) -> bytes:
+    """
+    Returns PDF bytes: header fields on page 1, totals on the last page,
+    filler text in between. `image_kb` adds a random grey image of about
+    that size to every page.
+    """
+    rnd = random.Random(seed)
+    page_lines = []
+    for p in range(pages):
+        lines = []
+        if p == 0:
+            lines += [
+                "ACME Fournitures SAS",
+                f"Invoice No: {invoice_number}",
+                f"Invoice Date: {invoice_date.isoformat()}",
+                f"Customer: {buyer_name}",
+                "",
+            ]
+        lines += [
+            f"Line {p * 30 + i + 1}: item {rnd.randint(1000, 9999)} qty {rnd.randint(1, 9)}"
+            for i in range(30)
+        ]
+        if p == pages - 1:
+            lines += ["", f"Subtotal: {total_ht:.2f}"]
+            if total_ttc is not None:
+                lines.append(f"Total TTC: {total_ttc:.2f}")
+        page_lines.append(lines)
+
+    side = int((image_kb * 1024) ** 0.5) if image_kb else 0
+
+    # Object layout: 1 catalog, 2 pages, 3 font, then per page: page, content[, image]
+    objects = {1: None, 2: None, 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for lines in page_lines:
+        page_id, content_id = next_id, next_id + 1
+        image_id = next_id + 2 if side else None
+        next_id += 3 if side else 2
+        kids.append(page_id)
+
+        content = _text_stream(lines)
+        xobject = b""
+        if side:
+            content = f"q {side / 4:.2f} 0 0 {side / 4:.2f} 300 50 cm /Im1 Do Q ".encode() + content
+            pixels = rnd.randbytes(side * side)
+            objects[image_id] = (
+                f"<< /Type /XObject /Subtype /Image /Width {side} /Height {side} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length {len(pixels)} >>\nstream\n"
+            ).encode() + pixels + b"\nendstream"
+            xobject = f" /XObject << /Im1 {image_id} 0 R >>".encode()
+
+        objects[content_id] = (
+            f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"
+        )
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            + f"/Contents {content_id} 0 R /Resources << /Font << /F1 3 0 R >>".encode()
+            + xobject + b" >> >>"
+        )
+
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+    ).encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n".encode() + objects[obj_id] + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    for obj_id in range(1, size):
+        out += f"{offsets[obj_id]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def generate_corpus(count: int, seed: int = 42, pages=(1, 4), image_kb=(0, 0)):
+    """
+    Returns a list of dicts: name, pdf (bytes) and the expected fields.
+    Page counts and image sizes are drawn uniformly from the given ranges.
+    """
+    rnd = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        ht = Decimal(rnd.randint(1000, 5_000_000)) / 100
+        rate = rnd.choice([Decimal("20"), Decimal("10"), Decimal("5.5")])
+        ttc = (ht + ht * rate / 100).quantize(Decimal("0.01"))
+        fields = {
+            "invoice_number": f"INV-{seed}-{i:06d}",
+            "invoice_date": date(2025, 1, 1) + timedelta(days=rnd.randint(0, 364)),
+            "buyer_name": rnd.choice(["Dupont SARL", "Martin & Fils", "Bernard SA", "Petit Commerce"]),
+            "total_ht": ht,
+            "total_ttc": ttc,
+        }
+        pdf = make_invoice_pdf(
+            fields["invoice_number"],
+            fields["invoice_date"],
+            fields["buyer_name"],
+            ht,
+            total_ttc=ttc,
+            pages=rnd.randint(*pages),
+            image_kb=rnd.randint(*image_kb),
+            seed=seed * 100_003 + i,
+        )
+        corpus.append({"name": f"{fields['invoice_number']}.pdf", "pdf": pdf, **fields})
+    return corpus
@@ -0,0 +1,366 @@
+import os
+import queue
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_autofill import (
+    extract_text_many, azure_extract_timed, AZURE_MODEL_ID, missing_fields, merge_tiers, format_tiers,
+    format_shaping,
+)
+from ocr_cache import pdf_digest
+from pipeline import build_document, embed_document
+from metrics import REGISTRY, StageTimer, summarize, flush_metrics_file
+from checkpoints import profile_key
+from dedup import first_page_fingerprint, invoice_key, unique_arcname, describe_earlier
+from report import SpooledReports, report_columns
+from document import zip_pdf
+
+# The bulk batch itself, without any Streamlit: used by the job workers.
+# files -> duplicates -> a pipeline with one thread per stage:
+#   extract (text layer, then Azure for what is missing)
+#     -> build (XML + validation) -> embed -> archive (ZIP, report, on_document)
+# Documents go through it independently: a file is in the ZIP, and handed
+# to on_document, while later ones are still being read or analyzed.
+# Files are admitted and archived in upload order, so credits and duplicate
+# detection give the same answers as one file after another would.
+# At most PIPELINE_DEPTH files are between admission and the ZIP: that
+# bounds every queue, and the converted PDFs held in memory.
+
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", "16"))
+
+REPORT_NAME = "Master_Processing_Report"
+
+
+def _duplicate_row(file_name: str, original: str, reason: str) -> dict:
+    REGISTRY.count_document("DUPLICATE")
+    return {
+        "File": file_name,
+        "Status": "DUPLICATE",
+        "Compliance Profile": "N/A",
+        "Reason": reason,
+        "Duplicate Of": original,
+    }
+
+
+def run_bulk(
+    files,
+    seller_siret: str,
+    seller_vat: str,
+    out,
+    tiered: bool = True,
+    endpoint: str = None,
+    key: str = None,
+    credits: int = 0,
+    cache=None,
+    max_workers: int = 4,
+    progress=None,
+    checkpoints=None,
+    report_formats=("xlsx",),
+    duplicates: str = "skip",
+    fingerprint: bool = False,
+    dedup_index=None,
+    on_document=None,
+    usage=None,
+):
+    """
+    Converts `files` (list of (name, pdf_bytes)) and writes the ZIP bundle
+    (PDFs + Master_Processing_Report.<fmt> for each of `report_formats`)
+    to the binary file `out`. Report rows are streamed as documents finish.
+    At most `credits` Azure calls are made; cache hits are free.
+    `progress(stage, done, total, message)` is called along the way, and
+    at least once a second while waiting (it may raise to stop the batch).
+    `on_document(index, row, arcname, out_pdf)` is called for each file
+    as soon as it is archived, in upload order; arcname and out_pdf are
+    None when nothing was converted. Both run in the calling thread.
+    `usage` (a dict), when given, has "credits_used" kept current as Azure
+    calls start, so a caller that stops the batch knows what it spent.
+    With `checkpoints` (a CheckpointStore), documents converted by an
+    earlier run are reused as is, and saved Azure results are not paid twice.
+    Files with the same content or the same invoice number as an earlier
+    file of the batch are reported as DUPLICATE and skipped; duplicates="keep"
+    converts them too, under a unique ZIP name. With `fingerprint`, files
+    with the same first-page text are converted and linked in "Duplicate Of". With `dedup_index` (a DedupIndex), documents
+    already converted in an earlier batch are linked in "Duplicate Of".
+    Returns {"rows": [...], "metrics": [...], "credits_used": int}.
+    """
+    progress = progress or (lambda *a: None)
+    count = len(files)
+    timers = [StageTimer() for _ in files]
+    batch_timer = StageTimer()
+
+    digests = [pdf_digest(pdf) for _, pdf in files]
+    profile = profile_key(seller_siret, seller_vat, tiered)
+
+    # --- Duplicates: same file, or same first-page text, as an earlier upload ---
+    doc_keys = [[("content", d)] for d in digests]
+    first_seen = {}  # (kind, key) -> index of the first file
+    duplicate_of = {}  # index -> (index of the first file, reason)
+    for i, (name, pdf) in enumerate(files):
+        if fingerprint:
+            text_key = first_page_fingerprint(pdf)
+            if text_key:
+                doc_keys[i].append(("text", text_key))
+        j = next((first_seen[k] for k in doc_keys[i] if k in first_seen), None)
+        if j is None:
+            for k in doc_keys[i]:
+                first_seen[k] = i
+        else:
+            same = "Same file as" if digests[i] == digests[j] else "Same first-page text as"
+            duplicate_of[i] = (j, f"{same} {files[j][0]}")
+    # Exact copies share the first file's extraction, or are skipped. The same first-page
+    # text is only linked: identical cover letters or terms pages are not the same invoice.
+    copies = {i: j for i, (j, _) in duplicate_of.items() if digests[i] == digests[j]}
+    skip = set(copies) if duplicates == "skip" else set()
+
+    # Cache lookup first: hits cost neither an Azure call nor a credit
+    ocr_results = [cache.get(d, AZURE_MODEL_ID) if cache is not None else None for d in digests]
+    cache_status = ["MISS" if r is None else "HIT" for r in ocr_results]
+
+    # Checkpoints from an earlier (interrupted) run of the same files
+    saved = [checkpoints.get(d, profile) if checkpoints is not None else None for d in digests]
+    resumed = {}
+    for i, cp in enumerate(saved):
+        # A copy follows its original, unless the original is resumed: then it is too (same checkpoint)
+        if cp is None or (i in copies and copies[i] not in resumed):
+            continue
+        if cp["status"] == "SUCCESS":
+            out_pdf = cp.output()
+            if out_pdf is not None:
+                resumed[i] = out_pdf
+                continue
+        if cp["extraction"] is not None and ocr_results[i] is None:
+            ocr_results[i] = cp["extraction"]
+            cache_status[i] = "CHECKPOINT"
+    misses = {i for i, r in enumerate(ocr_results) if r is None and i not in resumed and i not in copies}
+
+    # Never spend more credits than the user has left
+    if endpoint and key:
+        budget, skip_reason = max(credits, 0), "No AI credits left for this file"
+    else:
+        budget, skip_reason = 0, "Text layer incomplete and AI is not configured"
+
+    text_results = [{} for _ in files]
+    datas = [None] * count  # merged extraction, as converted
+    tiers = [{} for _ in files]
+    shaping = [{} for _ in files]  # what Azure was sent (pages, bytes)
+    rows, arcnames, xmls, outputs = [None] * count, [None] * count, [None] * count, [None] * count
+    ocr_calls = []  # files sent to Azure, in upload order
+    skipped = set()
+
+    depth = max(PIPELINE_DEPTH, 2 * max(1, int(max_workers)))
+    window = threading.Semaphore(depth)
+    stop = threading.Event()
+    build_q, embed_q, archive_q = queue.Queue(), queue.Queue(), queue.Queue()
+    ocr_pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="azure-ocr")
+    lock = threading.Lock()
+    extracted, followers = set(), {}  # copies wait for their original's extraction
+
+    def follow(i, j):
+        ocr_results[i], text_results[i], cache_status[i] = ocr_results[j], text_results[j], cache_status[j]
+        if j in skipped:
+            skipped.add(i)
+        build_q.put(i)
+
+    def on_extracted(i):
+        build_q.put(i)
+        with lock:
+            extracted.add(i)
+            waiting = followers.pop(i, ())
+        for f in waiting:
+            follow(f, i)
+
+    def ocr(i):
+        if usage is not None:
+            with lock:
+                usage["credits_used"] = usage.get("credits_used", 0) + 1
+        try:
+            ocr_results[i] = azure_extract_timed(timers[i], files[i][1], endpoint, key, cache, shaping[i])
+            if checkpoints is not None and isinstance(ocr_results[i], dict):
+                checkpoints.put_extraction(digests[i], profile, ocr_results[i])
+        except Exception as e:
+            ocr_results[i] = e
+        on_extracted(i)
+
+    # --- Stage 1: extraction, admitted in upload order ---
+    def extract():
+        if tiered:
+            todo = [i for i in range(count) if i not in resumed and i not in copies]
+            text_stream = extract_text_many(
+                [files[i][1] for i in todo], cache=cache, timers=[timers[i] for i in todo],
+            )
+            todo_set, have = set(todo), set()
+
+        for i in range(count):
+            while not window.acquire(timeout=0.5):
+                if stop.is_set():
+                    return
+            if tiered:
+                # Text results come in completion order; admission waits for this file's
+                while i in todo_set and i not in have:
+                    idx, result = next(text_stream)
+                    text_results[todo[idx]] = result
+                    have.add(todo[idx])
+
+            if i in resumed or i in skip:
+                archive_q.put(i)
+            elif i in copies:
+                with lock:
+                    ready = copies[i] in extracted
+                    if not ready:
+                        followers.setdefault(copies[i], []).append(i)
+                if ready:
+                    follow(i, copies[i])
+            elif i in misses and not (tiered and not missing_fields(text_results[i])):
+                if len(ocr_calls) < budget:
+                    ocr_calls.append(i)
+                    ocr_pool.submit(ocr, i)
+                else:
+                    skipped.add(i)
+                    on_extracted(i)
+            else:
+                if ocr_results[i] is None:
+                    cache_status[i] = "N/A"
+                on_extracted(i)
+
+    # --- Stage 2: XML + validation ---
+    def build():
+        for i in iter(build_q.get, None):
+            data = ocr_results[i]
+            if tiered and not isinstance(data, Exception):
+                data, tiers[i] = merge_tiers(text_results[i], data)
+            elif not isinstance(data, Exception):
+                tiers[i] = {field: "azure" for field in (data or {})}
+            datas[i] = data
+            rows[i], arcnames[i], xmls[i] = build_document(
+                files[i][0], data or {}, seller_siret=seller_siret, seller_vat=seller_vat, timer=timers[i],
+            )
+            embed_q.put(i)
+        embed_q.put(None)
+
+    # --- Stage 3: embed ---
+    def embed():
+        for i in iter(embed_q.get, None):
+            rows[i], outputs[i] = embed_document(rows[i], files[i][1], xmls[i], timers[i])
+            archive_q.put(i)
+
+    def guarded(stage):
+        def run():
+            try:
+                stage()
+            except BaseException as e:
+                archive_q.put(e)  # re-raised by the archive loop
+        return run
+
+    # --- Stage 4: ZIP + report rows, in upload order ---
+    arcs = set()
+    invoices = {}  # invoice key -> first converted file
+    converted = []  # (kind, key, file) for dedup_index
+
+    def archive(i, z):
+        name = files[i][0]
+        if i in skip:
+            j, reason = duplicate_of[i]
+            return _duplicate_row(name, files[j][0], reason), None, None
+
+        if i in resumed:
+            invoice_number = saved[i]["row"].get("Invoice #")
+        else:
+            data = datas[i]
+            invoice_number = data.get("invoice_number") if isinstance(data, dict) else None
+
+        # Same invoice number as a document converted earlier in this batch
+        inv_key = invoice_key(invoice_number)
+        first = invoices.get(inv_key) if inv_key else None
+        if first is not None and duplicates == "skip":
+            return _duplicate_row(name, first, f"Invoice number {invoice_number} already in {first}"), None, None
+        keys = doc_keys[i] + ([("invoice", inv_key)] if inv_key else [])
+
+        if i in resumed:
+            row = dict(saved[i]["row"], File=name, Checkpoint="RESUMED")
+            arcname, out_pdf = saved[i]["arcname"], resumed[i]
+        else:
+            row, out_pdf = rows[i], outputs[i]
+            arcname = arcnames[i] if out_pdf is not None else None
+            if timers[i].enabled:
+                REGISTRY.count_document(row["Status"])
+            if i in skipped and row["Status"] != "SUCCESS":
+                row["Reason"] = skip_reason
+            row["OCR Cache"] = cache_status[i]
+            row["Field Sources"] = format_tiers(tiers[i])
+            row.update(format_shaping(shaping[i]))
+            if checkpoints is not None:
+                checkpoints.put_result(digests[i], profile, row, arcname, out_pdf)
+                row["Checkpoint"] = "NEW"
+
+        if out_pdf is not None:
+            # Distinct invoice numbers can still map to one file name
+            arcname = unique_arcname(arcname, arcs)
+            with timers[i].stage("zip_write", len(out_pdf)):
+                zip_pdf(z, arcname, out_pdf)
+
+        if i in duplicate_of:
+            row["Duplicate Of"] = files[duplicate_of[i][0]][0]
+        elif first is not None:
+            row["Duplicate Of"] = first
+        elif dedup_index is not None:
+            earlier = dedup_index.lookup(seller_siret, keys)
+            if earlier is not None:
+                row["Duplicate Of"] = describe_earlier(earlier)
+
+        if row["Status"] == "SUCCESS":
+            if inv_key:
+                invoices.setdefault(inv_key, name)
+            converted.extend((kind, k, name) for kind, k in keys)
+        row.update(timers[i].columns())
+        return row, arcname, out_pdf
+
+    def message(done):
+        calls = len(ocr_calls)
+        return f"Processed {done}/{count} files" + (f" ({calls} sent to AI)" if calls else "")
+
+    stages = [
+        threading.Thread(target=guarded(stage), name=f"bulk-{stage.__name__}", daemon=True)
+        for stage in (extract, build, embed)
+    ]
+    result_rows = []
+    columns = report_columns(metrics=batch_timer.enabled, drop=() if checkpoints is not None else ("Checkpoint",))
+    try:
+        with SpooledReports(report_formats, columns) as reports, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+            for t in stages:
+                t.start()
+            progress("convert", 0, count, message(0))
+            done, ready = 0, set()
+            while done < count:
+                try:
+                    item = archive_q.get(timeout=1)
+                except queue.Empty:
+                    progress("convert", done, count, message(done))
+                    continue
+                if isinstance(item, BaseException):
+                    raise item
+                ready.add(item)
+                while done in ready:
+                    row, arcname, out_pdf = archive(done, z)
+                    result_rows.append(row)
+                    reports.append(row)
+                    if on_document is not None:
+                        on_document(done, row, arcname, out_pdf)
+                    xmls[done] = outputs[done] = None
+                    ready.discard(done)
+                    window.release()
+                    done += 1
+                    progress("convert", done, count, message(done))
+            progress("convert", count, count, "Writing report...")
+
+            nbytes = reports.write_zip(z, REPORT_NAME)
+            batch_timer.add("report_write", reports.seconds, nbytes)
+    finally:
+        stop.set()
+        build_q.put(None)
+        ocr_pool.shutdown(wait=False, cancel_futures=True)
+
+    if dedup_index is not None and converted:
+        dedup_index.record(seller_siret, converted)
+    flush_metrics_file()
+    return {"rows": result_rows, "metrics": summarize(timers + [batch_timer]), "credits_used": len(ocr_calls)}
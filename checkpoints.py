@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+
+from document import PdfData, PdfDocument, save_pdf
+
+from ocr_cache import dumps_fields, loads_fields
+
+# Per-document checkpoints for bulk runs, keyed by PDF content hash + a
+# profile (seller ids, extraction mode). A rerun of the same files reuses:
+#   - the extraction result (no new Azure call, no credit),
+#   - for SUCCESS documents, the report row and output PDF.
+# Output PDFs are stored as files under CHECKPOINT_DIR/out, at most
+# CHECKPOINT_MAX_MB of them (checked with the TTL purge): beyond that the
+# oldest are dropped and their documents are rebuilt from the saved
+# extraction (still no Azure call).
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", ".cache/checkpoints")
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(7 * 24 * 3600)))
+CHECKPOINT_MAX_MB = int(os.getenv("CHECKPOINT_MAX_MB", "1024"))
+
+
+def profile_key(seller_siret: str, seller_vat: str, tiered: bool) -> str:
+    """Checkpoints only apply to runs with the same seller and extraction mode."""
+    return hashlib.sha256(f"{seller_siret}|{seller_vat}|{int(bool(tiered))}".encode()).hexdigest()[:16]
+
+
+class Checkpoint(dict):
+    """extraction, arcname, output_path, row, status (None when not converted yet)."""
+
+    def output(self) -> Optional[PdfDocument]:
+        """The saved output PDF, read from disk when used (None if it is gone)."""
+        path = self.get("output_path")
+        if not path or not os.path.isfile(path):
+            return None
+        return PdfDocument.from_path(path, self.get("arcname"))
+
+
+class CheckpointStore:
+    """
+    SQLite-backed checkpoints. WAL and a 30 s busy timeout let the job
+    workers use one file; a lock serializes this connection's threads.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DIR, ttl_seconds: int = CHECKPOINT_TTL, max_mb: int = CHECKPOINT_MAX_MB):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_mb * 1024 * 1024
+        self.out_dir = Path(path) / "out"
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "checkpoints.sqlite3"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " digest TEXT NOT NULL,"
+            " profile TEXT NOT NULL,"
+            " extraction TEXT,"
+            " arcname TEXT,"
+            " output_path TEXT,"
+            " row TEXT,"
+            " status TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (digest, profile))"
+        )
+        self._db.commit()
+
+    def get(self, digest: str, profile: str) -> Optional[Checkpoint]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT extraction, arcname, output_path, row, status, updated_at"
+                " FROM checkpoints WHERE digest = ? AND profile = ?",
+                (digest, profile),
+            ).fetchone()
+        if row is None or time.time() - row[5] > self.ttl_seconds:
+            return None
+        return Checkpoint(
+            extraction=loads_fields(row[0]) if row[0] else None,
+            arcname=row[1],
+            output_path=row[2],
+            row=json.loads(row[3]) if row[3] else None,
+            status=row[4],
+        )
+
+    def put_extraction(self, digest: str, profile: str, fields: dict) -> None:
+        """Records the Azure result (the part that costs a credit)."""
+        if not fields:
+            # Empty results are usually transient failures: retry them next time
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO checkpoints (digest, profile, extraction, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (digest, profile) DO UPDATE SET"
+                " extraction = excluded.extraction, updated_at = excluded.updated_at",
+                (digest, profile, dumps_fields(fields), time.time()),
+            )
+            self._db.commit()
+
+    def put_result(self, digest: str, profile: str, row: dict, arcname: str = None, out_pdf: PdfData = None) -> None:
+        """Records the conversion outcome; the output PDF is written before the row."""
+        output_path = None
+        if out_pdf is not None:
+            path = self.out_dir / f"{digest}-{profile}.pdf"
+            tmp = path.with_suffix(".part")
+            save_pdf(out_pdf, tmp)
+            os.replace(tmp, path)
+            output_path = str(path.resolve())
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO checkpoints (digest, profile, arcname, output_path, row, status, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (digest, profile) DO UPDATE SET"
+                " arcname = excluded.arcname, output_path = excluded.output_path,"
+                " row = excluded.row, status = excluded.status, updated_at = excluded.updated_at",
+                (digest, profile, arcname, output_path, json.dumps(row, default=str), row["Status"], time.time()),
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> None:
+        """Drops expired checkpoints, then the oldest output PDFs beyond max_bytes."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = self._db.execute(
+                "SELECT output_path FROM checkpoints WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            self._db.execute("DELETE FROM checkpoints WHERE updated_at < ?", (cutoff,))
+            self._db.commit()
+            outputs = self._db.execute(
+                "SELECT digest, profile, output_path FROM checkpoints WHERE output_path IS NOT NULL"
+                " ORDER BY updated_at DESC"
+            ).fetchall()
+        for (path,) in expired:
+            if path:
+                Path(path).unlink(missing_ok=True)
+
+        total, dropped = 0, []
+        for digest, profile, path in outputs:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                continue
+            if total > self.max_bytes:
+                dropped.append((digest, profile, path))
+        if not dropped:
+            return
+        with self._lock:
+            # The extraction stays: a resume rebuilds these documents without an Azure call
+            self._db.executemany(
+                "UPDATE checkpoints SET output_path = NULL WHERE digest = ? AND profile = ? AND output_path = ?",
+                dropped,
+            )
+            self._db.commit()
+        for _, _, path in dropped:
+            Path(path).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """The store under CHECKPOINT_DIR, opened once by each job worker."""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = CheckpointStore()
+    return _default_store
@@ -0,0 +1,142 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Optional
+
+from document import PdfData, pdf_reader
+
+# Duplicate detection for bulk runs. Each document has up to three keys:
+#   content - sha256 of the PDF bytes (the same file uploaded twice)
+#   text    - sha256 of the normalised first-page text (same invoice re-saved
+#             or re-exported), optional since it costs a PDF parse
+#   invoice - normalised invoice number, once fields are extracted
+# Within a batch, later copies (same content or invoice number) are skipped
+# or kept and linked; the same first-page text is only linked (see
+# bulk.run_bulk). DedupIndex remembers the keys of converted documents per
+# seller, so later batches can point at them in their report.
+
+DEDUP_PATH = os.getenv("DEDUP_PATH", ".cache/dedup.sqlite3")
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", str(365 * 24 * 3600)))
+DUPLICATE_POLICIES = ("skip", "keep")
+
+# Shorter first pages (blank scans, cover sheets) are not distinctive enough
+FINGERPRINT_MIN_CHARS = 40
+
+_SPACES = re.compile(r"\s+")
+_NOT_ALNUM = re.compile(r"[^0-9A-Z]")
+
+
+def first_page_fingerprint(pdf_bytes: PdfData) -> Optional[str]:
+    """Hash of the first page's text layer, or None (no text layer, unreadable PDF)."""
+    try:
+        with pdf_reader(pdf_bytes) as reader:
+            text = (reader.pages[0].extract_text() or "") if len(reader.pages) else ""
+    except Exception:
+        return None
+    text = _SPACES.sub(" ", text).strip().lower()
+    if len(text) < FINGERPRINT_MIN_CHARS:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def invoice_key(invoice_number) -> Optional[str]:
+    """'inv 2024/001' and 'INV-2024-001' are the same invoice (and the same ZIP name)."""
+    key = _NOT_ALNUM.sub("", str(invoice_number or "").upper())
+    return key or None
+
+
+def unique_arcname(arcname: str, used: set) -> str:
+    """`arcname`, or name_2.pdf, name_3.pdf... if already in `used`; the result is added to `used`."""
+    name, n = arcname, 1
+    stem, dot, ext = arcname.rpartition(".")
+    if not dot:
+        stem, ext = arcname, ""
+    while name in used:
+        n += 1
+        name = f"{stem}_{n}{dot}{ext}"
+    used.add(name)
+    return name
+
+
+class DedupIndex:
+    """
+    Keys of documents converted in earlier batches, per seller (`scope`).
+    Only the first file seen for a key is kept.
+    """
+
+    def __init__(self, path: str = DEDUP_PATH, ttl_seconds: int = DEDUP_TTL):
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " scope TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " file TEXT NOT NULL,"
+            " seen_at REAL NOT NULL,"
+            " PRIMARY KEY (scope, kind, key))"
+        )
+        self._db.commit()
+
+    def lookup(self, scope: str, keys) -> Optional[dict]:
+        """First earlier document matching any of `keys` ((kind, key) pairs): {"file", "kind", "seen_at"}."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for kind, key in keys:
+                row = self._db.execute(
+                    "SELECT file, seen_at FROM documents WHERE scope = ? AND kind = ? AND key = ? AND seen_at >= ?",
+                    (scope, kind, key, cutoff),
+                ).fetchone()
+                if row is not None:
+                    return {"file": row[0], "kind": kind, "seen_at": row[1]}
+        return None
+
+    def record(self, scope: str, entries) -> None:
+        """`entries`: (kind, key, file) of converted documents."""
+        now = time.time()
+        # Live entries keep pointing at the first file; expired ones are replaced
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO documents (scope, kind, key, file, seen_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (scope, kind, key) DO UPDATE SET file = excluded.file, seen_at = excluded.seen_at"
+                " WHERE documents.seen_at < ?",
+                [(scope, kind, key, file, now, now - self.ttl_seconds) for kind, key, file in entries],
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM documents WHERE seen_at < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def describe_earlier(match: dict) -> str:
+    """Report text for a match from an earlier batch."""
+    return f"{match['file']} (batch of {datetime.fromtimestamp(match['seen_at']):%Y-%m-%d})"
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_dedup_index() -> Optional[DedupIndex]:
+    """The index at DEDUP_PATH for matches across batches, or None when it is empty (in-batch detection only)."""
+    global _default_index
+    if not DEDUP_PATH:
+        return None
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = DedupIndex()
+    return _default_index
@@ -0,0 +1,206 @@
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+import weakref
+from contextlib import contextmanager
+from typing import BinaryIO, Union
+
+# One PDF held once for the whole pipeline: digest, text layer, Azure upload,
+# embedding and ZIP/checkpoint writes all read it through stream(), which
+# never copies the data. Backing store:
+#   - the caller's buffer (bytes, or the memoryview of a Streamlit upload),
+#   - a file (job and CLI inputs, spilled uploads, large outputs), read in
+#     chunks through the OS page cache instead of being held in the process.
+# Streams of unknown size are read into memory up to DOCUMENT_SPILL_BYTES
+# and spilled to a temp file beyond that.
+
+DOCUMENT_SPILL_BYTES = int(os.getenv("DOCUMENT_SPILL_BYTES", str(16 * 2**20)))
+
+_CHUNK = 1 << 20
+_STREAM_BUFFER = 1 << 16
+
+
+class _ViewReader(io.RawIOBase):
+    """Seekable read-only raw stream over a memoryview."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class PdfDocument:
+    """
+    Read-only PDF data with a name, backed by a buffer (`view`) or a file
+    (`path`). stream() opens a new seekable binary stream over it (close it
+    when done); len(), `digest` (sha256, computed once), save() and
+    write_to() never load a file-backed document into memory.
+    """
+
+    def __init__(self, name: str, data=None, path: str = None, temporary: bool = False):
+        self.name = name
+        self.path = None if path is None else str(path)
+        self.view = memoryview(data) if self.path is None else None
+        self._size = os.path.getsize(self.path) if self.path is not None else self.view.nbytes
+        self._digest = None
+        if temporary:
+            weakref.finalize(self, _unlink, self.path)
+
+    @classmethod
+    def from_path(cls, path, name: str = None) -> "PdfDocument":
+        return cls(name or os.path.basename(str(path)), path=path)
+
+    @classmethod
+    def from_upload(cls, upload, name: str = None, spill_bytes: int = DOCUMENT_SPILL_BYTES) -> "PdfDocument":
+        """
+        A Streamlit UploadedFile (or any BytesIO) is wrapped as is; other
+        binary streams are read, and spilled to a temp file past `spill_bytes`.
+        """
+        name = name or getattr(upload, "name", "document.pdf")
+        if hasattr(upload, "getbuffer"):
+            return cls(name, upload.getbuffer())
+
+        upload.seek(0)
+        head = upload.read(spill_bytes + 1)
+        if len(head) <= spill_bytes:
+            return cls(name, head)
+        with spill_file() as f:
+            f.write(head)
+            del head
+            shutil.copyfileobj(upload, f, _CHUNK)
+        return cls(name, path=f.name, temporary=True)
+
+    def __len__(self):
+        return self._size
+
+    def __reduce__(self):
+        # To another process: a file-backed document goes as its path (the
+        # file stays owned by this one), a buffer as a bytes copy
+        if self.view is None:
+            return (PdfDocument.from_path, (self.path, self.name))
+        return (PdfDocument, (self.name, self.view.tobytes()))
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            h = hashlib.sha256()
+            if self.view is not None:
+                h.update(self.view)
+            else:
+                with open(self.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(_CHUNK), b""):
+                        h.update(chunk)
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def stream(self) -> BinaryIO:
+        if self.view is None:
+            return open(self.path, "rb")
+        return io.BufferedReader(_ViewReader(self.view), buffer_size=_STREAM_BUFFER)
+
+    def save(self, path) -> None:
+        if self.view is None:
+            shutil.copyfile(self.path, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(self.view)
+
+    def write_to(self, out: BinaryIO) -> None:
+        """Copies the PDF into the open binary stream `out` (a file, ZipFile.open(name, "w")...)."""
+        if self.view is None:
+            with open(self.path, "rb") as f:
+                shutil.copyfileobj(f, out, _CHUNK)
+        else:
+            out.write(self.view)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def spill_file():
+    """Named temp file for a spilled document (build it with temporary=True so it is removed)."""
+    return tempfile.NamedTemporaryFile(prefix="facturx-", suffix=".pdf", delete=False)
+
+
+PdfData = Union[bytes, bytearray, memoryview, PdfDocument]
+
+
+def open_pdf(pdf: PdfData) -> BinaryIO:
+    """Binary stream over `pdf` without copying it (BytesIO shares a bytes buffer)."""
+    if isinstance(pdf, PdfDocument):
+        return pdf.stream()
+    if isinstance(pdf, bytes):
+        return io.BytesIO(pdf)
+    return io.BufferedReader(_ViewReader(memoryview(pdf)), buffer_size=_STREAM_BUFFER)
+
+
+@contextmanager
+def pdf_reader(pdf: PdfData):
+    """
+    pypdf PdfReader over `pdf`. The reader caches every object it resolves
+    and sits in reference cycles, so that cache (page images included) would
+    otherwise stay in memory until the next full garbage collection; it is
+    dropped on exit.
+    """
+    from pypdf import PdfReader
+
+    with open_pdf(pdf) as stream:
+        reader = PdfReader(stream)
+        try:
+            yield reader
+        finally:
+            reader.resolved_objects.clear()
+
+
+def drop_images(reader) -> None:
+    """Forgets the image streams `reader` has resolved so far (text extraction never needs them twice)."""
+    cache = reader.resolved_objects
+    for ref in [ref for ref, obj in cache.items() if isinstance(obj, dict) and obj.get("/Subtype") == "/Image"]:
+        del cache[ref]
+
+
+def save_pdf(pdf: PdfData, path) -> None:
+    if isinstance(pdf, PdfDocument):
+        pdf.save(path)
+    else:
+        with open(path, "wb") as f:
+            f.write(pdf)
+
+
+def zip_pdf(z, arcname: str, pdf: PdfData) -> None:
+    """ZipFile.writestr that streams a PdfDocument in chunks."""
+    if isinstance(pdf, PdfDocument):
+        with z.open(arcname, "w") as dst:
+            pdf.write_to(dst)
+    else:
+        z.writestr(arcname, pdf)
@@ -0,0 +1,245 @@
+"""
+Headless batch converter: extract -> build XML -> validate -> embed ->
+ZIP/dir from the command line. It calls the same stage functions as the
+Streamlit bulk mode (pdf_autofill, pipeline.convert_document, report) but
+runs them one stage at a time over the batch, not through bulk.run_bulk:
+no credits, checkpoints or duplicate skipping (same invoice number twice
+keeps both files), and it adds --ocr azure/text, --vat-rate and
+directory output.
+
+    python -m facturx_converter batch invoices/ -o out/ --siret ... --vat ...
+    python -m facturx_converter batch invoices/ -o out.zip --ocr text --report report.json
+
+--ocr tiered (the default when Azure keys are set) reads the PDF text layer
+first and only sends documents with missing fields to Azure.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+from pdf_autofill import (
+    extract_text_many, azure_extract_many, missing_fields, merge_tiers, format_tiers, format_shaping,
+)
+from ocr_cache import get_ocr_cache
+from text_layer import TEXT_PROCESSES
+from pipeline import convert_document, DEFAULT_VAT_RATE
+from metrics import REGISTRY, StageTimer, summarize, flush_metrics_file
+from dedup import unique_arcname
+from document import PdfData, PdfDocument, save_pdf, zip_pdf
+from report import ReportWriter, report_columns, report_format, parquet_available
+
+
+# --- OUTPUT SINKS: a directory or a single ZIP ---
+class _DirSink:
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def write(self, name: str, data: PdfData):
+        save_pdf(data, self.path / name)
+
+    def write_file(self, name: str, f):
+        with open(self.path / name, "wb") as dst:
+            shutil.copyfileobj(f, dst)
+
+    def close(self):
+        pass
+
+
+class _ZipSink:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+
+    def write(self, name: str, data: PdfData):
+        zip_pdf(self.zip, name, data)
+
+    def write_file(self, name: str, f):
+        with self.zip.open(name, "w") as dst:
+            shutil.copyfileobj(f, dst)
+
+    def close(self):
+        self.zip.close()
+
+
+def run_batch(args) -> int:
+    input_dir = Path(args.input_dir)
+    pdf_paths = sorted(p for p in input_dir.iterdir() if p.suffix.lower() == ".pdf")
+    if not pdf_paths:
+        print(f"No PDF files found in {input_dir}", file=sys.stderr)
+        return 1
+
+    try:
+        report_fmt = report_format(args.report or "report.csv")
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if report_fmt == "parquet" and not parquet_available():
+        print("Parquet reports need pyarrow (pip install pyarrow).", file=sys.stderr)
+        return 1
+
+    endpoint = os.getenv("DOCUMENTINTELLIGENCE_ENDPOINT")
+    key = os.getenv("DOCUMENTINTELLIGENCE_API_KEY")
+    ocr = args.ocr or ("tiered" if endpoint and key else "text")
+    if ocr in ("azure", "tiered") and not (endpoint and key):
+        print("AI Keys missing (DOCUMENTINTELLIGENCE_ENDPOINT / _API_KEY).", file=sys.stderr)
+        return 1
+
+    cache = None if args.no_cache else get_ocr_cache()
+    vat_rate = Decimal(args.vat_rate)
+    count = len(pdf_paths)
+
+    # Read from disk by each stage, never held in memory as a batch
+    pdfs = [PdfDocument.from_path(p) for p in pdf_paths]
+    timers = [StageTimer() for _ in pdfs]
+    batch_timer = StageTimer()
+    wall = {}
+
+    # --- Stage 1a: text layer (text / tiered; worker processes, CPU bound) ---
+    text_results = [{} for _ in pdfs]
+    if ocr in ("text", "tiered"):
+        t0 = time.perf_counter()
+        for i, result in extract_text_many(pdfs, processes=args.processes, cache=cache, timers=timers):
+            text_results[i] = result
+        wall["text_extract"] = time.perf_counter() - t0
+
+    # --- Stage 1b: Azure (threads; calls are I/O bound) ---
+    azure_results = [None] * count
+    shaping = [{} for _ in pdfs]
+    if ocr == "azure":
+        to_ocr = list(range(count))
+    elif ocr == "tiered":
+        to_ocr = [i for i in range(count) if missing_fields(text_results[i])]
+    else:
+        to_ocr = []
+    if to_ocr:
+        t0 = time.perf_counter()
+        stream = azure_extract_many(
+            [pdfs[i] for i in to_ocr], endpoint, key, max_workers=args.workers, cache=cache,
+            timers=[timers[i] for i in to_ocr], shaping=[shaping[i] for i in to_ocr],
+        )
+        for idx, result in stream:
+            azure_results[to_ocr[idx]] = result
+        wall["ocr"] = time.perf_counter() - t0
+
+    results, tiers = [], []
+    for text_data, azure_data in zip(text_results, azure_results):
+        if isinstance(azure_data, Exception) and ocr == "azure":
+            results.append(azure_data)
+            tiers.append({})
+            continue
+        if isinstance(azure_data, Exception):
+            azure_data = None
+        fields, field_tiers = merge_tiers(text_data, azure_data)
+        results.append(fields)
+        tiers.append(field_tiers)
+
+    # --- Stage 2: XML, validation, embedding, output; report rows written as we go ---
+    out = Path(args.output)
+    sink = _ZipSink(out) if out.suffix.lower() == ".zip" else _DirSink(out)
+    report_out = open(args.report, "wb") if args.report else tempfile.TemporaryFile()
+    report = ReportWriter(
+        report_out, report_fmt,
+        report_columns(metrics=batch_timer.enabled, drop=("OCR Cache", "Checkpoint")),
+    )
+    report_seconds = 0.0
+    rows = []
+    arcnames = set()
+    try:
+        for path, pdf_bytes, data, field_tiers, sent, timer in zip(pdf_paths, pdfs, results, tiers, shaping, timers):
+            row, arcname, out_pdf = convert_document(
+                path.name, pdf_bytes, data, args.siret, args.vat,
+                vat_rate=vat_rate, timer=timer,
+            )
+            row["Field Sources"] = format_tiers(field_tiers)
+            row.update(format_shaping(sent))
+            if out_pdf is not None:
+                # Same invoice number twice: keep both files
+                arcname = unique_arcname(arcname, arcnames)
+                with timer.stage("zip_write", len(out_pdf)):
+                    sink.write(arcname, out_pdf)
+            row.update(timer.columns())
+            rows.append(row)
+            t0 = time.perf_counter()
+            report.append(row)
+            report_seconds += time.perf_counter() - t0
+            if args.verbose:
+                print(f"{row['Status']:8s} {path.name}")
+
+        # --- Report ---
+        t0 = time.perf_counter()
+        nbytes = report.close()
+        if not args.report:
+            report_out.seek(0)
+            sink.write_file("report.csv", report_out)
+        batch_timer.add("report_write", report_seconds + time.perf_counter() - t0, nbytes)
+    finally:
+        report_out.close()
+        sink.close()
+
+    # --- Summary ---
+    ok = sum(1 for r in rows if r["Status"] == "SUCCESS")
+    print(f"\n{ok}/{count} converted -> {out}")
+    summary = summarize(timers + [batch_timer])
+    if summary:
+        # Concurrent stages: docs/sec is measured against wall time, not summed time
+        print(f"{'stage':14s} {'docs':>6s} {'seconds':>9s} {'mean ms':>9s} {'p95 ms':>9s} {'docs/sec':>10s}")
+        for s in summary:
+            stage = s["Stage"]
+            docs = count if stage == "report_write" else s["Docs"]
+            seconds = wall.get(stage, s["Mean (ms)"] * s["Docs"] / 1000)
+            rate = docs / seconds if seconds > 0 else float("inf")
+            print(
+                f"{stage:14s} {docs:6d} {seconds:9.3f} {s['Mean (ms)']:9.2f} {s['p95 (ms)']:9.2f} {rate:10.1f}"
+            )
+    if args.metrics:
+        REGISTRY.write(args.metrics)
+    flush_metrics_file()
+    return 0 if ok == count else 2
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="facturx_converter", description="Factur-X batch converter")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="Convert every PDF in a directory")
+    batch.add_argument("input_dir", help="Directory containing the invoice PDFs")
+    batch.add_argument("-o", "--output", required=True, help="Output directory, or a path ending in .zip")
+    batch.add_argument("--siret", required=True, help="Seller SIRET")
+    batch.add_argument("--vat", required=True, help="Seller VAT number")
+    batch.add_argument("--vat-rate", default=str(DEFAULT_VAT_RATE), help="VAT rate in %% (default: 20.00)")
+    batch.add_argument(
+        "--ocr", choices=["tiered", "azure", "text"],
+        help="Extractor (default: tiered if Azure keys are set, else text)",
+    )
+    batch.add_argument("-w", "--workers", type=int, default=4, help="Concurrent Azure extractions (default: 4)")
+    batch.add_argument(
+        "-p", "--processes", type=int, default=TEXT_PROCESSES,
+        help=f"Processes parsing text layers (default: {TEXT_PROCESSES}, the CPU count; 1 = in-process)",
+    )
+    batch.add_argument(
+        "--report", help="Report file (.csv, .xlsx, .parquet or .json); default: report.csv in the output"
+    )
+    batch.add_argument("--metrics", help="Write stage metrics (.json, else Prometheus text) to this file")
+    batch.add_argument("--no-cache", action="store_true", help="Do not use the extraction cache")
+    batch.add_argument("-v", "--verbose", action="store_true")
+    batch.set_defaults(func=run_batch)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,136 @@
+import io
 import tempfile
 from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Optional, Union
 
-from facturx.facturx import generate_from_file
+from lxml import etree
 
+from document import PdfDocument, open_pdf
 
-def embed_facturx(pdf_bytes: bytes, xml_bytes: bytes) -> bytes:
+# pypdf and factur-x are only imported when a PDF is actually embedded
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+PdfSource = Union[bytes, bytearray, memoryview, PdfDocument, BinaryIO, "PdfReader"]
+
+
+def _as_reader(pdf: PdfSource) -> "PdfReader":
+    from pypdf import PdfReader
+
+    if isinstance(pdf, PdfReader):
+        return pdf
+    return PdfReader(pdf)
+
+
+_helpers = None
+
+
+def _facturx_helpers():
+    """
+    factur-x internals used to embed in memory (tested with factur-x 7.6),
+    or None when this version does not have them: embed_facturx then goes
+    through generate_from_file.
     """
-    Takes a normal PDF bytes + Factur-X XML bytes
-    Returns a new PDF bytes with the XML embedded (Factur-X PDF/A-3).
+    global _helpers
+    if _helpers is None:
+        try:
+            from facturx.facturx import (
+                _base_info2pdf_metadata,
+                _extract_base_info,
+                _facturx_update_metadata_add_attachment,
+            )
+            _helpers = (_base_info2pdf_metadata, _extract_base_info, _facturx_update_metadata_add_attachment)
+        except ImportError:
+            print("⚠️ factur-x internals not found: embedding through generate_from_file (slower)")
+            _helpers = False
+    return _helpers or None
+
+
+def _source_bytes(pdf: PdfSource) -> bytes:
+    from pypdf import PdfReader, PdfWriter
+
+    if isinstance(pdf, PdfReader):
+        buf = io.BytesIO()
+        PdfWriter(clone_from=pdf).write(buf)
+        return buf.getvalue()
+    if isinstance(pdf, (bytes, bytearray, memoryview, PdfDocument)):
+        with open_pdf(pdf) as stream:
+            return stream.read()
+    return pdf.read()
+
+
+def embed_facturx(
+    pdf_bytes: PdfSource,
+    xml_bytes: bytes,
+    output: Optional[BinaryIO] = None,
+    check_xsd: bool = True,
+) -> Optional[bytes]:
     """
+    Takes a normal PDF (bytes, binary stream or an already-parsed PdfReader)
+    + Factur-X XML bytes.
+    Returns a new PDF bytes with the XML embedded (Factur-X PDF/A-3),
+    or writes it to `output` and returns None when a stream is given.
+    Everything happens in memory; this mirrors facturx.generate_from_file.
+    """
+    from pypdf import PdfWriter
+    from facturx.facturx import get_flavor, get_level, xml_check_xsd
+
+    helpers = _facturx_helpers()
+    if helpers is None:
+        out = embed_facturx_tempfile(_source_bytes(pdf_bytes), bytes(xml_bytes), check_xsd=check_xsd)
+        if output is not None:
+            output.write(out)
+            return None
+        return out
+    _base_info2pdf_metadata, _extract_base_info, _facturx_update_metadata_add_attachment = helpers
+
+    xml_bytes = bytes(xml_bytes)
+    xml_root = etree.fromstring(xml_bytes)
+    flavor = get_flavor(xml_root)
+    level = get_level(xml_root, flavor)
+
+    if check_xsd:
+        if level == "minimum":
+            # Same XSD, but compiled once per process
+            from validator import validate_facturx_minimum
+            validate_facturx_minimum(xml_bytes)
+        else:
+            xml_check_xsd(xml_root, flavor=flavor, level=level)
+
+    pdf_metadata = _base_info2pdf_metadata(_extract_base_info(xml_root, flavor))
+
+    # Streams we open here (over bytes or a PdfDocument) are closed once cloned
+    if isinstance(pdf_bytes, (bytes, bytearray, memoryview, PdfDocument)):
+        with open_pdf(pdf_bytes) as stream:
+            pdf_writer = PdfWriter(clone_from=_as_reader(stream))
+    else:
+        pdf_writer = PdfWriter(clone_from=_as_reader(pdf_bytes))
+    pdf_writer._header = b"%PDF-1.6"
+    _facturx_update_metadata_add_attachment(
+        pdf_writer,
+        xml_bytes,
+        pdf_metadata,
+        flavor,
+        level,
+    )
+
+    if output is not None:
+        pdf_writer.write(output)
+        return None
+
+    buf = io.BytesIO()
+    pdf_writer.write(buf)
+    return buf.getvalue()
+
+
+def embed_facturx_tempfile(pdf_bytes: bytes, xml_bytes: bytes, check_xsd: bool = True) -> bytes:
+    """
+    Legacy path: round-trips through a TemporaryDirectory and
+    generate_from_file. Kept for comparison in benchmarks, and used by
+    embed_facturx when factur-x's internals are not available.
+    """
+    from facturx.facturx import generate_from_file
+
     with tempfile.TemporaryDirectory() as tmp:
         tmp_dir = Path(tmp)
         in_pdf = tmp_dir / "in.pdf"
@@ -19,6 +141,6 @@ def embed_facturx(pdf_bytes: bytes, xml_bytes: bytes) -> bytes:
         in_xml.write_bytes(xml_bytes)
 
         # facturx library writes the output PDF file
-        generate_from_file(str(in_pdf), str(in_xml), output_pdf_file=str(out_pdf))
+        generate_from_file(str(in_pdf), str(in_xml), output_pdf_file=str(out_pdf), check_xsd=check_xsd)
 
         return out_pdf.read_bytes()
@@ -1,41 +1,49 @@
+import copy
+import threading
 from datetime import date
 from decimal import Decimal
+from typing import Iterable, Iterator, Mapping
 from lxml import etree
 
+from totals import compute_totals, compute_totals_text
 
-def build_facturx_minimum_xml(
-    *,
-    invoice_number: str,
-    invoice_date: date,
-    seller_name: str,
-    seller_siret: str,
-    seller_vat: str,
-    buyer_name: str,
-    total_ht: Decimal,
-    vat_rate_percent: Decimal,
-    buyer_siret: str = "",
-    buyer_vat: str = "",
-) -> bytes:
-    """
-    Build a Factur-X MINIMUM profile XML (strict, XSD-valid).
-    This function name is intentionally locked and MUST match app.py imports.
-    """
 
-    NSMAP = {
-        "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
-        "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
-        "udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100",
-    }
+NSMAP = {
+    "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
+    "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
+    "udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100",
+}
 
-    rsm = f"{{{NSMAP['rsm']}}}"
-    ram = f"{{{NSMAP['ram']}}}"
-    udt = f"{{{NSMAP['udt']}}}"
+_RSM = f"{{{NSMAP['rsm']}}}"
+_RAM = f"{{{NSMAP['ram']}}}"
+_UDT = f"{{{NSMAP['udt']}}}"
 
-    total_ht = Decimal(total_ht).quantize(Decimal("0.01"))
-    vat_rate_percent = Decimal(vat_rate_percent).quantize(Decimal("0.01"))
+# Variable slots of the MINIMUM skeleton, in document order
+_SLOTS = (
+    "invoice_number",
+    "invoice_date",
+    "seller_name",
+    "seller_siret",
+    "seller_vat",
+    "buyer_name",
+    "buyer_org",
+    "buyer_siret",
+    "buyer_tax",
+    "buyer_vat",
+    "total_ht",
+    "tax_total",
+    "grand_total",
+    "due_total",
+)
 
-    tax_total = (total_ht * vat_rate_percent / Decimal("100")).quantize(Decimal("0.01"))
-    grand_total = (total_ht + tax_total).quantize(Decimal("0.01"))
+
+def _build_skeleton():
+    """
+    Builds the invariant MINIMUM tree once.
+    Returns (root, index of each _SLOTS element in root.iter() order).
+    """
+    rsm, ram, udt = _RSM, _RAM, _UDT
+    slots = {}
 
     root = etree.Element(rsm + "CrossIndustryInvoice", nsmap=NSMAP)
 
@@ -54,12 +62,11 @@ def build_facturx_minimum_xml(
     # Document
     # =========================
     doc = etree.SubElement(root, rsm + "ExchangedDocument")
-    etree.SubElement(doc, ram + "ID").text = invoice_number
+    slots["invoice_number"] = etree.SubElement(doc, ram + "ID")
     etree.SubElement(doc, ram + "TypeCode").text = "380"
 
     issue_dt = etree.SubElement(doc, ram + "IssueDateTime")
-    dt_str = etree.SubElement(issue_dt, udt + "DateTimeString", format="102")
-    dt_str.text = invoice_date.strftime("%Y%m%d")
+    slots["invoice_date"] = etree.SubElement(issue_dt, udt + "DateTimeString", format="102")
 
     # =========================
     # Transaction
@@ -70,24 +77,23 @@ def build_facturx_minimum_xml(
     agr = etree.SubElement(sctt, ram + "ApplicableHeaderTradeAgreement")
 
     seller = etree.SubElement(agr, ram + "SellerTradeParty")
-    etree.SubElement(seller, ram + "Name").text = seller_name
+    slots["seller_name"] = etree.SubElement(seller, ram + "Name")
 
     seller_org = etree.SubElement(seller, ram + "SpecifiedLegalOrganization")
-    etree.SubElement(seller_org, ram + "ID").text = seller_siret
+    slots["seller_siret"] = etree.SubElement(seller_org, ram + "ID")
 
     seller_tax = etree.SubElement(seller, ram + "SpecifiedTaxRegistration")
-    etree.SubElement(seller_tax, ram + "ID", schemeID="VA").text = seller_vat
+    slots["seller_vat"] = etree.SubElement(seller_tax, ram + "ID", schemeID="VA")
 
     buyer = etree.SubElement(agr, ram + "BuyerTradeParty")
-    etree.SubElement(buyer, ram + "Name").text = buyer_name
+    slots["buyer_name"] = etree.SubElement(buyer, ram + "Name")
 
-    if buyer_siret:
-        buyer_org = etree.SubElement(buyer, ram + "SpecifiedLegalOrganization")
-        etree.SubElement(buyer_org, ram + "ID").text = buyer_siret
+    # Optional: removed per invoice when empty
+    slots["buyer_org"] = etree.SubElement(buyer, ram + "SpecifiedLegalOrganization")
+    slots["buyer_siret"] = etree.SubElement(slots["buyer_org"], ram + "ID")
 
-    if buyer_vat:
-        buyer_tax = etree.SubElement(buyer, ram + "SpecifiedTaxRegistration")
-        etree.SubElement(buyer_tax, ram + "ID", schemeID="VA").text = buyer_vat
+    slots["buyer_tax"] = etree.SubElement(buyer, ram + "SpecifiedTaxRegistration")
+    slots["buyer_vat"] = etree.SubElement(slots["buyer_tax"], ram + "ID", schemeID="VA")
 
     # Delivery (empty allowed)
     etree.SubElement(sctt, ram + "ApplicableHeaderTradeDelivery")
@@ -101,17 +107,158 @@ def build_facturx_minimum_xml(
         ram + "SpecifiedTradeSettlementHeaderMonetarySummation"
     )
 
-    etree.SubElement(summ, ram + "TaxBasisTotalAmount").text = str(total_ht)
+    slots["total_ht"] = etree.SubElement(summ, ram + "TaxBasisTotalAmount")
+    slots["tax_total"] = etree.SubElement(summ, ram + "TaxTotalAmount", currencyID="EUR")
+    slots["grand_total"] = etree.SubElement(summ, ram + "GrandTotalAmount")
+    slots["due_total"] = etree.SubElement(summ, ram + "DuePayableAmount")
+
+    order = {el: i for i, el in enumerate(root.iter())}
+    return root, tuple(order[slots[name]] for name in _SLOTS)
+
+
+# lxml trees are best not shared between threads: one skeleton per thread
+_local = threading.local()
 
-    tax_el = etree.SubElement(summ, ram + "TaxTotalAmount", currencyID="EUR")
-    tax_el.text = str(tax_total)
 
-    etree.SubElement(summ, ram + "GrandTotalAmount").text = str(grand_total)
-    etree.SubElement(summ, ram + "DuePayableAmount").text = str(grand_total)
+def _get_skeleton():
+    skeleton = getattr(_local, "skeleton", None)
+    if skeleton is None:
+        skeleton = _local.skeleton = _build_skeleton()
+    return skeleton
+
+
+def build_facturx_minimum_xml(
+    *,
+    invoice_number: str,
+    invoice_date: date,
+    seller_name: str,
+    seller_siret: str,
+    seller_vat: str,
+    buyer_name: str,
+    total_ht: Decimal,
+    vat_rate_percent: Decimal,
+    buyer_siret: str = "",
+    buyer_vat: str = "",
+    compact: bool = False,
+) -> bytes:
+    """
+    Build a Factur-X MINIMUM profile XML (strict, XSD-valid).
+    This function name is intentionally locked and MUST match app.py imports.
+    The invariant tree is prepared once; each call copies it and only fills
+    the variable fields. compact=True skips pretty-printing.
+    """
+    return _render(
+        invoice_number, invoice_date, seller_name, seller_siret, seller_vat, buyer_name, buyer_siret, buyer_vat,
+        [str(v) for v in compute_totals(total_ht, vat_rate_percent)], compact,
+    )
+
+
+def _render(
+    invoice_number, invoice_date, seller_name, seller_siret, seller_vat, buyer_name, buyer_siret, buyer_vat,
+    totals, compact,
+) -> bytes:
+    # totals: (HT, tax, TTC) as written in the XML
+    total_ht, tax_total, grand_total = totals
+
+    skeleton, slot_index = _get_skeleton()
+    root = copy.deepcopy(skeleton)
+    elements = list(root.iter())
+    (
+        el_number, el_date, el_seller_name, el_seller_siret, el_seller_vat,
+        el_buyer_name, el_buyer_org, el_buyer_siret, el_buyer_tax, el_buyer_vat,
+        el_total_ht, el_tax_total, el_grand_total, el_due_total,
+    ) = (elements[i] for i in slot_index)
+
+    el_number.text = invoice_number
+    el_date.text = invoice_date.strftime("%Y%m%d")
+    el_seller_name.text = seller_name
+    el_seller_siret.text = seller_siret
+    el_seller_vat.text = seller_vat
+    el_buyer_name.text = buyer_name
+
+    if buyer_siret:
+        el_buyer_siret.text = buyer_siret
+    else:
+        el_buyer_org.getparent().remove(el_buyer_org)
+
+    if buyer_vat:
+        el_buyer_vat.text = buyer_vat
+    else:
+        el_buyer_tax.getparent().remove(el_buyer_tax)
+
+    el_total_ht.text = total_ht
+    el_tax_total.text = tax_total
+    el_grand_total.text = grand_total
+    el_due_total.text = grand_total
 
     return etree.tostring(
         root,
         xml_declaration=True,
         encoding="UTF-8",
-        pretty_print=True,
+        pretty_print=not compact,
     )
+
+
+# --- BATCH API ---
+_FIELDS = (
+    "invoice_number",
+    "invoice_date",
+    "seller_name",
+    "seller_siret",
+    "seller_vat",
+    "buyer_name",
+    "total_ht",
+    "vat_rate_percent",
+    "buyer_siret",
+    "buyer_vat",
+)
+_OPTIONAL = ("buyer_siret", "buyer_vat")
+
+
+def _iter_records(records) -> Iterator[Mapping]:
+    # pandas DataFrame: stream rows without materialising a list of dicts
+    if hasattr(records, "itertuples") and hasattr(records, "columns"):
+        columns = list(records.columns)
+        for values in records.itertuples(index=False, name=None):
+            yield dict(zip(columns, values))
+    else:
+        yield from records
+
+
+def build_facturx_minimum_xml_many(records: Iterable, compact: bool = False) -> Iterator[bytes]:
+    """
+    Yields one MINIMUM XML per invoice record (mapping or DataFrame row)
+    whose keys are the build_facturx_minimum_xml arguments. Missing or
+    NaN buyer_siret/buyer_vat are treated as empty.
+    For a DataFrame, totals are computed for the whole columns at once
+    (totals.compute_totals_text: same text as row by row).
+    """
+    totals = _column_totals(records)
+    for i, record in enumerate(_iter_records(records)):
+        kwargs = {}
+        for name in _FIELDS:
+            value = record.get(name)
+            if name in _OPTIONAL and (value is None or value != value):
+                value = ""
+            kwargs[name] = value
+        if totals is None:
+            yield build_facturx_minimum_xml(compact=compact, **kwargs)
+            continue
+        yield _render(
+            kwargs["invoice_number"], kwargs["invoice_date"], kwargs["seller_name"], kwargs["seller_siret"],
+            kwargs["seller_vat"], kwargs["buyer_name"], kwargs["buyer_siret"], kwargs["buyer_vat"],
+            totals[i], compact,
+        )
+
+
+def _column_totals(records):
+    """Totals of every DataFrame row, or None (not a DataFrame, or a column the batch path cannot read)."""
+    if not (hasattr(records, "itertuples") and hasattr(records, "columns")):
+        return None
+    if "total_ht" not in records.columns or "vat_rate_percent" not in records.columns:
+        return None
+    try:
+        return compute_totals_text(records["total_ht"].to_numpy(), records["vat_rate_percent"].to_numpy())
+    except (ValueError, TypeError, ArithmeticError):
+        # Row by row instead: the error, if any, is raised at its row
+        return None
@@ -0,0 +1,493 @@
+"""
+SQLite-backed job queue for bulk batches, run by worker processes so a
+Streamlit rerun or refresh never interrupts a batch.
+
+    job_id = submit_job(owner, [(name, pdf_bytes), ...], {...})
+    get_job(job_id)  # status, stage, done/total, bundle path when done
+    get_job_documents(job_id)  # rows (and converted PDFs) finished so far
+
+Workers: start_workers(n) from the app (started once per process), or a
+separate service with `python -m jobs worker -n 4`. AZURE_TPS is split
+between the processes started together; a separate service and the app
+each need their own AZURE_TPS, adding up to the tier's. Each worker saves its
+stage metrics under JOBS_DIR/metrics, and any process importing this
+module reports them with its own (/metrics, PIPELINE_METRICS_FILE).
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from document import PdfDocument, save_pdf
+from metrics import METRICS_ENABLED, REGISTRY, add_metrics_source
+
+JOBS_DIR = os.getenv("JOBS_DIR", ".cache/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+# A running job whose worker has not reported for this long is requeued
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+# stop_workers waits this long for current jobs before killing the workers (0: no limit)
+JOB_STOP_TIMEOUT = float(os.getenv("JOB_STOP_TIMEOUT", "0"))
+# Workers save their metrics at least this often (a file older than JOB_STALE_SECONDS is a dead worker's)
+METRICS_SAVE_SECONDS = 5
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _connect() -> sqlite3.Connection:
+    Path(JOBS_DIR).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(JOBS_DIR, "jobs.sqlite3"), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " owner TEXT NOT NULL,"
+        " status TEXT NOT NULL,"
+        " params TEXT NOT NULL,"
+        " total INTEGER NOT NULL,"
+        " stage TEXT,"
+        " done INTEGER NOT NULL DEFAULT 0,"
+        " stage_total INTEGER NOT NULL DEFAULT 0,"
+        " message TEXT,"
+        " credits_reserved INTEGER NOT NULL DEFAULT 0,"
+        " credits_used INTEGER,"
+        " result TEXT,"
+        " error TEXT,"
+        " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+        " worker_pid INTEGER,"
+        " created_at REAL NOT NULL,"
+        " started_at REAL,"
+        " heartbeat_at REAL,"
+        " finished_at REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+    # One row per archived document, written while the job runs
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS job_documents ("
+        " job_id TEXT NOT NULL,"
+        " idx INTEGER NOT NULL,"
+        " row TEXT NOT NULL,"
+        " arcname TEXT,"
+        " PRIMARY KEY (job_id, idx))"
+    )
+    return conn
+
+
+def job_dir(job_id: str) -> Path:
+    return Path(JOBS_DIR) / job_id
+
+
+def bundle_path(job_id: str) -> Path:
+    return job_dir(job_id) / "batch_output.zip"
+
+
+def document_path(job_id: str, index: int) -> Path:
+    """Converted PDF of the index-th input file (see get_job_documents)."""
+    return job_dir(job_id) / "out" / f"{index:05d}.pdf"
+
+
+def metrics_path(pid: int) -> Path:
+    return Path(JOBS_DIR) / "metrics" / f"{pid}.json"
+
+
+def worker_metrics() -> list:
+    """Metrics snapshots saved by the worker processes (other than this one)."""
+    snapshots = []
+    for path in metrics_path(0).parent.glob("*.json"):
+        if path.stem == str(os.getpid()):
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            pass
+    return snapshots
+
+
+add_metrics_source(worker_metrics)
+
+
+def _save_metrics():
+    if not METRICS_ENABLED:
+        return
+    path = metrics_path(os.getpid())
+    path.parent.mkdir(exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(REGISTRY.snapshot()))
+    os.replace(tmp, path)
+
+
+def _row(row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+# --- CLIENT SIDE (Streamlit) ---
+def submit_job(owner: str, files, params: dict, credits_reserved: int = 0) -> str:
+    """
+    Stores the input PDFs under JOBS_DIR/<id>/in and queues the job.
+    `params` are passed to bulk.run_bulk (seller_siret, seller_vat, tiered, credits...);
+    with resume=False the job runs without checkpoints.
+    """
+    job_id = uuid.uuid4().hex
+    in_dir = job_dir(job_id) / "in"
+    in_dir.mkdir(parents=True)
+    names = []
+    for i, (name, pdf_bytes) in enumerate(files):
+        save_pdf(pdf_bytes, in_dir / f"{i:05d}.pdf")
+        names.append(name)
+
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, owner, status, params, total, credits_reserved, created_at)"
+            " VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, owner, json.dumps({**params, "names": names}), len(names), credits_reserved, time.time()),
+        )
+    finally:
+        conn.close()
+    return job_id
+
+
+def get_job(job_id: str):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _row(row) if row else None
+
+
+def get_job_documents(job_id: str) -> list:
+    """
+    Documents the job has finished so far, in upload order: dicts with
+    index, row (the report row) and arcname (None when nothing was
+    converted; else the PDF is at document_path(job_id, index)).
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT idx, row, arcname FROM job_documents WHERE job_id = ? ORDER BY idx", (job_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"index": r["idx"], "row": json.loads(r["row"]), "arcname": r["arcname"]} for r in rows]
+
+
+def list_jobs(owner: str, limit: int = 20) -> list:
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?", (owner, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [_row(r) for r in rows]
+
+
+def cancel_job(job_id: str):
+    """Queued jobs are cancelled at once, running ones within about a second."""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = CASE status WHEN 'queued' THEN 'cancelled' ELSE status END,"
+            " cancel_requested = 1, finished_at = CASE status WHEN 'queued' THEN ? ELSE finished_at END"
+            " WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+    finally:
+        conn.close()
+
+
+def failed_files(job) -> list:
+    """(name, PdfDocument) of the FAILED/ERROR rows of a finished job, from its report rows."""
+    in_dir = job_dir(job["id"]) / "in"
+    rows = (job["result"] or {}).get("rows", [])
+    return [
+        (row["File"], PdfDocument.from_path(in_dir / f"{i:05d}.pdf", row["File"]))
+        for i, row in enumerate(rows)
+        if row["Status"] in ("FAILED", "ERROR")
+    ]
+
+
+def delete_job(job_id: str):
+    """Removes a finished job and its files."""
+    conn = _connect()
+    try:
+        if conn.execute(
+            "DELETE FROM jobs WHERE id = ? AND status NOT IN ('queued', 'running')", (job_id,)
+        ).rowcount:
+            conn.execute("DELETE FROM job_documents WHERE job_id = ?", (job_id,))
+    finally:
+        conn.close()
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+# --- WORKER SIDE ---
+def _claim_next(conn: sqlite3.Connection):
+    """Atomically takes the oldest queued (or stale running) job."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # A dead worker's job that was being cancelled is not rerun: it ends as cancelled,
+        # with the credits its worker last reported
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', credits_used = COALESCE(credits_used, 0), finished_at = ?"
+            " WHERE status = 'running' AND heartbeat_at < ? AND cancel_requested = 1",
+            (now, now - JOB_STALE_SECONDS),
+        )
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued'"
+            " OR (status = 'running' AND heartbeat_at < ? AND cancel_requested = 0)"
+            " ORDER BY created_at LIMIT 1",
+            (now - JOB_STALE_SECONDS,),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, heartbeat_at = ?,"
+            " stage = NULL, done = 0, stage_total = 0, message = NULL WHERE id = ?",
+            (os.getpid(), now, now, row["id"]),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row["id"]
+
+
+def _purge_expired(conn: sqlite3.Connection):
+    cutoff = time.time() - JOB_TTL
+    expired = conn.execute(
+        "SELECT id FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?", (cutoff,)
+    ).fetchall()
+    for row in expired:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        conn.execute("DELETE FROM job_documents WHERE job_id = ?", (row["id"],))
+        shutil.rmtree(job_dir(row["id"]), ignore_errors=True)
+    # Metrics of workers that died without removing them
+    for path in metrics_path(0).parent.glob("*.json"):
+        try:
+            if path.stat().st_mtime < time.time() - JOB_STALE_SECONDS:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def run_job(
+    job_id: str, conn: sqlite3.Connection, endpoint: str = None, key: str = None, cache=None, checkpoints=None,
+    dedup_index=None,
+):
+    from bulk import run_bulk
+
+    job = _row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    params = dict(job["params"])
+    names = params.pop("names")
+    if not params.pop("resume", True):
+        checkpoints = None
+    in_dir = job_dir(job_id) / "in"
+    # Read from disk as each stage needs them: a batch never has to fit in RAM
+    files = [(name, PdfDocument.from_path(in_dir / f"{i:05d}.pdf", name)) for i, name in enumerate(names)]
+
+    # A requeued job starts over, but what its dead worker spent stays spent
+    conn.execute("DELETE FROM job_documents WHERE job_id = ?", (job_id,))
+    spent = job["credits_used"] or 0
+    usage = {"credits_used": 0}
+    document_path(job_id, 0).parent.mkdir(exist_ok=True)
+
+    def on_document(index, row, arcname, out_pdf):
+        # Visible to the app (and downloadable) before the batch ends
+        if out_pdf is not None:
+            save_pdf(out_pdf, document_path(job_id, index))
+        conn.execute(
+            "INSERT OR REPLACE INTO job_documents (job_id, idx, row, arcname) VALUES (?, ?, ?, ?)",
+            (job_id, index, json.dumps(row, default=str), arcname if out_pdf is not None else None),
+        )
+
+    last_write, last_metrics = [0.0], [time.time()]
+
+    def progress(stage, done, total, message):
+        now = time.time()
+        if now - last_metrics[0] >= METRICS_SAVE_SECONDS:
+            _save_metrics()
+            last_metrics[0] = now
+        # Throttled: at most ~4 writes/s, plus every stage change
+        if now - last_write[0] < 0.25 and done not in (0, total):
+            return
+        last_write[0] = now
+        conn.execute(
+            "UPDATE jobs SET stage = ?, done = ?, stage_total = ?, message = COALESCE(?, message), heartbeat_at = ?,"
+            " credits_used = ? WHERE id = ?",
+            (stage, done, total, message, now, spent + usage["credits_used"], job_id),
+        )
+        if conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]:
+            raise JobCancelled()
+
+    partial = bundle_path(job_id).with_suffix(".zip.part")
+    try:
+        with open(partial, "wb") as out:
+            result = run_bulk(
+                files, out=out, endpoint=endpoint, key=key, cache=cache,
+                progress=progress, checkpoints=checkpoints, dedup_index=dedup_index, on_document=on_document,
+                usage=usage, **params,
+            )
+        os.replace(partial, bundle_path(job_id))
+        conn.execute(
+            "UPDATE jobs SET status = 'done', credits_used = ?, result = ?, finished_at = ?,"
+            " message = NULL WHERE id = ?",
+            (spent + result["credits_used"], json.dumps(result, default=str), time.time(), job_id),
+        )
+    except JobCancelled:
+        partial.unlink(missing_ok=True)
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', credits_used = ?, finished_at = ? WHERE id = ?",
+            (spent + usage["credits_used"], time.time(), job_id),
+        )
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        print(f"Job {job_id} failed: {e}")
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (str(e), time.time(), job_id),
+        )
+
+
+def worker_loop(endpoint: str = None, key: str = None, poll_seconds: float = 0.5, stop=None):
+    """Claims and runs jobs until `stop` (a threading.Event) is set."""
+    from ocr_cache import get_ocr_cache
+    from checkpoints import get_checkpoint_store
+    from dedup import get_dedup_index
+
+    endpoint = endpoint or os.getenv("DOCUMENTINTELLIGENCE_ENDPOINT")
+    key = key or os.getenv("DOCUMENTINTELLIGENCE_API_KEY")
+    cache = get_ocr_cache()
+    checkpoints = get_checkpoint_store()
+    dedup_index = get_dedup_index()
+    conn = _connect()
+    last_purge = last_metrics = 0.0
+    try:
+        while stop is None or not stop.is_set():
+            if time.time() - last_purge > 600:
+                _purge_expired(conn)
+                checkpoints.purge_expired()
+                if dedup_index is not None:
+                    dedup_index.purge_expired()
+                last_purge = time.time()
+            if time.time() - last_metrics > METRICS_SAVE_SECONDS:
+                _save_metrics()
+                last_metrics = time.time()
+            job_id = _claim_next(conn)
+            if job_id is None:
+                time.sleep(poll_seconds)
+                continue
+            run_job(job_id, conn, endpoint, key, cache, checkpoints, dedup_index)
+            _save_metrics()
+            last_metrics = time.time()
+    finally:
+        metrics_path(os.getpid()).unlink(missing_ok=True)
+
+
+# --- WORKER PROCESSES ---
+# Plain `python -m jobs worker` subprocesses rather than multiprocessing:
+# Streamlit replaces __main__ with the app script, which spawn would re-run.
+_workers = []
+
+
+def start_workers(count: int = JOB_WORKERS, endpoint: str = None, key: str = None, calls_azure: bool = True):
+    """
+    Starts `count` worker processes once per process (no-op when count is 0).
+    Every process has its own Azure limiter, so AZURE_TPS is split between
+    the workers and, when `calls_azure` (the app: single mode), this process.
+    """
+    if _workers or count <= 0:
+        return _workers
+    from rate_limiter import AZURE_TPS, set_process_tps
+    from text_layer import TEXT_PROCESSES
+
+    env = dict(os.environ, JOBS_DIR=os.path.abspath(JOBS_DIR))
+    share = AZURE_TPS / (count + 1 if calls_azure else count)
+    env["AZURE_TPS"] = str(share)
+    if calls_azure:
+        set_process_tps(share)
+    # ...and the CPUs between their text-layer worker pools
+    env["TEXT_PROCESSES"] = str(max(1, TEXT_PROCESSES // count))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]))
+    if endpoint and key:
+        env["DOCUMENTINTELLIGENCE_ENDPOINT"] = endpoint
+        env["DOCUMENTINTELLIGENCE_API_KEY"] = key
+    for _ in range(count):
+        _workers.append(subprocess.Popen([sys.executable, "-m", "jobs", "worker", "-n", "1"], env=env))
+    atexit.register(stop_workers)
+    return _workers
+
+
+def stop_workers(timeout: float = None):
+    """
+    Workers finish their current job, then exit. After `timeout` seconds
+    (default JOB_STOP_TIMEOUT; 0 or None: no limit) the rest are killed,
+    and their jobs are requeued once stale.
+    """
+    if timeout is None:
+        timeout = JOB_STOP_TIMEOUT
+    deadline = time.monotonic() + timeout if timeout else None
+    for proc in _workers:
+        proc.terminate()
+    for proc in _workers:
+        try:
+            proc.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    _workers.clear()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="jobs", description="Bulk job workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="Run worker processes until interrupted")
+    worker.add_argument("-n", "--workers", type=int, default=max(JOB_WORKERS, 1))
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    if args.workers > 1:
+        start_workers(args.workers, calls_azure=False)
+        print(f"{args.workers} workers on {JOBS_DIR}")
+        try:
+            for proc in _workers:
+                proc.wait()
+        except KeyboardInterrupt:
+            stop_workers()
+        return 0
+
+    # Single worker: SIGTERM stops it after the current job
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    try:
+        worker_loop(stop=stop)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
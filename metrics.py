@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+# Per-stage timing for the conversion pipeline.
+# StageTimer: durations/bytes for one document (-> report columns).
+# REGISTRY: process-wide aggregates (-> Prometheus text / JSON file or endpoint).
+# Other processes (the job workers) are added through add_metrics_source.
+# PIPELINE_METRICS=0 turns everything into no-ops.
+
+STAGES = ("ocr", "text_extract", "xml_build", "validate", "embed", "zip_write", "report_write")
+
+METRICS_ENABLED = os.getenv("PIPELINE_METRICS", "1") != "0"
+METRICS_FILE = os.getenv("PIPELINE_METRICS_FILE")
+METRICS_PORT = int(os.getenv("PIPELINE_METRICS_PORT", "0"))
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class MetricsRegistry:
+    """Thread-safe histogram of seconds and byte counters per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._docs = {}
+
+    def observe(self, stage: str, seconds: float, nbytes: int = None):
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is None:
+                s = self._stages[stage] = {"count": 0, "sum": 0.0, "bytes": 0, "buckets": [0] * len(_BUCKETS)}
+            s["count"] += 1
+            s["sum"] += seconds
+            if nbytes:
+                s["bytes"] += nbytes
+            for i, bound in enumerate(_BUCKETS):
+                if seconds <= bound:
+                    s["buckets"][i] += 1
+                    break
+
+    def count_document(self, status: str):
+        with self._lock:
+            self._docs[status] = self._docs.get(status, 0) + 1
+
+    def merge(self, snapshot: dict):
+        """Adds another registry's snapshot() (e.g. from another process)."""
+        with self._lock:
+            for name, other in snapshot.get("stages", {}).items():
+                s = self._stages.get(name)
+                if s is None:
+                    s = self._stages[name] = {"count": 0, "sum": 0.0, "bytes": 0, "buckets": [0] * len(_BUCKETS)}
+                s["count"] += other["count"]
+                s["sum"] += other["sum"]
+                s["bytes"] += other["bytes"]
+                s["buckets"] = [a + b for a, b in zip(s["buckets"], other["buckets"])]
+            for status, n in snapshot.get("documents", {}).items():
+                self._docs[status] = self._docs.get(status, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {**s, "buckets": list(s["buckets"])} for name, s in self._stages.items()
+                },
+                "documents": dict(self._docs),
+            }
+
+    def to_json(self) -> str:
+        snap = self.snapshot()
+        for s in snap["stages"].values():
+            s["buckets"] = dict(zip([str(b) for b in _BUCKETS], s["buckets"]))
+        return json.dumps(snap, indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        out = [
+            "# HELP facturx_stage_seconds Time spent per pipeline stage and document.",
+            "# TYPE facturx_stage_seconds histogram",
+        ]
+        for name, s in snap["stages"].items():
+            cumulative = 0
+            for bound, n in zip(_BUCKETS, s["buckets"]):
+                cumulative += n
+                out.append(f'facturx_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            out.append(f'facturx_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s["count"]}')
+            out.append(f'facturx_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            out.append(f'facturx_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        out += [
+            "# HELP facturx_stage_bytes_total Bytes handled per pipeline stage.",
+            "# TYPE facturx_stage_bytes_total counter",
+        ]
+        out += [f'facturx_stage_bytes_total{{stage="{n}"}} {s["bytes"]}' for n, s in snap["stages"].items()]
+        out += [
+            "# HELP facturx_documents_total Documents processed, by status.",
+            "# TYPE facturx_documents_total counter",
+        ]
+        out += [f'facturx_documents_total{{status="{k}"}} {v}' for k, v in snap["documents"].items()]
+        return "\n".join(out) + "\n"
+
+    def write(self, path: str):
+        """Writes Prometheus text (.prom/.txt) or JSON (.json), atomically."""
+        body = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._docs.clear()
+
+
+REGISTRY = MetricsRegistry()
+_sources = []
+
+
+def add_metrics_source(source):
+    """`source()` returns snapshots of other processes' registries, added to the endpoint and file."""
+    if source not in _sources:
+        _sources.append(source)
+
+
+def combined_registry() -> MetricsRegistry:
+    """REGISTRY plus every registered source."""
+    combined = MetricsRegistry()
+    combined.merge(REGISTRY.snapshot())
+    for source in _sources:
+        for snapshot in source():
+            combined.merge(snapshot)
+    return combined
+
+
+class _Span:
+    __slots__ = ("timer", "name", "nbytes", "t0")
+
+    def __init__(self, timer, name, nbytes):
+        self.timer, self.name, self.nbytes = timer, name, nbytes
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.t0, self.nbytes)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ("nbytes",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class StageTimer:
+    """
+    Collects seconds and byte sizes per stage for one document.
+    Usage: `with timer.stage("embed") as span: ...; span.nbytes = len(out)`.
+    """
+
+    __slots__ = ("enabled", "seconds", "bytes")
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = METRICS_ENABLED if enabled is None else enabled
+        self.seconds = {}
+        self.bytes = {}
+
+    def stage(self, name: str, nbytes: int = None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, nbytes)
+
+    def add(self, name: str, seconds: float, nbytes: int = None):
+        if not self.enabled:
+            return
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if nbytes is not None:
+            self.bytes[name] = self.bytes.get(name, 0) + nbytes
+        REGISTRY.observe(name, seconds, nbytes)
+
+    def columns(self) -> dict:
+        """Report columns: '<stage>_ms' and '<stage>_bytes', in STAGES order."""
+        cols = {}
+        for name in STAGES:
+            if name in self.seconds:
+                cols[f"{name}_ms"] = round(self.seconds[name] * 1000, 2)
+            if name in self.bytes:
+                cols[f"{name}_bytes"] = self.bytes[name]
+        return cols
+
+
+def summarize(timers: Iterable[StageTimer]) -> list:
+    """Per-stage batch summary rows (docs, total s, mean/p95/max ms, MB)."""
+    per_stage = {}
+    total_bytes = {}
+    for t in timers:
+        for name, seconds in t.seconds.items():
+            per_stage.setdefault(name, []).append(seconds)
+        for name, nbytes in t.bytes.items():
+            total_bytes[name] = total_bytes.get(name, 0) + nbytes
+
+    rows = []
+    for name in [s for s in STAGES if s in per_stage] + [s for s in per_stage if s not in STAGES]:
+        values = sorted(per_stage[name])
+        rows.append({
+            "Stage": name,
+            "Docs": len(values),
+            "Total (s)": round(sum(values), 3),
+            "Mean (ms)": round(sum(values) / len(values) * 1000, 2),
+            "p95 (ms)": round(values[min(len(values) - 1, int(0.95 * len(values)))] * 1000, 2),
+            "Max (ms)": round(values[-1] * 1000, 2),
+            "MB": round(total_bytes.get(name, 0) / 2**20, 2),
+        })
+    return rows
+
+
+def flush_metrics_file():
+    """
+    Writes the metrics to PIPELINE_METRICS_FILE, if configured.
+    "{pid}" in the path gives each process its own file (this process only);
+    without it, the file has the totals of every process.
+    """
+    if not METRICS_ENABLED or not METRICS_FILE:
+        return
+    if "{pid}" in METRICS_FILE:
+        REGISTRY.write(METRICS_FILE.format(pid=os.getpid()))
+    else:
+        combined_registry().write(METRICS_FILE)
+
+
+# --- Optional /metrics endpoint (PIPELINE_METRICS_PORT) ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = combined_registry().to_json().encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = combined_registry().to_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serves /metrics (Prometheus) and /metrics.json once per process (with the sources' metrics)."""
+    global _server
+    if not METRICS_ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
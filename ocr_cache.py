@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+from document import PdfDocument
+
+# Content-addressed cache for extraction results.
+# Key = SHA-256 of the PDF bytes + model id ("prebuilt-invoice", text regex...).
+# Tier 1: in-memory LRU. Tier 2: SQLite file, with TTL and max-entries eviction.
+
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", ".cache/ocr_cache.sqlite3")
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(30 * 24 * 3600)))
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "256"))
+OCR_CACHE_DISK_ITEMS = int(os.getenv("OCR_CACHE_DISK_ITEMS", "20000"))
+# Reads only note accessed_at; it is written with the next put, or every
+# OCR_CACHE_TOUCH_SECONDS, in one transaction (reads are not writes)
+OCR_CACHE_TOUCH_SECONDS = float(os.getenv("OCR_CACHE_TOUCH_SECONDS", "60"))
+
+
+def pdf_digest(pdf_bytes) -> str:
+    """sha256 of bytes, a memoryview or a PdfDocument (whose digest is computed once)."""
+    if isinstance(pdf_bytes, PdfDocument):
+        return pdf_bytes.digest
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+# --- HELPER: dates survive the JSON round-trip ---
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Cannot cache value of type {type(value)}")
+
+
+def _decode(obj):
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"][:10])
+    return obj
+
+
+def dumps_fields(fields: dict) -> str:
+    return json.dumps(fields, default=_encode)
+
+
+def loads_fields(text: str) -> dict:
+    return json.loads(text, object_hook=_decode)
+
+
+class OCRCache:
+    """
+    Two-tier cache of extraction results (dict of fields). One lock covers
+    both tiers and the SQLite connection. Pass path=None for a memory-only
+    cache.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = OCR_CACHE_PATH,
+        ttl_seconds: int = OCR_CACHE_TTL,
+        max_memory_items: int = OCR_CACHE_MEMORY_ITEMS,
+        max_disk_items: int = OCR_CACHE_DISK_ITEMS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # (digest, model_id) -> (stored_at, fields)
+        self._touched = {}  # (digest, model_id) -> accessed_at not written yet
+        self._last_touch_write = time.time()
+        self._db = None
+
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # The app, the CLI and every job worker open this same file
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " digest TEXT NOT NULL,"
+                " model_id TEXT NOT NULL,"
+                " fields TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (digest, model_id))"
+            )
+            self._db.commit()
+
+    def get(self, digest: str, model_id: str) -> Optional[dict]:
+        key = (digest, model_id)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, fields = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._touch(key, now)
+                    return dict(fields)
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+
+            row = self._db.execute(
+                "SELECT fields, stored_at FROM ocr_cache WHERE digest = ? AND model_id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._db.execute(
+                    "DELETE FROM ocr_cache WHERE digest = ? AND model_id = ?", key
+                )
+                self._db.commit()
+                return None
+
+            self._touch(key, now)
+            fields = loads_fields(row[0])
+            self._remember(key, row[1], fields)
+            return dict(fields)
+
+    def put(self, digest: str, model_id: str, fields: dict) -> None:
+        if not fields:
+            # Never cache empty results: they are usually transient failures
+            return
+        key = (digest, model_id)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, dict(fields))
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO ocr_cache VALUES (?, ?, ?, ?, ?)",
+                (digest, model_id, dumps_fields(fields), now, now),
+            )
+            self._touched.pop(key, None)
+            self._write_touches(now)
+            self._evict_disk(now)
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM ocr_cache")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._write_touches(time.time())
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _touch(self, key, now):
+        if self._db is None:
+            return
+        self._touched[key] = now
+        if now - self._last_touch_write >= OCR_CACHE_TOUCH_SECONDS:
+            self._write_touches(now)
+            self._db.commit()
+
+    def _write_touches(self, now):
+        # Part of the caller's transaction
+        if self._touched:
+            self._db.executemany(
+                "UPDATE ocr_cache SET accessed_at = ? WHERE digest = ? AND model_id = ?",
+                [(t, *key) for key, t in self._touched.items()],
+            )
+            self._touched.clear()
+        self._last_touch_write = now
+
+    def _remember(self, key, stored_at, fields):
+        self._memory[key] = (stored_at, fields)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute(
+            "DELETE FROM ocr_cache WHERE stored_at < ?", (now - self.ttl_seconds,)
+        )
+        self._db.execute(
+            "DELETE FROM ocr_cache WHERE rowid IN ("
+            " SELECT rowid FROM ocr_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_items,),
+        )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """The cache at OCR_CACHE_PATH, opened on first use: one connection per process."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = OCRCache()
+    return _default_cache
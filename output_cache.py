@@ -0,0 +1,134 @@
+import io
+import os
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from lxml import etree
+
+from document import PdfData
+from ocr_cache import pdf_digest
+from validator import validate_facturx_minimum
+from facturx_engine import embed_facturx
+from report import ReportWriter
+
+# Memoized single-invoice generation: validate + embed + audit sheet + ZIP
+# are only redone when their inputs change.
+#   ("pdf", pdf digest, xml digest)             -> embedded Factur-X PDF
+#   ("bundle", pdf digest, xml digest, audit)   -> ZIP of that PDF + audit sheet
+# The XML digest is taken over its canonical (C14N) form, so any invoice
+# field change gives a new key and stale entries simply age out.
+# In memory only, LRU, bounded by OUTPUT_CACHE_BYTES and OUTPUT_CACHE_ITEMS.
+
+OUTPUT_CACHE_BYTES = int(os.getenv("OUTPUT_CACHE_BYTES", str(128 * 2**20)))
+OUTPUT_CACHE_ITEMS = int(os.getenv("OUTPUT_CACHE_ITEMS", "64"))
+
+
+def xml_digest(xml: bytes) -> str:
+    """sha256 of the canonical XML (declaration, quoting and attribute order do not matter)."""
+    return hashlib.sha256(etree.tostring(etree.fromstring(xml), method="c14n")).hexdigest()
+
+
+def _rows_digest(rows) -> str:
+    return hashlib.sha256(repr([(str(k), str(v)) for k, v in rows]).encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """
+    LRU of generated files (bytes) by key tuple, within a byte and an item
+    budget; an entry larger than the whole budget is not kept. Every call
+    takes the instance lock.
+    """
+
+    def __init__(self, max_bytes: int = OUTPUT_CACHE_BYTES, max_items: int = OUTPUT_CACHE_ITEMS):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes or len(self._entries) > self.max_items:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def generate_bundle(pdf: PdfData, xml: bytes, audit_rows, pdf_name: str, cache: OutputCache = None):
+    """
+    Validates `xml`, embeds it into `pdf` and zips the result as `pdf_name`
+    with audit_report.xlsx (`audit_rows`: (field, value) pairs).
+    Returns (out_pdf, bundle, from_cache); from_cache is True when the
+    bundle was served without any of that work.
+    Raises the validation/embedding error, which is never cached.
+    """
+    audit_rows = list(audit_rows)
+    pdf_key = ("pdf", pdf_digest(pdf), xml_digest(xml))
+    bundle_key = ("bundle",) + pdf_key[1:] + (pdf_name, _rows_digest(audit_rows))
+
+    out_pdf = cache.get(pdf_key) if cache is not None else None
+    bundle = cache.get(bundle_key) if cache is not None and out_pdf is not None else None
+    if bundle is not None:
+        return out_pdf, bundle, True
+
+    if out_pdf is None:
+        validate_facturx_minimum(xml)
+        out_pdf = embed_facturx(pdf, xml, check_xsd=False)
+        if cache is not None:
+            cache.put(pdf_key, out_pdf)
+
+    excel_buf = io.BytesIO()
+    with ReportWriter(excel_buf, "xlsx", columns=("Field", "Value"), sheet_name="Summary") as audit:
+        for field, value in audit_rows:
+            audit.append({"Field": field, "Value": value})
+    zip_buf = io.BytesIO()
+    with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(pdf_name, out_pdf)
+        z.writestr("audit_report.xlsx", excel_buf.getvalue())
+    bundle = zip_buf.getvalue()
+    if cache is not None:
+        cache.put(bundle_key, bundle)
+    return out_pdf, bundle, False
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_output_cache() -> OutputCache:
+    """The single-mode bundle cache, created on first use and read by every Streamlit session."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = OutputCache()
+    return _default_cache
@@ -1,16 +1,57 @@
 import io
-import re
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, date
-from pypdf import PdfReader
+from decimal import Decimal, InvalidOperation
+from types import SimpleNamespace
 
-# --- IMPORTS: We use the standard library now ---
-try:
-    from azure.core.credentials import AzureKeyCredential
-    from azure.ai.formrecognizer import DocumentAnalysisClient
-    AZURE_AVAILABLE = True
-except ImportError:
-    AZURE_AVAILABLE = False
-    print("⚠️ Azure library not found. Run: pip install azure-ai-formrecognizer")
+from ocr_cache import pdf_digest
+from document import PdfData, open_pdf, pdf_reader
+from text_layer import scan_fields, scan_many, patterns_version
+from rate_limiter import get_azure_limiter, retry_after_seconds, AZURE_MAX_RETRIES
+
+# Model ids used as part of the extraction cache key
+AZURE_MODEL_ID = "prebuilt-invoice"
+TEXT_MODEL_ID = "text-regex-v2"
+
+# --- IMPORTS: the Azure SDK is loaded on the first OCR call, not at import ---
+_azure = None
+
+
+def _load_azure():
+    """Returns the Azure SDK classes we use, or None when it is not installed."""
+    global _azure
+    if _azure is None:
+        try:
+            import requests
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.exceptions import HttpResponseError
+            from azure.core.pipeline.policies import RetryPolicy
+            from azure.core.pipeline.transport import RequestsTransport
+            from azure.ai.formrecognizer import DocumentAnalysisClient
+
+            class AnalyzeRetryPolicy(RetryPolicy):
+                """azure-core's retries, except 429 on analyze POSTs: _analyze retries those through the limiter."""
+
+                def is_retry(self, settings, response):
+                    if response.http_response.status_code == 429 and response.http_request.method == "POST":
+                        return False
+                    return super().is_retry(settings, response)
+
+            _azure = SimpleNamespace(
+                requests=requests,
+                AzureKeyCredential=AzureKeyCredential,
+                HttpResponseError=HttpResponseError,
+                RequestsTransport=RequestsTransport,
+                AnalyzeRetryPolicy=AnalyzeRetryPolicy,
+                DocumentAnalysisClient=DocumentAnalysisClient,
+            )
+        except ImportError:
+            _azure = False
+    return _azure or None
 
 
 # --- HELPER: Fix dates ---
@@ -29,35 +70,252 @@ def _parse_date(s):
     return None
 
 
-# --- TEXT FALLBACK ---
-def extract_fields_text(pdf_bytes: bytes) -> dict:
-    try:
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
-    except Exception:
-        text = ""
+# --- TEXT FALLBACK (page-limited search, see text_layer) ---
+def _text_model_id() -> str:
+    return f"{TEXT_MODEL_ID}:{patterns_version()}"
 
+
+def _normalize_text_fields(raw: dict) -> dict:
     data = {}
-    # Basic Regex Patterns
-    m = re.search(r"Invoice\s*(No|Number|ID)\s*[:\-]?\s*([A-Z0-9\-\/]+)", text, re.I)
-    if m: data["invoice_number"] = m.group(2)
-    
-    m = re.search(r"Invoice\s*Date\s*[:\-]?\s*(\d{4}[-/]\d{2}[-/]\d{2})", text, re.I)
-    if m: data["invoice_date"] = _parse_date(m.group(1))
-    
-    m = re.search(r"(Customer|Buyer)\s*[:\-]?\s*(.+)", text, re.I)
-    if m: data["buyer_name"] = m.group(2).strip()
-    
-    m = re.search(r"(Subtotal|Total\s*HT)\s*[:\-]?\s*([0-9]+[.,][0-9]{2})", text, re.I)
-    if m: data["total_ht_str"] = m.group(2).replace(",", ".")
+    for name, value in raw.items():
+        if name == "invoice_date":
+            value = _parse_date(value)
+        elif name in ("total_ht_str", "total_ttc_str"):
+            value = value.replace(",", ".")
+        else:
+            value = value.strip()
+        if value:
+            data[name] = value
+    return data
+
 
+def extract_fields_text(pdf_bytes: PdfData, cache=None) -> dict:
+    if cache is not None:
+        digest = pdf_digest(pdf_bytes)
+        hit = cache.get(digest, _text_model_id())
+        if hit is not None:
+            return hit
+
+    raw, _ = scan_fields(pdf_bytes)
+    data = _normalize_text_fields(raw)
+
+    if cache is not None:
+        cache.put(digest, _text_model_id(), data)
     return data
 
 
+def extract_text_many(pdf_list, processes: int = None, cache=None, timers=None):
+    """
+    Runs extract_fields_text over many PDFs, spreading the CPU-bound pypdf
+    parsing over worker processes (see text_layer.scan_many); cache lookups
+    and writes stay in this process.
+    Yields (index, fields) in completion order. `timers`, if given, is a
+    list of metrics.StageTimer aligned with pdf_list.
+    """
+    todo = []
+    for i, pdf in enumerate(pdf_list):
+        hit = cache.get(pdf_digest(pdf), _text_model_id()) if cache is not None else None
+        if hit is not None:
+            yield i, hit
+        else:
+            todo.append((i, pdf))
+
+    for i, raw, seconds in scan_many(todo, processes):
+        data = _normalize_text_fields(raw)
+        if timers is not None:
+            timers[i].add("text_extract", seconds, len(pdf_list[i]))
+        if cache is not None:
+            cache.put(pdf_digest(pdf_list[i]), _text_model_id(), data)
+        yield i, data
+
+
+class AzureThrottledError(Exception):
+    """Azure kept answering 429 after AZURE_MAX_RETRIES attempts."""
+
+
+# --- AZURE CLIENT POOL ---
+# One DocumentAnalysisClient (+ its requests.Session) per (endpoint, key),
+# shared by every call and session in the process so TLS connections are
+# reused between invoices.
+AZURE_POOL_SIZE = int(os.getenv("AZURE_POOL_SIZE", "10"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_document_client(endpoint: str, key: str, pool_size: int = None):
+    """
+    Returns the shared DocumentAnalysisClient for this endpoint/key,
+    creating it (with a connection pool of `pool_size`) on first use.
+    """
+    registry_key = (endpoint, key)
+    entry = _clients.get(registry_key)
+    if entry is not None:
+        return entry[0]
+
+    with _clients_lock:
+        entry = _clients.get(registry_key)
+        if entry is None:
+            azure = _load_azure()
+            size = pool_size or AZURE_POOL_SIZE
+            session = azure.requests.Session()
+            adapter = azure.requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            client = azure.DocumentAnalysisClient(
+                endpoint=endpoint,
+                credential=azure.AzureKeyCredential(key),
+                transport=azure.RequestsTransport(session=session, session_owner=False),
+                retry_policy=azure.AnalyzeRetryPolicy(),
+                raw_response_hook=_observe_throttling,
+            )
+            entry = (client, session)
+            _clients[registry_key] = entry
+    return entry[0]
+
+
+def _observe_throttling(pipeline_response):
+    # Every 429 (analyze POST or result polling) slows down the shared limiter
+    response = pipeline_response.http_response
+    if response.status_code == 429:
+        get_azure_limiter().on_throttle(retry_after_seconds(response.headers))
+
+
+def close_document_clients():
+    """Closes every pooled client and its HTTP connections."""
+    with _clients_lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for client, session in entries:
+        try:
+            client.close()
+            session.close()
+        except Exception as e:
+            print(f"Azure client close error: {e}")
+
+
+atexit.register(close_document_clients)
+
+
+# --- AZURE REQUEST SHAPING: only send the pages the fields are on ---
+# Header fields are on the first pages and totals on the last one, so the
+# first Azure pass covers AZURE_HEAD_PAGES pages + the last page. Long
+# annexes and terms pages are neither uploaded nor paid for. If a field
+# conversion needs (AZURE_WIDEN_FIELDS) is still missing, the pages not
+# analyzed yet get one more call.
+#   AZURE_PAGE_MODE=strip  upload a PDF of just those pages (smaller upload too)
+#                   pages  upload the whole file, analyze those pages (SDK `pages=`)
+#                   off    the whole file, every page
+# AZURE_IMAGE_MAX_PX > 0 also downsizes larger images in the uploaded copy
+# (strip mode, needs Pillow).
+AZURE_PAGE_MODE = os.getenv("AZURE_PAGE_MODE", "strip")
+AZURE_HEAD_PAGES = int(os.getenv("AZURE_HEAD_PAGES", "2"))
+AZURE_IMAGE_MAX_PX = int(os.getenv("AZURE_IMAGE_MAX_PX", "0"))
+AZURE_WIDEN_FIELDS = tuple(
+    f.strip() for f in os.getenv("AZURE_WIDEN_FIELDS", "invoice_number,total_ht_str").split(",") if f.strip()
+)
+
+
+def first_pass_pages(count: int, head: int = None):
+    """0-based pages of the first Azure pass, or None when that is every page."""
+    head = AZURE_HEAD_PAGES if head is None else head
+    pages = sorted(set(range(min(max(head, 1), count))) | {count - 1})
+    return None if len(pages) >= count else pages
+
+
+def page_spec(pages) -> str:
+    """SDK `pages` value for 0-based pages: [0, 1, 13] -> "1-2,14"."""
+    ranges = []
+    for p in pages:
+        if ranges and ranges[-1][1] == p:
+            ranges[-1][1] = p + 1
+        else:
+            ranges.append([p + 1, p + 1])
+    return ",".join(str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in ranges)
+
+
+def _downsize_images(writer, max_px: int):
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    for page in writer.pages:
+        for image in page.images:
+            img = image.image
+            if max(img.size) <= max_px:
+                continue
+            img.thumbnail((max_px, max_px), Image.LANCZOS)
+            image.replace(img if img.mode in ("L", "RGB") else img.convert("RGB"), quality=80)
+
+
+def shape_request(pdf_bytes: PdfData, mode: str = None, max_px: int = None, select=None):
+    """
+    What the first Azure pass sends: (payload, pages, stats). payload is
+    `pdf_bytes` itself or a smaller PDF, pages an SDK `pages` value or None.
+    stats: pages_total, pages_sent, bytes_full, bytes_sent, widened.
+    Unreadable PDFs are sent as they are. mode and max_px default to
+    AZURE_PAGE_MODE and AZURE_IMAGE_MAX_PX; `select(count)` picks the
+    0-based pages to send (default first_pass_pages).
+    """
+    mode = AZURE_PAGE_MODE if mode is None else mode
+    max_px = AZURE_IMAGE_MAX_PX if max_px is None else max_px
+    select = select or first_pass_pages
+    size = len(pdf_bytes)
+    stats = {"pages_total": None, "pages_sent": None, "bytes_full": size, "bytes_sent": size, "widened": False}
+    if mode not in ("strip", "pages"):
+        return pdf_bytes, None, stats
+    try:
+        with pdf_reader(pdf_bytes) as reader:
+            count = len(reader.pages)
+            stats["pages_total"] = stats["pages_sent"] = count
+            selected = select(count)
+            if mode == "pages":
+                if selected is None:
+                    return pdf_bytes, None, stats
+                stats["pages_sent"] = len(selected)
+                return pdf_bytes, page_spec(selected), stats
+            if selected is None and not max_px:
+                return pdf_bytes, None, stats
+
+            from pypdf import PdfWriter
+
+            writer = PdfWriter()
+            for index in selected if selected is not None else range(count):
+                writer.add_page(reader.pages[index])
+            if max_px:
+                _downsize_images(writer, max_px)
+            buf = io.BytesIO()
+            writer.write(buf)
+    except Exception as e:
+        print(f"Azure request shaping skipped: {e}")
+        return pdf_bytes, None, stats
+    payload = buf.getvalue()
+    if selected is None and len(payload) >= size:
+        return pdf_bytes, None, stats
+    stats["pages_sent"], stats["bytes_sent"] = len(selected) if selected is not None else count, len(payload)
+    return payload, None, stats
+
+
 # --- AZURE OCR (Standard Version) ---
-def azure_extract_invoice_fields(pdf_bytes: bytes, endpoint: str, key: str) -> dict:
-    if not AZURE_AVAILABLE:
-        print("❌ Azure library missing.")
+def azure_extract_invoice_fields(
+    pdf_bytes: PdfData, endpoint: str, key: str, cache=None, shaping: dict = None,
+) -> dict:
+    """
+    Invoice fields from Azure prebuilt-invoice, cached by PDF content.
+    The first call only covers the pages of shape_request(); the other
+    pages are analyzed when a field of AZURE_WIDEN_FIELDS is still missing.
+    `shaping`, if given, receives the stats of shape_request() for what was
+    actually sent (both passes counted); it is left empty on a cache hit.
+    """
+    if cache is not None:
+        digest = pdf_digest(pdf_bytes)
+        hit = cache.get(digest, AZURE_MODEL_ID)
+        if hit is not None:
+            return hit
+
+    azure = _load_azure()
+    if azure is None:
+        print("❌ Azure library missing. Run: pip install azure-ai-formrecognizer")
         return {}
 
     if not endpoint or not key:
@@ -65,60 +323,251 @@ def azure_extract_invoice_fields(pdf_bytes: bytes, endpoint: str, key: str) -> d
         return {}
 
     try:
-        # 1. Client Setup
-        credential = AzureKeyCredential(key)
-        client = DocumentAnalysisClient(endpoint=endpoint, credential=credential)
-
-        # 2. Analyze
-        poller = client.begin_analyze_document(
-            "prebuilt-invoice", 
-            document=pdf_bytes
-        )
-        result = poller.result()
-
-        if not result.documents:
-            return {}
-
-        invoice = result.documents[0]
-        fields = invoice.fields
-        out = {}
-
-        # 3. Helper to extract values
-        def get_val(field_name):
-            f = fields.get(field_name)
-            if not f: return None
-            # Return the specialized value if possible
-            return f.value
-
-        # 4. Extract
-        out["invoice_number"] = get_val("InvoiceId")
-        out["seller_name"] = get_val("VendorName")
-        out["buyer_name"] = get_val("CustomerName")
-        
-        # Dates are usually returned as objects, but we normalize them
-        out["invoice_date"] = _parse_date(get_val("InvoiceDate"))
-
-        # Money Fields (The object usually has .amount and .symbol)
-        total_ht_field = fields.get("SubTotal")
-        if total_ht_field and total_ht_field.value:
-            # Handle currency object safely
-            if hasattr(total_ht_field.value, 'amount'):
-                out["total_ht_str"] = str(total_ht_field.value.amount)
-                out["currency"] = getattr(total_ht_field.value, 'symbol', 'EUR')
-            else:
-                # Fallback if it's just a number
-                out["total_ht_str"] = str(total_ht_field.value)
-
-        total_ttc_field = fields.get("InvoiceTotal")
-        if total_ttc_field and total_ttc_field.value:
-             if hasattr(total_ttc_field.value, 'amount'):
-                out["total_ttc_str"] = str(total_ttc_field.value.amount)
-             else:
-                out["total_ttc_str"] = str(total_ttc_field.value)
+        # 1. Client Setup (pooled, reused across calls)
+        client = get_document_client(endpoint, key)
 
-        # Remove empty keys
-        return {k: v for k, v in out.items() if v}
+        # 2. First pass on the shaped request, then the pages it left out if needed
+        payload, pages, stats = shape_request(pdf_bytes)
+        out = _analyze(azure, client, payload, pages)
+        if (payload is not pdf_bytes or pages) and missing_fields(out, AZURE_WIDEN_FIELDS):
+            first = first_pass_pages(stats["pages_total"])
+            if first is None:
+                # Every page was sent, with images downsized: the original this time
+                payload, pages, rest = shape_request(pdf_bytes, mode="off")
+                rest["pages_sent"] = stats["pages_total"]
+            else:
+                payload, pages, rest = shape_request(
+                    pdf_bytes, select=lambda count: [p for p in range(count) if p not in first],
+                )
+            try:
+                more = _analyze(azure, client, payload, pages)
+            except AzureThrottledError:
+                raise
+            except Exception as e:
+                # The first pass is kept, but not cached: a later run widens again
+                print(f"Azure Error (widening): {e}")
+                more, cache = None, None
+            if more is not None:
+                # What the first pass found stays; the other pages fill the gaps
+                out = {**more, **{k: v for k, v in out.items() if v not in (None, "")}}
+                stats["widened"] = True
+                stats["pages_widened"], stats["bytes_widened"] = rest["pages_sent"], rest["bytes_sent"]
+                stats["pages_sent"] += rest["pages_sent"]
+                stats["bytes_sent"] += rest["bytes_sent"]
+        if shaping is not None:
+            shaping.update(stats)
 
+    except AzureThrottledError:
+        # Not a silent {}: the caller reports it (bulk: ERROR row)
+        raise
     except Exception as e:
         print(f"Azure Error: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+    # The result is paid for: a cache that cannot be written (e.g. locked) does not lose it
+    if cache is not None:
+        try:
+            cache.put(digest, AZURE_MODEL_ID, out)
+        except Exception as e:
+            print(f"OCR cache write failed: {e}")
+    return out
+
+
+def _analyze(azure, client, pdf_bytes: PdfData, pages: str = None) -> dict:
+    """One analyze call (paced by the shared limiter; 429s wait for Retry-After) -> fields."""
+    limiter = get_azure_limiter()
+    options = {"pages": pages} if pages else {}
+    for attempt in range(AZURE_MAX_RETRIES + 1):
+        with limiter.slot():
+            t0 = time.perf_counter()
+            try:
+                # A fresh stream per attempt: the upload is never copied
+                with open_pdf(pdf_bytes) as stream:
+                    poller = client.begin_analyze_document(
+                        AZURE_MODEL_ID, 
+                        document=stream,
+                        **options
+                    )
+            except azure.HttpResponseError as e:
+                if e.status_code == 429:
+                    continue
+                raise
+            limiter.on_success(time.perf_counter() - t0)
+            break
+    else:
+        raise AzureThrottledError(f"Azure throttled (429) after {AZURE_MAX_RETRIES + 1} attempts")
+    # Polling for the result does not hold a slot: the limiter paces analyze POSTs
+    result = poller.result()
+
+    if not result.documents:
+        return {}
+
+    invoice = result.documents[0]
+    fields = invoice.fields
+    out = {}
+
+    # Helper to extract values
+    def get_val(field_name):
+        f = fields.get(field_name)
+        if not f: return None
+        # Return the specialized value if possible
+        return f.value
+
+    # Extract
+    out["invoice_number"] = get_val("InvoiceId")
+    out["seller_name"] = get_val("VendorName")
+    out["buyer_name"] = get_val("CustomerName")
+    
+    # Dates are usually returned as objects, but we normalize them
+    out["invoice_date"] = _parse_date(get_val("InvoiceDate"))
+
+    # Money Fields (The object usually has .amount and .symbol)
+    total_ht_field = fields.get("SubTotal")
+    if total_ht_field and total_ht_field.value:
+        # Handle currency object safely
+        if hasattr(total_ht_field.value, 'amount'):
+            out["total_ht_str"] = str(total_ht_field.value.amount)
+            out["currency"] = getattr(total_ht_field.value, 'symbol', 'EUR')
+        else:
+            # Fallback if it's just a number
+            out["total_ht_str"] = str(total_ht_field.value)
+
+    total_ttc_field = fields.get("InvoiceTotal")
+    if total_ttc_field and total_ttc_field.value:
+         if hasattr(total_ttc_field.value, 'amount'):
+            out["total_ttc_str"] = str(total_ttc_field.value.amount)
+         else:
+            out["total_ttc_str"] = str(total_ttc_field.value)
+
+    # Remove empty keys
+    out = {k: v for k, v in out.items() if v}
+    return out
+
+
+# --- AZURE OCR (Bulk, bounded concurrency) ---
+def azure_extract_timed(timer, pdf_bytes: PdfData, endpoint: str, key: str, cache=None, shaping: dict = None):
+    """azure_extract_invoice_fields, recorded as the "ocr" stage of `timer` with the bytes uploaded."""
+    shaping = {} if shaping is None else shaping
+    with timer.stage("ocr") as span:
+        try:
+            return azure_extract_invoice_fields(pdf_bytes, endpoint, key, cache, shaping)
+        finally:
+            span.nbytes = shaping.get("bytes_sent", 0)
+
+
+def azure_extract_many(
+    pdf_list, endpoint: str, key: str, max_workers: int = 4, cache=None, timers=None, shaping=None,
+):
+    """
+    Runs azure_extract_invoice_fields over many PDFs with at most
+    `max_workers` requests in flight.
+    Yields (index, result) in completion order; result is the fields dict,
+    or the Exception raised for that file. Callers re-order by index.
+    `timers` (metrics.StageTimer) and `shaping` (dicts, see
+    azure_extract_invoice_fields), if given, are lists aligned with pdf_list.
+    """
+    max_workers = max(1, int(max_workers))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="azure-ocr") as pool:
+        if timers is None:
+            futures = {
+                pool.submit(
+                    azure_extract_invoice_fields, pdf_bytes, endpoint, key, cache,
+                    shaping[i] if shaping is not None else None,
+                ): i
+                for i, pdf_bytes in enumerate(pdf_list)
+            }
+        else:
+            futures = {
+                pool.submit(
+                    azure_extract_timed, timers[i], pdf_bytes, endpoint, key, cache,
+                    shaping[i] if shaping is not None else None,
+                ): i
+                for i, pdf_bytes in enumerate(pdf_list)
+            }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                yield i, fut.result()
+            except Exception as e:
+                yield i, e
+
+
+# --- TIERED EXTRACTION (text layer first, Azure only for what is missing) ---
+REQUIRED_FIELDS = ("invoice_number", "invoice_date", "total_ht_str", "buyer_name")
+
+
+def _is_plausible(name, value) -> bool:
+    if not value:
+        return False
+    if name == "invoice_number":
+        return len(str(value)) <= 64 and any(c.isdigit() for c in str(value))
+    if name == "invoice_date":
+        return isinstance(value, date) and date(1990, 1, 1) <= value <= date(date.today().year + 1, 12, 31)
+    if name in ("total_ht_str", "total_ttc_str"):
+        try:
+            return Decimal(str(value).replace(",", ".")) > 0
+        except InvalidOperation:
+            return False
+    if name in ("buyer_name", "seller_name"):
+        return len(str(value).strip()) <= 200
+    return True
+
+
+def missing_fields(data: dict, fields=REQUIRED_FIELDS) -> list:
+    """Fields (default REQUIRED_FIELDS) that are absent or implausible, in that order."""
+    return [f for f in fields if not _is_plausible(f, data.get(f))]
+
+
+def merge_tiers(text_data: dict, azure_data: dict = None):
+    """
+    Keeps every plausible text-layer field and fills the rest from Azure.
+    Returns (fields, tiers) where tiers maps each field to "text" or "azure".
+    """
+    fields, tiers = {}, {}
+    for name, value in text_data.items():
+        if _is_plausible(name, value):
+            fields[name], tiers[name] = value, "text"
+    for name, value in (azure_data or {}).items():
+        if name not in fields and value:
+            fields[name], tiers[name] = value, "azure"
+    return fields, tiers
+
+
+def extract_fields_tiered(pdf_bytes: PdfData, endpoint: str, key: str, cache=None):
+    """
+    Runs extract_fields_text first and calls Azure only if a required field
+    is still missing. Returns (fields, tiers, azure_called).
+    """
+    text_data = extract_fields_text(pdf_bytes, cache=cache)
+    if not missing_fields(text_data) or not endpoint or not key:
+        fields, tiers = merge_tiers(text_data)
+        return fields, tiers, False
+    azure_data = azure_extract_invoice_fields(pdf_bytes, endpoint, key, cache=cache)
+    fields, tiers = merge_tiers(text_data, azure_data)
+    return fields, tiers, True
+
+
+def format_tiers(tiers: dict) -> str:
+    """Report cell, e.g. 'invoice_number=text, total_ht_str=azure'."""
+    return ", ".join(f"{name}={tier}" for name, tier in tiers.items())
+
+
+def format_shaping(stats: dict) -> dict:
+    """
+    Report cells for what Azure got vs the whole file: AI Pages '3 of 14',
+    AI Upload '180 of 2150 KB'; '3 + 11 of 14' when the request was widened.
+    """
+    if not stats:
+        return {}
+    pages, sent = stats["pages_sent"], stats["bytes_sent"] / 1024
+    full = stats["bytes_full"] / 1024
+    if stats["widened"]:
+        more_pages, more_kb = stats["pages_widened"], stats["bytes_widened"] / 1024
+        return {
+            "AI Pages": f"{pages - more_pages} + {more_pages} of {stats['pages_total']}",
+            "AI Upload": f"{sent - more_kb:.0f} + {more_kb:.0f} of {full:.0f} KB",
+        }
+    return {
+        "AI Pages": f"{pages} of {stats['pages_total']}" if stats["pages_total"] else "",
+        "AI Upload": f"{sent:.0f} of {full:.0f} KB",
+    }
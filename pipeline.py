@@ -0,0 +1,146 @@
+import os
+import re
+from datetime import date
+from decimal import Decimal
+
+from facturx_xml import build_facturx_minimum_xml
+from validator import validate_facturx_minimum
+from facturx_engine import embed_facturx
+from document import DOCUMENT_SPILL_BYTES, PdfData, PdfDocument, spill_file
+from totals import DEFAULT_VAT_RATE, infer_vat_rate
+from metrics import REGISTRY, StageTimer
+
+# Shared by the Streamlit bulk mode and the headless CLI:
+# extracted fields -> XML -> validate -> embed -> (arcname, pdf) + report row.
+
+COMPLIANCE_PROFILE = "Factur-X Minimum"
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r'[\\/*?:"<>|]', "_", name)
+
+
+_NO_TIMER = StageTimer(enabled=False)
+
+
+def convert_document(
+    file_name: str,
+    pdf_bytes: PdfData,
+    data,
+    seller_siret: str,
+    seller_vat: str,
+    vat_rate: Decimal = DEFAULT_VAT_RATE,
+    timer: StageTimer = None,
+    artifacts: dict = None,
+):
+    """
+    Turns one extracted document into a Factur-X PDF.
+    `data` is the extraction result (dict) or the Exception raised while
+    extracting it. The VAT rate is inferred from HT/TTC when both were
+    extracted, else `vat_rate` is used.
+    Returns (report_row, arcname, out_pdf); arcname and out_pdf are None
+    when the document is FAILED/ERROR. out_pdf is bytes, or a temp-file
+    backed PdfDocument for inputs over DOCUMENT_SPILL_BYTES.
+    `timer`, if given, records xml_build/validate/embed seconds and sizes.
+    `artifacts`, if given, receives the generated "xml".
+    """
+    timer = timer or _NO_TIMER
+    row, arcname, xml = build_document(file_name, data, seller_siret, seller_vat, vat_rate, timer)
+    if artifacts is not None and xml is not None:
+        artifacts["xml"] = xml
+    row, out_pdf = embed_document(row, pdf_bytes, xml, timer)
+    if timer.enabled:
+        REGISTRY.count_document(row["Status"])
+    return row, arcname if out_pdf is not None else None, out_pdf
+
+
+# The two halves of convert_document, for callers that run them as
+# separate stages (bulk.run_bulk). Neither raises: errors become the row.
+def build_document(
+    file_name: str,
+    data,
+    seller_siret: str,
+    seller_vat: str,
+    vat_rate: Decimal = DEFAULT_VAT_RATE,
+    timer: StageTimer = None,
+):
+    """
+    Extracted fields -> validated XML.
+    Returns (report_row, arcname, xml); xml is None when the row is FAILED/ERROR.
+    """
+    timer = timer or _NO_TIMER
+    try:
+        if isinstance(data, Exception):
+            raise data
+
+        if not data.get("invoice_number") or not data.get("total_ht_str"):
+            return {
+                "File": file_name,
+                "Status": "FAILED",
+                "Compliance Profile": "N/A",
+                "Reason": "Missing Invoice# or Total",
+            }, None, None
+
+        ht_val = Decimal(data["total_ht_str"].replace(",", "."))
+        # Same rule as the single studio: use TTC when present, else vat_rate
+        ttc_val = Decimal(str(data.get("total_ttc_str") or "0").replace(",", "."))
+        rate_val = infer_vat_rate(ht_val, ttc_val, default=vat_rate)
+
+        with timer.stage("xml_build") as span:
+            xml = build_facturx_minimum_xml(
+                invoice_number=data["invoice_number"],
+                invoice_date=data.get("invoice_date") or date.today(),
+                seller_name=data.get("seller_name", "Unknown"),
+                seller_siret=seller_siret,
+                seller_vat=seller_vat,
+                buyer_name=data.get("buyer_name", "Unknown"),
+                total_ht=ht_val,
+                vat_rate_percent=rate_val,
+            )
+            span.nbytes = len(xml)
+
+        with timer.stage("validate", len(xml)):
+            validate_facturx_minimum(xml)
+
+        arcname = f"{safe_filename(data['invoice_number'])}_facturx.pdf"
+        return {
+            "File": file_name,
+            "Status": "SUCCESS",
+            "Compliance Profile": COMPLIANCE_PROFILE,
+            "Invoice #": data["invoice_number"],
+            "Total HT": str(ht_val),
+        }, arcname, xml
+
+    except Exception as e:
+        return {"File": file_name, "Status": "ERROR", "Reason": str(e)}, None, None
+
+
+def embed_document(row: dict, pdf_bytes: PdfData, xml: bytes, timer: StageTimer = None):
+    """
+    Embeds the XML from build_document. Returns (report_row, out_pdf);
+    out_pdf is None when there was no XML or embedding failed (ERROR row).
+    """
+    if xml is None:
+        return row, None
+    timer = timer or _NO_TIMER
+    try:
+        with timer.stage("embed") as span:
+            out_pdf = _embed(pdf_bytes, xml)
+            span.nbytes = len(out_pdf)
+    except Exception as e:
+        return {"File": row["File"], "Status": "ERROR", "Reason": str(e)}, None
+    return row, out_pdf
+
+
+def _embed(pdf_bytes: PdfData, xml: bytes):
+    """Embedded PDF as bytes; about as large as the input, so large ones go to a temp file."""
+    if len(pdf_bytes) <= DOCUMENT_SPILL_BYTES:
+        return embed_facturx(pdf_bytes, xml, check_xsd=False)
+    f = spill_file()
+    try:
+        with f:
+            embed_facturx(pdf_bytes, xml, output=f, check_xsd=False)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    return PdfDocument(getattr(pdf_bytes, "name", "document.pdf"), path=f.name, temporary=True)
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Shared scheduler for Azure analyze calls (one per process, all sessions):
+# - token bucket capped at the tier's TPS (new analyze requests per second),
+# - a pause for every thread when Azure answers 429 + Retry-After,
+# - AIMD on both the request rate and the concurrency: additive increase
+#   per fast success; on 429 the rate is halved and concurrency cut by a
+#   quarter; concurrency x0.9 when latency drifts far above the best seen.
+# A slot covers one analyze POST (the upload), not the result polling:
+# concurrency limits uploads in flight, not documents being analyzed.
+
+AZURE_TPS = float(os.getenv("AZURE_TPS", "15"))
+AZURE_MAX_CONCURRENCY = int(os.getenv("AZURE_MAX_CONCURRENCY", "16"))
+AZURE_MIN_CONCURRENCY = int(os.getenv("AZURE_MIN_CONCURRENCY", "1"))
+AZURE_MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "6"))
+
+
+class AdaptiveLimiter:
+    """
+    Use as `with limiter.slot(): call()` and report the outcome with
+    on_success(latency) / on_throttle(retry_after).
+    """
+
+    def __init__(
+        self,
+        tps: float = AZURE_TPS,
+        max_concurrency: int = AZURE_MAX_CONCURRENCY,
+        min_concurrency: int = AZURE_MIN_CONCURRENCY,
+        latency_factor: float = 2.0,
+        latency_slack: float = 0.25,
+    ):
+        self.tps = tps
+        self.rate = tps
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack
+        self.limit = float(max(self.min_concurrency, self.max_concurrency // 2))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {"calls": 0, "throttled": 0, "waited_s": 0.0, "max_in_flight": 0}
+        self._tokens = min(tps, 1.0) if tps else 0.0
+        self._last_refill = time.monotonic()
+        self._latency = None  # EWMA of call latency
+        self._best_latency = None
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.tps:
+            self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = 0.0
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = None  # woken by release()
+                elif self.tps and self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    if self.tps:
+                        self._tokens -= 1
+                    self.in_flight += 1
+                    self.stats["calls"] += 1
+                    self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+                    self.stats["waited_s"] += now - start
+                    return
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self, latency: float):
+        with self._cond:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+            slow = self._latency > max(self._best_latency * self.latency_factor, self._best_latency + self.latency_slack)
+            if slow:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                if self.tps:
+                    self.rate = min(self.tps, self.rate + 1 / self.rate)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: float = None):
+        """429: back off rate and concurrency, pause new calls for Retry-After seconds."""
+        with self._cond:
+            self.stats["throttled"] += 1
+            self.limit = max(self.min_concurrency, self.limit * 0.75)
+            if self.tps:
+                self.rate = max(min(self.tps, 0.5), self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + (retry_after or 1.0))
+            self._cond.notify_all()
+
+    def set_tps(self, tps: float):
+        """New rate cap (0: unlimited); the current rate only ever comes down to it."""
+        with self._cond:
+            self.tps = tps
+            self.rate = min(self.rate, tps) if self.rate and tps else tps
+            self._tokens = min(self._tokens, max(tps, 1.0))
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                **self.stats, "limit": round(self.limit, 2), "rate": round(self.rate, 2), "in_flight": self.in_flight,
+            }
+
+
+def retry_after_seconds(headers, default: float = 1.0) -> float:
+    """Retry-After (seconds or HTTP date) / retry-after-ms, else `default`."""
+    if headers is None:
+        return default
+    ms = headers.get("retry-after-ms") or headers.get("x-ms-retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return default
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_azure_limiter() -> AdaptiveLimiter:
+    """The limiter every Azure call of this process goes through, at AZURE_TPS (this process's share)."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter(tps=AZURE_TPS)
+    return _limiter
+
+
+def set_process_tps(tps: float):
+    """This process's share of the tier's TPS (jobs.start_workers gives the rest to the workers)."""
+    global AZURE_TPS
+    with _limiter_lock:
+        AZURE_TPS = tps
+        if _limiter is not None:
+            _limiter.set_tps(tps)
@@ -0,0 +1,226 @@
+import io
+import os
+import csv
+import json
+import time
+import importlib.util
+import shutil
+import tempfile
+from pathlib import Path
+
+from metrics import STAGES
+
+# Batch reports, written row by row as documents finish instead of being
+# built at the end. The column set is fixed up front so every format can
+# stream its header first.
+#   xlsx    - openpyxl write-only workbook (rows go to a temp file, not cells in memory)
+#   csv     - UTF-8, header + one line per row
+#   parquet - pyarrow (optional dependency), one row group per PARQUET_ROW_GROUP rows
+#   json    - an array with one row per line; rows are written as is, all keys kept
+
+REPORT_FORMATS = ("xlsx", "csv", "parquet", "json")
+PARQUET_ROW_GROUP = int(os.getenv("REPORT_PARQUET_ROW_GROUP", "5000"))
+
+BASE_COLUMNS = (
+    "File", "Status", "Compliance Profile", "Invoice #", "Total HT", "Reason", "Duplicate Of",
+    "OCR Cache", "Field Sources", "AI Pages", "AI Upload", "Checkpoint",
+)
+# Per-document stage columns (report_write is batch-level, never on a row)
+METRIC_COLUMNS = tuple(
+    col for stage in STAGES if stage != "report_write" for col in (f"{stage}_ms", f"{stage}_bytes")
+)
+REPORT_COLUMNS = BASE_COLUMNS + METRIC_COLUMNS
+
+
+def report_columns(metrics: bool = True, drop=()) -> list:
+    """REPORT_COLUMNS without the metric columns (metrics=False) or the names in `drop`."""
+    return [c for c in REPORT_COLUMNS if c not in drop and (metrics or c not in METRIC_COLUMNS)]
+
+
+def report_format(path) -> str:
+    """Format from a file name suffix (.xlsx, .csv, .parquet, .json)."""
+    fmt = Path(path).suffix.lower().lstrip(".")
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {path} (expected one of {', '.join(REPORT_FORMATS)})")
+    return fmt
+
+
+def parquet_available() -> bool:
+    """pyarrow is installed (checked without importing it)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class ReportWriter:
+    """
+    Streams report rows into the binary file `out` in format `fmt`.
+    Keys outside `columns` are left out (json keeps them); close() finishes
+    the file and returns the number of bytes written.
+    """
+
+    def __init__(self, out, fmt: str, columns=REPORT_COLUMNS, sheet_name: str = "Report"):
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported report format: {fmt}")
+        self.out = out
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.rows = 0
+        self.closed = False
+        self._start = out.tell()
+        self._ignored = set()
+        getattr(self, f"_open_{fmt}")(sheet_name)
+
+    # --- xlsx ---
+    def _open_xlsx(self, sheet_name):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        from openpyxl.styles import Font
+
+        self._illegal = ILLEGAL_CHARACTERS_RE
+        self._book = Workbook(write_only=True)
+        self._sheet = self._book.create_sheet(sheet_name)
+        self._sheet.freeze_panes = "A2"
+        bold = Font(bold=True)
+        header = []
+        for name in self.columns:
+            cell = WriteOnlyCell(self._sheet, value=name)
+            cell.font = bold
+            header.append(cell)
+        self._sheet.append(header)
+
+    def _append_xlsx(self, values):
+        # Control characters (e.g. in exception messages) are not valid in xlsx
+        self._sheet.append([self._illegal.sub("", v) if isinstance(v, str) else v for v in values])
+
+    def _close_xlsx(self):
+        self._book.save(self.out)
+
+    # --- csv ---
+    def _open_csv(self, sheet_name):
+        self._text = io.TextIOWrapper(self.out, encoding="utf-8", newline="", write_through=True)
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(self.columns)
+
+    def _append_csv(self, values):
+        self._csv.writerow(["" if v is None else v for v in values])
+
+    def _close_csv(self):
+        self._text.flush()
+        self._text.detach()  # leave `out` open for the caller
+
+    # --- parquet ---
+    def _open_parquet(self, sheet_name):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet reports need pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self._schema = pa.schema([
+            (name, pa.int64() if name.endswith("_bytes") else pa.float64() if name.endswith("_ms") else pa.string())
+            for name in self.columns
+        ])
+        self._parquet = pq.ParquetWriter(self.out, self._schema)
+        self._buffer = [[] for _ in self.columns]
+        self._strings = [field.type == pa.string() for field in self._schema]
+
+    def _append_parquet(self, values):
+        for col, is_string, value in zip(self._buffer, self._strings, values):
+            col.append(str(value) if is_string and value is not None else value)
+        if len(self._buffer[0]) >= PARQUET_ROW_GROUP:
+            self._flush_parquet()
+
+    def _flush_parquet(self):
+        if self._buffer[0]:
+            self._parquet.write_batch(self._pa.record_batch(self._buffer, schema=self._schema))
+            self._buffer = [[] for _ in self.columns]
+
+    def _close_parquet(self):
+        self._flush_parquet()
+        self._parquet.close()
+
+    # --- json ---
+    def _open_json(self, sheet_name):
+        self.out.write(b"[")
+
+    def _close_json(self):
+        self.out.write(b"\n]\n")
+
+    def append(self, row: dict):
+        if self.fmt == "json":
+            sep = b"\n" if self.rows == 0 else b",\n"
+            self.out.write(sep + json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+        else:
+            extra = row.keys() - set(self.columns) - self._ignored
+            if extra:
+                self._ignored |= extra
+                print(f"Report: columns not in the report layout were left out: {', '.join(sorted(extra))}")
+            getattr(self, f"_append_{self.fmt}")([row.get(name) for name in self.columns])
+        self.rows += 1
+
+    def close(self) -> int:
+        if not self.closed:
+            self.closed = True
+            getattr(self, f"_close_{self.fmt}")()
+        return self.out.tell() - self._start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SpooledReports:
+    """
+    One ReportWriter per format, each spooled to a temp file, for reports
+    that end up inside a ZIP. `seconds` is the time spent writing them.
+    """
+
+    def __init__(self, formats, columns=REPORT_COLUMNS):
+        self.seconds = 0.0
+        self._files = {}
+        self._writers = {}
+        try:
+            for fmt in formats:
+                self._files[fmt] = tempfile.TemporaryFile()
+                self._writers[fmt] = ReportWriter(self._files[fmt], fmt, columns)
+        except Exception:
+            self.close()
+            raise
+
+    def append(self, row: dict):
+        t0 = time.perf_counter()
+        for writer in self._writers.values():
+            writer.append(row)
+        self.seconds += time.perf_counter() - t0
+
+    def write_zip(self, z, basename: str) -> int:
+        """Finishes every report and adds it to ZipFile `z` as <basename>.<fmt>; returns bytes written."""
+        t0 = time.perf_counter()
+        nbytes = 0
+        for fmt, writer in self._writers.items():
+            nbytes += writer.close()
+            f = self._files[fmt]
+            f.seek(0)
+            with z.open(f"{basename}.{fmt}", "w") as dst:
+                shutil.copyfileobj(f, dst)
+        self.seconds += time.perf_counter() - t0
+        return nbytes
+
+    def close(self):
+        # Writers left open by an interrupted batch are finished (into the
+        # temp file) so the xlsx/parquet writers release their resources
+        for writer in self._writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,78 @@
+import io
+import threading
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from bulk import run_bulk
+from checkpoints import CheckpointStore
+from synthetic import generate_corpus, make_invoice_pdf
+
+SELLER = {"seller_siret": "80258593400018", "seller_vat": "FR34802585934"}
+
+
+@pytest.fixture(scope="module")
+def pdfs():
+    return [d["pdf"] for d in generate_corpus(2, seed=7)]
+
+
+def run(files, timeout=30, **kwargs):
+    """run_bulk in a thread, so a stuck pipeline fails the test instead of hanging it."""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = run_bulk(files, out=io.BytesIO(), **SELLER, **kwargs)
+        except Exception as e:
+            result["error"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "run_bulk did not finish"
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+@pytest.mark.parametrize("duplicates", ["keep", "skip"])
+def test_copy_of_resumed_original(tmp_path, pdfs, duplicates):
+    a, b = pdfs
+    store = CheckpointStore(str(tmp_path))
+    try:
+        run([("a.pdf", a)], checkpoints=store, duplicates=duplicates)
+        result = run([("a.pdf", a), ("a-copy.pdf", a), ("b.pdf", b)], checkpoints=store, duplicates=duplicates)
+    finally:
+        store.close()
+
+    rows = result["rows"]
+    assert [r["File"] for r in rows] == ["a.pdf", "a-copy.pdf", "b.pdf"]
+    assert rows[0]["Checkpoint"] == "RESUMED"
+    assert rows[1]["Duplicate Of"] == "a.pdf"
+    assert rows[1]["Status"] == ("SUCCESS" if duplicates == "keep" else "DUPLICATE")
+    assert rows[2]["Status"] == "SUCCESS"
+
+
+def with_cover(cover, pdf: bytes) -> bytes:
+    writer = PdfWriter()
+    writer.add_page(cover)
+    for page in PdfReader(io.BytesIO(pdf)).pages:
+        writer.add_page(page)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def test_same_first_page_text_is_linked_not_skipped():
+    # The same page of item lines in front of two different invoices
+    filler = make_invoice_pdf("X", date(2025, 1, 1), "X", Decimal("1.00"), pages=3)
+    cover = PdfReader(io.BytesIO(filler)).pages[1]
+    first = make_invoice_pdf("INV-100", date(2025, 1, 2), "Dupont", Decimal("100.00"))
+    second = make_invoice_pdf("INV-200", date(2025, 1, 3), "Martin", Decimal("200.00"))
+    files = [("first.pdf", with_cover(cover, first)), ("second.pdf", with_cover(cover, second))]
+
+    rows = run(files, fingerprint=True, duplicates="skip")["rows"]
+    assert [r["Status"] for r in rows] == ["SUCCESS", "SUCCESS"]
+    assert rows[1]["Duplicate Of"] == "first.pdf"
@@ -0,0 +1,57 @@
+import os
+import time
+
+from checkpoints import CheckpointStore
+
+ROW = {"File": "a.pdf", "Status": "SUCCESS", "Invoice #": "INV-1"}
+
+
+def test_resume_returns_extraction_and_output(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    try:
+        assert store.get("d1", "p") is None
+        store.put_extraction("d1", "p", {"invoice_number": "INV-1"})
+        store.put_extraction("d2", "p", {})  # empty: retried next time, not saved
+        store.put_result("d1", "p", ROW, "INV-1.pdf", b"%PDF-1.7 out")
+
+        cp = store.get("d1", "p")
+        assert cp["extraction"] == {"invoice_number": "INV-1"}
+        assert cp["status"] == "SUCCESS" and cp["row"] == ROW
+        with cp.output().stream() as f:
+            assert f.read() == b"%PDF-1.7 out"
+        assert store.get("d2", "p") is None
+        assert store.get("d1", "other profile") is None
+    finally:
+        store.close()
+
+
+def test_ttl(tmp_path):
+    store = CheckpointStore(str(tmp_path), ttl_seconds=60)
+    try:
+        store.put_result("d1", "p", ROW, "INV-1.pdf", b"%PDF-1.7 out")
+        path = store.get("d1", "p")["output_path"]
+        store._db.execute("UPDATE checkpoints SET updated_at = ?", (time.time() - 61,))
+        assert store.get("d1", "p") is None
+        store.purge_expired()
+        assert not os.path.exists(path)
+    finally:
+        store.close()
+
+
+def test_oldest_outputs_dropped_beyond_size_cap(tmp_path):
+    store = CheckpointStore(str(tmp_path), max_mb=1)
+    try:
+        for i in range(3):
+            store.put_extraction(f"d{i}", "p", {"invoice_number": f"INV-{i}"})
+            store.put_result(f"d{i}", "p", ROW, f"INV-{i}.pdf", b"%PDF" + bytes(400 * 1024))
+            store._db.execute("UPDATE checkpoints SET updated_at = ? WHERE digest = ?", (time.time() - 10 + i, f"d{i}"))
+        store.purge_expired()
+
+        oldest = store.get("d0", "p")
+        assert oldest.output() is None
+        assert oldest["extraction"] == {"invoice_number": "INV-0"}  # rebuilt without an Azure call
+        assert store.get("d1", "p").output() is not None
+        assert store.get("d2", "p").output() is not None
+        assert len(os.listdir(tmp_path / "out")) == 2
+    finally:
+        store.close()
@@ -0,0 +1,31 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from facturx import get_xml_from_pdf
+
+import facturx_engine
+from facturx_engine import embed_facturx
+from facturx_xml import build_facturx_minimum_xml
+from synthetic import make_invoice_pdf
+
+XML = build_facturx_minimum_xml(
+    invoice_number="INV-1", invoice_date=date(2025, 1, 1), seller_name="ACME", seller_siret="80258593400018",
+    seller_vat="FR34802585934", buyer_name="Dupont", total_ht=Decimal("100.00"), vat_rate_percent=Decimal("20"),
+)
+
+
+@pytest.mark.parametrize("internals", [True, False])
+def test_embedded_xml_round_trips(monkeypatch, internals):
+    if not internals:
+        # As with a factur-x release without the private helpers
+        monkeypatch.setattr(facturx_engine, "_helpers", False)
+    pdf = make_invoice_pdf("INV-1", date(2025, 1, 1), "Dupont", Decimal("100.00"))
+
+    out = embed_facturx(pdf, XML)
+    assert get_xml_from_pdf(out, check_xsd=False)[1] == XML
+
+    stream = io.BytesIO()
+    assert embed_facturx(pdf, XML, output=stream) is None
+    assert get_xml_from_pdf(stream.getvalue(), check_xsd=False)[1] == XML
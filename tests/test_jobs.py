@@ -0,0 +1,75 @@
+import time
+
+import jobs
+
+
+def test_stale_job_with_pending_cancel_ends_cancelled(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    job_id = jobs.submit_job("owner", [], {}, credits_reserved=5)
+    conn = jobs._connect()
+    try:
+        # Cancel requested, then the worker died
+        conn.execute(
+            "UPDATE jobs SET status = 'running', cancel_requested = 1, heartbeat_at = ? WHERE id = ?",
+            (time.time() - jobs.JOB_STALE_SECONDS - 1, job_id),
+        )
+        assert jobs._claim_next(conn) is None
+    finally:
+        conn.close()
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "cancelled"
+    assert job["credits_used"] == 0
+    jobs.delete_job(job_id)
+    assert jobs.get_job(job_id) is None
+
+
+def test_stale_cancelled_job_keeps_reported_credits(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    job_id = jobs.submit_job("owner", [], {}, credits_reserved=5)
+    conn = jobs._connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'running', cancel_requested = 1, credits_used = 3, heartbeat_at = ?"
+            " WHERE id = ?",
+            (time.time() - jobs.JOB_STALE_SECONDS - 1, job_id),
+        )
+        jobs._claim_next(conn)
+    finally:
+        conn.close()
+    assert jobs.get_job(job_id)["credits_used"] == 3
+
+
+def test_cancelled_job_counts_azure_calls_made(tmp_path, monkeypatch):
+    import bulk
+    from synthetic import generate_corpus
+
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    calls = []
+
+    def fake_azure(timer, pdf, *args):
+        calls.append(pdf)
+        if len(calls) == 2:
+            # Cancelled from the app while the batch runs
+            jobs.cancel_job(job_id)
+        time.sleep(0.3)  # past the progress write throttle, which is when cancels are seen
+        return {}
+
+    monkeypatch.setattr(bulk, "azure_extract_timed", fake_azure)
+    files = [(f"{i}.pdf", d["pdf"]) for i, d in enumerate(generate_corpus(6, seed=3))]
+    job_id = jobs.submit_job(
+        "owner", files,
+        {"seller_siret": "80258593400018", "seller_vat": "FR34802585934", "tiered": False, "credits": 6,
+         "max_workers": 1},
+        credits_reserved=6,
+    )
+    conn = jobs._connect()
+    try:
+        assert jobs._claim_next(conn) == job_id
+        jobs.run_job(job_id, conn, endpoint="https://example.invalid", key="key")
+    finally:
+        conn.close()
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "cancelled"
+    assert job["credits_used"] == len(calls) > 0
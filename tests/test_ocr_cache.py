@@ -0,0 +1,111 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+import ocr_cache
+from ocr_cache import OCRCache
+
+FIELDS = {"invoice_number": "INV-1"}
+
+
+def accessed_at(path, digest):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT accessed_at FROM ocr_cache WHERE digest = ?", (digest,)).fetchone()[0]
+
+
+def test_reads_do_not_write(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = OCRCache(path)
+    cache.put("a", "m", FIELDS)
+    stored = accessed_at(path, "a")
+
+    reader = OCRCache(path)
+    assert reader.get("a", "m") == FIELDS
+    assert reader.get("a", "m") == FIELDS
+    assert accessed_at(path, "a") == stored
+
+    # Written with the next put (or on close)
+    reader.put("b", "m", FIELDS)
+    assert accessed_at(path, "a") > stored
+    reader.close()
+    cache.close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ocr_cache, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_ttl(tmp_path, clock, on_disk):
+    cache = OCRCache(str(tmp_path / "cache.sqlite3") if on_disk else None, ttl_seconds=60)
+    cache.put("a", "m", FIELDS)
+    clock.now += 60
+    assert cache.get("a", "m") == FIELDS
+    clock.now += 1
+    assert cache.get("a", "m") is None
+    cache.close()
+
+
+def test_expired_entries_leave_the_disk(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = OCRCache(path, ttl_seconds=60, max_memory_items=0)
+    cache.put("a", "m", FIELDS)
+    clock.now += 61
+    assert cache.get("a", "m") is None
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0] == 0
+    cache.close()
+
+
+def test_memory_lru():
+    cache = OCRCache(None, max_memory_items=2)
+    cache.put("a", "m", FIELDS)
+    cache.put("b", "m", FIELDS)
+    cache.get("a", "m")  # b is now the least recently used
+    cache.put("c", "m", FIELDS)
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == FIELDS
+    assert cache.get("c", "m") == FIELDS
+
+
+def test_disk_keeps_the_most_recently_used(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = OCRCache(path, max_memory_items=0, max_disk_items=2)
+    for digest in "ab":
+        cache.put(digest, "m", FIELDS)
+        clock.now += 1
+    clock.now += ocr_cache.OCR_CACHE_TOUCH_SECONDS
+    assert cache.get("a", "m") == FIELDS  # b is now the least recently used
+    clock.now += 1
+    cache.put("c", "m", FIELDS)
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == FIELDS
+    assert cache.get("c", "m") == FIELDS
+    cache.close()
+
+
+@pytest.mark.parametrize("empty", [{}, None])
+def test_empty_results_are_not_cached(tmp_path, empty):
+    cache = OCRCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("a", "m", empty)
+    assert cache.get("a", "m") is None
+    cache.close()
+
+
+def test_values_round_trip(tmp_path):
+    fields = {"invoice_date": date(2025, 1, 31), "total_ht_str": "100.10", "confidence": 0.93, "buyer_name": "Dupont"}
+    path = str(tmp_path / "cache.sqlite3")
+    OCRCache(path).put("a", "m", fields)
+    assert OCRCache(path).get("a", "m") == fields
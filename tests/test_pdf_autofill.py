@@ -0,0 +1,88 @@
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import pdf_autofill
+from synthetic import make_invoice_pdf
+
+FIELDS = {"invoice_number": "INV-1", "total_ht_str": "100.00", "invoice_date": "2025-01-01", "buyer_name": "Dupont"}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replaces the Azure call: records what each pass sent, returns the queued results."""
+    sent, results = [], []
+
+    def analyze(azure, client, payload, pages=None):
+        sent.append((payload, pages))
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(pdf_autofill, "_analyze", analyze)
+    monkeypatch.setattr(pdf_autofill, "AZURE_PAGE_MODE", "pages")
+    return sent, results
+
+
+@pytest.fixture(scope="module")
+def pdf():
+    return make_invoice_pdf("INV-1", date(2025, 1, 1), "Dupont", Decimal("100.00"), pages=6)
+
+
+def test_no_widening_without_buyer(calls, pdf):
+    sent, results = calls
+    results.append({k: v for k, v in FIELDS.items() if k != "buyer_name"})
+    shaping = {}
+    out = pdf_autofill.azure_extract_invoice_fields(pdf, "http://azure", "key", shaping=shaping)
+    assert out["invoice_number"] == "INV-1"
+    assert len(sent) == 1
+    assert not shaping["widened"]
+
+
+def test_widening_sends_only_the_other_pages(calls, pdf):
+    sent, results = calls
+    results += [{"invoice_number": "INV-1", "buyer_name": "Dupont"}, {"total_ht_str": "100.00", "buyer_name": None}]
+    shaping = {}
+    out = pdf_autofill.azure_extract_invoice_fields(pdf, "http://azure", "key", shaping=shaping)
+    assert [pages for _, pages in sent] == ["1-2,6", "3-5"]
+    assert out["buyer_name"] == "Dupont"
+    assert out["total_ht_str"] == "100.00"
+    assert pdf_autofill.format_shaping(shaping)["AI Pages"] == "3 + 3 of 6"
+
+
+class LockedCache:
+    def get(self, digest, model_id):
+        return None
+
+    def put(self, digest, model_id, fields):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_cache_write_failure_keeps_the_result(calls, pdf):
+    sent, results = calls
+    results.append(dict(FIELDS))
+    assert pdf_autofill.azure_extract_invoice_fields(pdf, "http://azure", "key", cache=LockedCache()) == FIELDS
+
+
+class MemoryCache(dict):
+    def get(self, digest, model_id):
+        return dict.get(self, digest)
+
+    def put(self, digest, model_id, fields):
+        self[digest] = fields
+
+
+def test_failed_widening_keeps_the_first_pass(calls, pdf):
+    sent, results = calls
+    first = {"invoice_number": "INV-1", "buyer_name": "Dupont"}
+    results += [dict(first), RuntimeError("service unavailable")]
+    cache, shaping = MemoryCache(), {}
+    out = pdf_autofill.azure_extract_invoice_fields(pdf, "http://azure", "key", cache=cache, shaping=shaping)
+    assert out == first
+    assert len(sent) == 2
+    assert not shaping["widened"]
+    # Not cached: the next run widens again
+    assert not cache
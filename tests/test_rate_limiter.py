@@ -0,0 +1,103 @@
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limiter
+from rate_limiter import AdaptiveLimiter, retry_after_seconds
+
+
+def test_additive_increase_up_to_the_caps():
+    limiter = AdaptiveLimiter(tps=4, max_concurrency=8, min_concurrency=1)
+    limiter.rate, limiter.limit = 1.0, 2.0
+    for _ in range(200):
+        limiter.on_success(0.1)
+    assert limiter.rate == 4
+    assert limiter.limit == 8
+
+
+def test_throttle_halves_rate_and_cuts_concurrency():
+    limiter = AdaptiveLimiter(tps=8, max_concurrency=8, min_concurrency=2)
+    limit = limiter.limit
+    limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 4
+    assert limiter.limit == limit * 0.75
+    for _ in range(20):
+        limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 0.5  # floor
+    assert limiter.limit == 2  # min_concurrency
+
+
+def test_slow_calls_shrink_concurrency():
+    limiter = AdaptiveLimiter(tps=0, max_concurrency=8)
+    limiter.on_success(0.1)
+    limit = limiter.limit
+    limiter.on_success(5.0)
+    assert limiter.limit == pytest.approx(limit * 0.9)
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = AdaptiveLimiter(tps=0, max_concurrency=4)
+    limiter.on_throttle(retry_after=0.3)
+    t0 = time.monotonic()
+    with limiter.slot():
+        pass
+    assert time.monotonic() - t0 >= 0.25
+
+
+def test_concurrency_limit():
+    limiter = AdaptiveLimiter(tps=0, max_concurrency=2, min_concurrency=2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert limiter.stats["calls"] == 8
+
+
+def test_token_bucket_paces_calls():
+    limiter = AdaptiveLimiter(tps=20, max_concurrency=16)
+    t0 = time.monotonic()
+    for _ in range(6):
+        with limiter.slot():
+            pass
+    # One token up front, then one every 1/20 s
+    assert time.monotonic() - t0 >= 5 / 20 * 0.9
+
+
+@pytest.mark.parametrize("headers, seconds", [
+    ({"Retry-After": "7"}, 7.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"x-ms-retry-after-ms": "250", "Retry-After": "9"}, 0.25),
+    ({"Retry-After": "soon"}, 1.0),
+    ({}, 1.0),
+    (None, 1.0),
+])
+def test_retry_after_seconds(headers, seconds):
+    assert retry_after_seconds(headers) == seconds
+
+
+def test_retry_after_http_date():
+    headers = {"Retry-After": formatdate(time.time() + 30, usegmt=True)}
+    assert 28 <= retry_after_seconds(headers) <= 30
+
+
+def test_process_share_lowers_the_running_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(tps=15))
+    monkeypatch.setattr(rate_limiter, "AZURE_TPS", 15.0)
+    rate_limiter.set_process_tps(5.0)
+    assert rate_limiter.get_azure_limiter().tps == 5.0
+    assert rate_limiter.get_azure_limiter().rate == 5.0
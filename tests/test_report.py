@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import zipfile
+
+import pytest
+
+from report import ReportWriter, SpooledReports, report_columns, report_format
+
+COLUMNS = ["File", "Status", "Reason", "ocr_ms", "ocr_bytes"]
+ROWS = [
+    {"File": "a.pdf", "Status": "SUCCESS", "ocr_ms": 12.5, "ocr_bytes": 2048},
+    {"File": "b.pdf", "Status": "FAILED", "Reason": "Bad\x07 total", "Extra": "x"},
+]
+
+
+def write(fmt):
+    out = io.BytesIO(b"prefix")
+    out.seek(0, io.SEEK_END)
+    with ReportWriter(out, fmt, COLUMNS) as report:
+        for row in ROWS:
+            report.append(row)
+    nbytes = report.close()
+    assert nbytes == len(out.getvalue()) - len(b"prefix")
+    assert report.rows == len(ROWS)
+    return out.getvalue()[len(b"prefix"):]
+
+
+def test_csv():
+    rows = list(csv.reader(io.StringIO(write("csv").decode("utf-8"))))
+    assert rows == [COLUMNS, ["a.pdf", "SUCCESS", "", "12.5", "2048"], ["b.pdf", "FAILED", "Bad\x07 total", "", ""]]
+
+
+def test_json_keeps_every_key():
+    assert json.loads(write("json")) == ROWS
+
+
+def test_xlsx():
+    openpyxl = pytest.importorskip("openpyxl")
+    sheet = openpyxl.load_workbook(io.BytesIO(write("xlsx"))).active
+    values = [list(row) for row in sheet.iter_rows(values_only=True)]
+    assert values[0] == COLUMNS
+    assert values[1] == ["a.pdf", "SUCCESS", None, 12.5, 2048]
+    assert values[2][2] == "Bad total"  # control characters are not valid in xlsx
+
+
+def test_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(write("parquet")))
+    assert table.column_names == COLUMNS
+    assert table.column("ocr_bytes").to_pylist() == [2048, None]
+    assert table.column("Reason").to_pylist() == [None, "Bad\x07 total"]
+
+
+def test_spooled_reports_into_zip():
+    buf = io.BytesIO()
+    with SpooledReports(["csv", "json"], COLUMNS) as reports, zipfile.ZipFile(buf, "w") as z:
+        for row in ROWS:
+            reports.append(row)
+        assert reports.write_zip(z, "Report") > 0
+    with zipfile.ZipFile(buf) as z:
+        assert sorted(z.namelist()) == ["Report.csv", "Report.json"]
+        assert json.loads(z.read("Report.json")) == ROWS
+
+
+def test_formats_and_columns():
+    assert report_format("out/Report.JSON") == "json"
+    with pytest.raises(ValueError):
+        report_format("report.txt")
+    with pytest.raises(ValueError):
+        ReportWriter(io.BytesIO(), "txt")
+    columns = report_columns(metrics=False, drop=("Checkpoint",))
+    assert "Checkpoint" not in columns and "ocr_ms" not in columns and "File" in columns
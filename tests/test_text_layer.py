@@ -0,0 +1,39 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+from pypdf import PdfReader, PdfWriter
+
+from synthetic import make_invoice_pdf
+from text_layer import scan_fields
+
+
+def pages_of(*parts) -> bytes:
+    """A PDF of the given (pdf_bytes, page index) pages."""
+    writer = PdfWriter()
+    for pdf, index in parts:
+        writer.add_page(PdfReader(io.BytesIO(pdf)).pages[index])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def test_last_page_replaces_totals_only():
+    first = make_invoice_pdf("INV-A", date(2025, 3, 1), "Buyer A", Decimal("100.00"), pages=2)
+    # The last page repeats a header (another invoice number and buyer) above the final subtotal
+    last = make_invoice_pdf("INV-B", date(2025, 4, 1), "Buyer B", Decimal("250.00"))
+    pdf = pages_of((first, 0), (first, 1), (last, 0))
+
+    found, pages_read = scan_fields(pdf, suppliers=[])
+    assert found["invoice_number"] == "INV-A"
+    assert found["invoice_date"] == "2025-03-01"
+    assert found["buyer_name"].strip() == "Buyer A"
+    assert found["total_ht_str"] == "250.00"
+    assert pages_read == 2
+
+
+def test_middle_pages_only_read_for_missing_fields():
+    pdf = make_invoice_pdf("INV-C", date(2025, 5, 1), "Buyer C", Decimal("80.00"), pages=5)
+    found, pages_read = scan_fields(pdf, suppliers=[])
+    assert found["total_ht_str"] == "80.00"
+    assert pages_read == 2
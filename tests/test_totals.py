@@ -0,0 +1,75 @@
+import random
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from facturx_xml import build_facturx_minimum_xml, build_facturx_minimum_xml_many
+from totals import compute_totals, compute_totals_text
+
+
+def amounts(rnd: random.Random, n: int) -> list:
+    """Random HT amounts, with half-cent ties, negatives, zeros and large values mixed in."""
+    values = []
+    for _ in range(n):
+        kind = rnd.random()
+        if kind < 0.2:
+            values.append(rnd.randint(-500, 500) / 100 + 0.005)
+        elif kind < 0.25:
+            values.append(rnd.choice([0.0, -0.0, 0.004, -0.004, 1e8 + 0.005]))
+        else:
+            values.append(round(rnd.uniform(-1e5, 1e6), rnd.randint(0, 4)))
+    return values
+
+
+RATES = [0.0, 2.1, 5.5, 10.0, 20.0, 8.5, 19.6, 12.345, 7.125]
+
+
+def expected(ht, rate, rounding="half_even"):
+    return tuple(str(v) for v in compute_totals(ht, rate, rounding))
+
+
+@pytest.mark.parametrize("rounding", ["half_even", "half_up"])
+def test_float_columns_match_compute_totals(rounding):
+    rnd = random.Random(1)
+    ht = amounts(rnd, 20000)
+    rate = [rnd.choice(RATES) for _ in ht]
+    assert compute_totals_text(ht, rate, rounding) == [expected(h, r, rounding) for h, r in zip(ht, rate)]
+
+
+def test_text_and_decimal_columns_match_compute_totals():
+    rnd = random.Random(2)
+    ht = [repr(v) for v in amounts(rnd, 5000)] + ["1.03499999999999999999", "0.005", "-0.005"]
+    rate = [str(rnd.choice(RATES)) for _ in ht]
+    assert compute_totals_text(ht, rate) == [expected(Decimal(h), Decimal(r)) for h, r in zip(ht, rate)]
+    decimals = [Decimal(h) for h in ht]
+    assert compute_totals_text(decimals, rate) == [expected(h, Decimal(r)) for h, r in zip(decimals, rate)]
+
+
+def test_decimal_comma():
+    assert compute_totals_text(["100,50"], ["20"]) == [("100.50", "20.10", "120.60")]
+
+
+def test_many_from_dataframe_matches_single_builds():
+    rnd = random.Random(3)
+    ht = amounts(rnd, 300)
+    frame = pd.DataFrame({
+        "invoice_number": [f"INV-{i}" for i in range(len(ht))],
+        "invoice_date": [date(2025, 1, 1 + i % 28) for i in range(len(ht))],
+        "seller_name": "ACME",
+        "seller_siret": "80258593400018",
+        "seller_vat": "FR34802585934",
+        "buyer_name": "Dupont",
+        "total_ht": ht,
+        "vat_rate_percent": [rnd.choice(RATES) for _ in ht],
+        "buyer_siret": [None if i % 2 else "12345678900011" for i in range(len(ht))],
+    })
+    singles = [
+        build_facturx_minimum_xml(
+            **{k: v for k, v in row.items() if k not in ("buyer_siret",)},
+            buyer_siret="" if pd.isna(row["buyer_siret"]) else row["buyer_siret"],
+        )
+        for row in frame.to_dict("records")
+    ]
+    assert list(build_facturx_minimum_xml_many(frame)) == singles
@@ -0,0 +1,53 @@
+import shutil
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from facturx_xml import build_facturx_minimum_xml
+from validator import FacturXValidationError, check_facturx_minimum, validate_facturx_minimum
+
+MODES = [
+    "inprocess",
+    pytest.param(
+        "cli", marks=pytest.mark.skipif(shutil.which("facturx-xmlcheck") is None, reason="facturx-xmlcheck missing"),
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def good():
+    return build_facturx_minimum_xml(
+        invoice_number="INV-1", invoice_date=date(2025, 1, 1), seller_name="ACME", seller_siret="80258593400018",
+        seller_vat="FR34802585934", buyer_name="Dupont", total_ht=Decimal("100.00"), vat_rate_percent=Decimal("20"),
+    )
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_valid_xml_passes(good, mode):
+    validate_facturx_minimum(good, mode=mode)
+    assert check_facturx_minimum(good) == []
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_schema_error_lists_the_issue(good, mode):
+    bad = good.replace(b"<ram:TypeCode>380</ram:TypeCode>", b"<ram:Bogus>380</ram:Bogus>")
+    with pytest.raises(FacturXValidationError) as info:
+        validate_facturx_minimum(bad, mode=mode)
+    issues = info.value.errors
+    assert len(issues) == 1
+    assert "Bogus" in issues[0].message
+    assert issues[0].line == bad[: bad.index(b"<ram:Bogus>")].count(b"\n") + 1
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_malformed_xml(mode):
+    with pytest.raises(FacturXValidationError) as info:
+        validate_facturx_minimum(b"<a><b></a>", mode=mode)
+    assert info.value.errors
+    assert "mismatch" in info.value.errors[0].message
+
+
+def test_unknown_mode(good):
+    with pytest.raises(ValueError):
+        validate_facturx_minimum(good, mode="other")
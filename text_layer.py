@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from document import PdfData, PdfDocument, pdf_reader, drop_images
+
+# multiprocessing is only imported when a pool is started
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# Text-layer field search, the free tier before Azure.
+# Pages are parsed lazily: the first page (header fields) and the last page
+# (totals) first, then the pages in between only while a field is missing.
+# Patterns are compiled once. Supplier pattern sets from TEXT_PATTERNS_PATH
+# are tried before the defaults when their `match` pattern is on page one:
+#   [{"supplier": "ACME", "match": "ACME Fournitures SAS",
+#     "fields": {"invoice_number": ["Facture\\s*n°\\s*(?P<value>\\S+)"]}}]
+# A pattern's value is its `value` group, else its last group. Values are
+# returned as found; pdf_autofill.extract_fields_text normalises them.
+
+TEXT_PATTERNS_PATH = os.getenv("TEXT_PATTERNS_PATH", "text_patterns.json")
+TEXT_PROCESSES = int(os.getenv("TEXT_PROCESSES", str(os.cpu_count() or 1)))
+# Smaller batches are parsed in this process: starting workers costs more
+TEXT_POOL_MIN_DOCS = int(os.getenv("TEXT_POOL_MIN_DOCS", "8"))
+
+DEFAULT_PATTERNS = {
+    "invoice_number": [r"Invoice\s*(?:No|Number|ID)\s*[:\-]?\s*(?P<value>[A-Z0-9\-\/]+)"],
+    "invoice_date": [r"Invoice\s*Date\s*[:\-]?\s*(?P<value>\d{4}[-/]\d{2}[-/]\d{2})"],
+    "buyer_name": [r"(?:Customer|Buyer)\s*[:\-]?\s*(?P<value>.+)"],
+    "total_ht_str": [r"(?:Subtotal|Total\s*HT)\s*[:\-]?\s*(?P<value>[0-9]+[.,][0-9]{2})"],
+}
+# Multi-page invoices repeat running subtotals: the last page has the real one
+LAST_PAGE_FIELDS = ("total_ht_str", "total_ttc_str")
+
+
+class PatternSet:
+    """Compiled patterns per field (tried in order), for one supplier or the defaults."""
+
+    def __init__(self, fields: dict, supplier: str = "default", match: str = None):
+        self.supplier = supplier
+        self.match = re.compile(match, re.I) if match else None
+        self.fields = {
+            name: [re.compile(p, re.I) for p in ([patterns] if isinstance(patterns, str) else patterns)]
+            for name, patterns in fields.items()
+        }
+
+    def applies_to(self, first_page: str) -> bool:
+        return self.match is None or self.match.search(first_page) is not None
+
+    def search(self, field: str, text: str) -> Optional[str]:
+        for pattern in self.fields.get(field, ()):
+            m = pattern.search(text)
+            if m:
+                return m.group("value") if "value" in pattern.groupindex else m.group(pattern.groups)
+        return None
+
+
+DEFAULTS = PatternSet(DEFAULT_PATTERNS)
+
+
+def load_supplier_patterns(path: str = TEXT_PATTERNS_PATH) -> list:
+    """PatternSets from a JSON file (see above); [] if there is none or it is invalid."""
+    if not path or not os.path.isfile(path):
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        return [PatternSet(e["fields"], e.get("supplier", "supplier"), e["match"]) for e in entries]
+    except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+        print(f"Text patterns: ignoring {path}: {e}")
+        return []
+
+
+_suppliers = None
+_suppliers_lock = threading.Lock()
+
+
+def get_supplier_patterns() -> list:
+    """Supplier PatternSets of TEXT_PATTERNS_PATH, loaded once per process."""
+    global _suppliers
+    if _suppliers is None:
+        with _suppliers_lock:
+            if _suppliers is None:
+                _suppliers = load_supplier_patterns()
+    return _suppliers
+
+
+@lru_cache(maxsize=None)
+def patterns_version() -> str:
+    """Hash of the supplier pattern file, read with it once per process (part of the cache key)."""
+    if not TEXT_PATTERNS_PATH or not os.path.isfile(TEXT_PATTERNS_PATH):
+        return "default"
+    with open(TEXT_PATTERNS_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def page_order(count: int) -> list:
+    """First page, last page, then the ones in between."""
+    if count < 2:
+        return list(range(count))
+    return [0, count - 1] + list(range(1, count - 1))
+
+
+def scan_fields(pdf: PdfData, suppliers=None):
+    """
+    Searches the text layer of `pdf` page by page (see page_order) and stops
+    as soon as every field of the applicable pattern sets is found.
+    Returns (raw values by field, pages read); {} for an unreadable PDF.
+    """
+    suppliers = get_supplier_patterns() if suppliers is None else suppliers
+    found, pages_read = {}, 0
+    try:
+        with pdf_reader(pdf) as reader:
+            count = len(reader.pages)
+            sets, fields = [DEFAULTS], tuple(DEFAULTS.fields)
+            for index in page_order(count):
+                text = reader.pages[index].extract_text() or ""
+                drop_images(reader)  # scans: one page image in memory at a time
+                pages_read += 1
+                if index == 0:
+                    sets = [s for s in suppliers if s.applies_to(text)] + [DEFAULTS]
+                    # Ordered (supplier fields first), so every run searches alike
+                    fields = tuple(dict.fromkeys(field for s in sets for field in s.fields))
+                on_last = index == count - 1 and count > 1
+                for field in fields:
+                    # A field keeps the first value found, except a total, which the last page replaces
+                    if field in found and not (on_last and field in LAST_PAGE_FIELDS):
+                        continue
+                    value = next((v for v in (s.search(field, text) for s in sets) if v is not None), None)
+                    if value is not None:
+                        found[field] = value
+                # The last page is always read (it may override a total)
+                if all(field in found for field in fields) and (count < 2 or pages_read >= 2):
+                    break
+    except Exception:
+        return {}, pages_read
+    return found, pages_read
+
+
+# --- WORKER PROCESSES: pypdf parsing is CPU-bound ---
+# spawn, not fork: the callers (job workers, CLI) run threads. Only used
+# from plain scripts, never from the Streamlit process (see jobs.py).
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_text_pool(processes: int = None) -> "ProcessPoolExecutor":
+    """Process-wide pool of `processes` (default TEXT_PROCESSES) workers, started on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, processes or TEXT_PROCESSES), mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def close_text_pool():
+    """Stops the pool (a broken one too: the next get_text_pool() starts a new one)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(close_text_pool)
+
+
+def _scan_timed(pdf):
+    t0 = time.perf_counter()
+    found, _ = scan_fields(pdf)
+    return found, time.perf_counter() - t0
+
+
+def scan_many(pdfs, processes: int = None):
+    """
+    scan_fields over `pdfs` ((key, pdf) pairs). With `processes` > 1
+    (default TEXT_PROCESSES) and at least TEXT_POOL_MIN_DOCS documents, they
+    are parsed by the worker pool: buffers are copied to the workers, a
+    file-backed PdfDocument goes as its path.
+    Yields (key, raw values, seconds) in completion order.
+    """
+    pdfs = list(pdfs)
+    processes = TEXT_PROCESSES if processes is None else processes
+    left = pdfs
+    if processes > 1 and len(pdfs) >= TEXT_POOL_MIN_DOCS:
+        from concurrent.futures import as_completed
+
+        pool = get_text_pool(processes)
+        futures = {
+            pool.submit(_scan_timed, pdf if isinstance(pdf, (bytes, PdfDocument)) else bytes(pdf)): (key, pdf)
+            for key, pdf in pdfs
+        }
+        left = []
+        for fut in as_completed(futures):
+            key, pdf = futures[fut]
+            try:
+                found, seconds = fut.result()
+            except Exception as e:
+                # A worker died (e.g. out of memory): what is left is parsed here
+                if not left:
+                    print(f"Text extraction worker failed, continuing in-process: {e}")
+                    close_text_pool()
+                left.append((key, pdf))
+                continue
+            yield key, found, seconds
+
+    for key, pdf in left:
+        found, seconds = _scan_timed(pdf)
+        yield key, found, seconds
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from typing import TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# HT / TVA / TTC arithmetic shared by the XML builder, single mode and bulk mode.
+# Scalar helpers use Decimal; the *_batch helpers work on whole columns as
+# int64 fixed-point arrays (cents for amounts, basis points for rates) and
+# reproduce Decimal.quantize(Decimal("0.01")) exactly.
+
+CENT = Decimal("0.01")
+DEFAULT_VAT_RATE = Decimal("20.00")
+
+_ROUNDING = {"half_even": ROUND_HALF_EVEN, "half_up": ROUND_HALF_UP}
+
+
+# --- SCALAR (Decimal) ---
+def compute_totals(total_ht, vat_rate_percent, rounding: str = "half_even") -> Tuple[Decimal, Decimal, Decimal]:
+    """
+    Returns (ht, tax, ttc) quantized to cents, exactly as written in the XML.
+    """
+    mode = _ROUNDING[rounding]
+    ht = Decimal(total_ht).quantize(CENT, rounding=mode)
+    rate = Decimal(vat_rate_percent).quantize(CENT, rounding=mode)
+    tax = (ht * rate / Decimal("100")).quantize(CENT, rounding=mode)
+    ttc = (ht + tax).quantize(CENT, rounding=mode)
+    return ht, tax, ttc
+
+
+def infer_vat_rate(total_ht, total_ttc, default=DEFAULT_VAT_RATE) -> Decimal:
+    """
+    VAT rate implied by HT/TTC (same rule as the single-invoice studio),
+    or `default` when it cannot be inferred.
+    """
+    ht = Decimal(total_ht)
+    ttc = Decimal(total_ttc)
+    if ht > 0 and ttc > ht:
+        return ((ttc - ht) / ht * 100).quantize(CENT)
+    return Decimal(default)
+
+
+# --- BATCH (NumPy, integer fixed-point; numpy is imported on first use) ---
+def _div_round(num: np.ndarray, den, rounding: str) -> np.ndarray:
+    """Integer num/den rounded to nearest (ties per `rounding`), den > 0."""
+    import numpy as np
+
+    sign = np.where(num < 0, -1, 1)
+    q, r = np.divmod(np.abs(num), den)
+    twice = 2 * r
+    if rounding == "half_up":
+        up = twice >= den
+    else:
+        up = (twice > den) | ((twice == den) & (q % 2 == 1))
+    return sign * (q + up)
+
+
+def to_fixed(values, rounding: str = "half_even") -> np.ndarray:
+    """
+    Converts a column of amounts/rates (str with '.' or ',', float, int,
+    Decimal) to int64 hundredths, rounded like Decimal.quantize(CENT).
+    Integer columns are taken as whole units.
+    Floats are read as their shortest repr (what the spreadsheet showed);
+    only values within float noise of a half-cent take the Decimal path.
+    """
+    import numpy as np
+
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.int64) * 100
+    x = _as_float(arr)
+    fixed = np.round(x * 100).astype(np.int64)  # np.round is half-even
+    mode = _ROUNDING[rounding]
+    for i in np.flatnonzero(_near_half_cent(x)):
+        fixed[i] = int(Decimal(repr(float(x[i]))).quantize(CENT, rounding=mode) * 100)
+    return fixed
+
+
+def _as_float(arr: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    if arr.dtype.kind in "US" or arr.dtype == object:
+        arr = np.char.replace(arr.astype(str), ",", ".")
+    x = arr.astype(np.float64)
+    if np.isnan(x).any():
+        raise ValueError("Missing amount in column")
+    return x
+
+
+def _near_half_cent(x: np.ndarray) -> np.ndarray:
+    """Mask of the values within float noise of a half-cent."""
+    import numpy as np
+
+    scaled = x * 100
+    frac = np.abs(scaled - np.trunc(scaled))
+    return np.abs(frac - 0.5) < 1e-6
+
+
+def compute_totals_batch(ht_cents, rate_bp, rounding: str = "half_even") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized compute_totals. Inputs are int64 arrays from to_fixed()
+    (HT in cents, VAT rate in hundredths of a percent).
+    Returns (ht_cents, tax_cents, ttc_cents) as int64 arrays.
+    Exact while |ht_cents * rate_bp| < 2**63 (e.g. HT up to 10^12 EUR at 100 %).
+    """
+    import numpy as np
+
+    ht = np.asarray(ht_cents, dtype=np.int64)
+    rate = np.asarray(rate_bp, dtype=np.int64)
+    tax = _div_round(ht * rate, 10000, rounding)
+    return ht, tax, ht + tax
+
+
+def fixed_to_str(values) -> list:
+    """
+    int64 hundredths -> ['123.45', '-0.50', ...], the same text as
+    str(Decimal), except that Decimal's '-0.00' comes out as '0.00'.
+    """
+    import numpy as np
+
+    v = np.asarray(values, dtype=np.int64)
+    whole, part = np.divmod(np.abs(v), 100)
+    return [
+        f"-{w}.{p:02d}" if negative else f"{w}.{p:02d}"
+        for negative, w, p in zip((v < 0).tolist(), whole.tolist(), part.tolist())
+    ]
+
+
+# Beyond this many cents, float64 noise can hide a half-cent tie
+_EXACT_CENTS = 10**9
+
+
+def compute_totals_text(total_ht, vat_rate_percent, rounding: str = "half_even") -> list:
+    """
+    compute_totals over whole columns: [(ht, tax, ttc), ...] as the XML
+    text, identical to str() of compute_totals' Decimals row by row.
+    Rows where fixed-point and Decimal could differ (values on a half-cent,
+    zero totals that Decimal may sign, very large amounts) are left to
+    compute_totals. Raises ValueError/TypeError on unreadable amounts.
+    """
+    import numpy as np
+
+    ht_in, rate_in = np.asarray(total_ht), np.asarray(vat_rate_percent)
+    rate_bp = to_fixed(rate_in, rounding)
+    ht, tax, ttc = compute_totals_batch(to_fixed(ht_in, rounding), rate_bp, rounding)
+    rows = list(zip(fixed_to_str(ht), fixed_to_str(tax), fixed_to_str(ttc)))
+
+    redo = (ht == 0) | (tax == 0) | (ttc == 0) | (np.abs(ht) >= _EXACT_CENTS) | (np.abs(rate_bp) >= _EXACT_CENTS)
+    for column in (ht_in, rate_in):
+        if column.dtype.kind not in "iu":
+            redo |= _near_half_cent(_as_float(column))
+    ht_values, rate_values = ht_in.tolist(), rate_in.tolist()
+    for i in np.flatnonzero(redo).tolist():
+        row = compute_totals(_decimal(ht_values[i]), _decimal(rate_values[i]), rounding)
+        rows[i] = tuple(str(v) for v in row)
+    return rows
+
+
+def _decimal(value):
+    # What to_fixed accepts: a decimal comma too
+    return Decimal(value.replace(",", ".")) if isinstance(value, str) else Decimal(value)
@@ -1,12 +1,98 @@
+import re
 import tempfile
 import subprocess
+import threading
+import importlib.resources
 from pathlib import Path
+from typing import List, NamedTuple
 
+from lxml import etree
 
-def validate_facturx_minimum(xml_bytes: bytes) -> None:
+
+# --- SCHEMA CACHE ---
+# The MINIMUM XSD ships inside the factur-x package. It is compiled once per
+# process and shared by every session/thread; the lock also serialises
+# validate() calls because XMLSchema keeps its error_log on the instance.
+_MINIMUM_XSD = "xsd_and_schematron/facturx-minimum/Factur-X_MINIMUM.xsd"
+_schema = None
+_schema_lock = threading.Lock()
+
+
+class ValidationIssue(NamedTuple):
+    line: int
+    column: int
+    message: str
+
+
+class FacturXValidationError(Exception):
+    """
+    Raised when a Factur-X XML fails validation.
+    `errors` holds the structured ValidationIssue list.
+    """
+
+    def __init__(self, errors: List[ValidationIssue]):
+        self.errors = errors
+        msg = "\n".join(f"line {e.line}, col {e.column}: {e.message}" for e in errors)
+        super().__init__(msg or "Factur-X XML failed XSD validation.")
+
+
+def _get_minimum_schema() -> etree.XMLSchema:
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                xsd_path = importlib.resources.files("facturx").joinpath(_MINIMUM_XSD)
+                _schema = etree.XMLSchema(file=str(xsd_path))
+    return _schema
+
+
+def check_facturx_minimum(xml_bytes: bytes) -> List[ValidationIssue]:
+    """
+    Validate Factur-X MINIMUM XML in-process against the cached XSD.
+    Returns the list of issues (empty when valid), never raises on bad XML.
+    """
+    schema = _get_minimum_schema()
+
+    # Parsers are not thread-safe, so each call gets its own (cheap).
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    try:
+        doc = etree.fromstring(bytes(xml_bytes), parser)
+    except etree.XMLSyntaxError as e:
+        line, column = e.position
+        return [ValidationIssue(line, column, e.msg)]
+
+    with _schema_lock:
+        if schema.validate(doc):
+            return []
+        return [
+            ValidationIssue(err.line, err.column, err.message)
+            for err in schema.error_log
+        ]
+
+
+def validate_facturx_minimum(xml_bytes: bytes, mode: str = "inprocess") -> None:
+    """
+    Validate Factur-X MINIMUM XML.
+    mode="inprocess" (default) uses the cached lxml schema,
+    mode="cli" shells out to the official facturx-xmlcheck tool.
+    Raises FacturXValidationError (with its issues) if validation fails.
+    """
+    if mode == "cli":
+        _validate_with_cli(xml_bytes)
+        return
+    if mode != "inprocess":
+        raise ValueError(f"Unknown validation mode: {mode}")
+
+    errors = check_facturx_minimum(xml_bytes)
+    if errors:
+        raise FacturXValidationError(errors)
+
+
+# --- CLI FALLBACK ---
+def _validate_with_cli(xml_bytes: bytes) -> None:
     """
     Validate Factur-X MINIMUM XML using the official factur-x CLI tool.
-    Raises Exception if validation fails.
+    Raises FacturXValidationError if validation fails.
     """
 
     with tempfile.TemporaryDirectory() as tmp:
@@ -30,8 +116,20 @@ def validate_facturx_minimum(xml_bytes: bytes) -> None:
             )
 
         if result.returncode != 0:
-            error_msg = (result.stdout or "") + "\n" + (result.stderr or "")
-            raise Exception(
-                error_msg.strip()
-                or "Factur-X XML failed XSD validation."
-            )
+            raise FacturXValidationError(_cli_issues((result.stdout or "") + "\n" + (result.stderr or "")))
+
+
+_CLI_XSD_ERROR = re.compile(r"\[ERROR\] XSD Error: (?P<message>.*), line (?P<line>\d+)$")
+_CLI_ERROR = re.compile(r"\[ERROR\] (?P<message>.*)$")
+
+
+def _cli_issues(output: str) -> List[ValidationIssue]:
+    """ValidationIssues from facturx-xmlcheck's log: its XSD errors, else every error line."""
+    lines = output.splitlines()
+    issues = [
+        ValidationIssue(int(m["line"]), 0, m["message"])
+        for m in map(_CLI_XSD_ERROR.search, lines) if m
+    ]
+    if not issues:
+        issues = [ValidationIssue(0, 0, m["message"]) for m in map(_CLI_ERROR.search, lines) if m]
+    return issues or ([ValidationIssue(0, 0, output.strip())] if output.strip() else [])